@@ -0,0 +1,214 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+# Segment file layout, all little-endian:
+# - header: magic, story count, dictionary length, index offset
+# - the zlib preset dictionary shared by every record, itself compressed
+# - one zlib-compressed JSON record per story
+# - the index: (story_id, offset, length) per story, sorted by story_id
+MAGIC = b'STORYSG1'
+HEADER = struct.Struct('<8sIIQ')
+INDEX_ENTRY = struct.Struct('<qQI')
+SEGMENT_SUFFIX = '.seg'
+
+# Stories are compressed one at a time so any of them can be read alone; a dictionary built
+# from a sample of the segment gives the compressor the shared vocabulary it would otherwise lack
+DICTIONARY_SAMPLE = 64
+DICTIONARY_BYTES = 32 * 1024
+
+
+def _dictionary(records):
+    sample = b"".join(records[:DICTIONARY_SAMPLE])
+    # zlib looks furthest back last, so the end of the sample is the most useful part
+    return sample[-DICTIONARY_BYTES:]
+
+
+def write_segment(directory, stories):
+    """
+    Writes stories to a new immutable segment file. The file is written under a temporary
+    name, synced and then renamed, so readers never see a partial segment.
+
+    Parameters:
+    - directory (str): Directory of the cold store.
+    - stories (list[dict]): Stories with a story_id, in any order.
+
+    Returns:
+    - str: The segment's file name.
+    """
+    stories = sorted(stories, key=lambda story: story['story_id'])
+    records = [json.dumps(story, ensure_ascii=False).encode('utf-8') for story in stories]
+    zdict = _dictionary(records)
+    name = f"{stories[0]['story_id']:010d}-{stories[-1]['story_id']:010d}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+    path = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        packed_zdict = zlib.compress(zdict, 9)
+        f.write(HEADER.pack(MAGIC, 0, 0, 0))
+        f.write(packed_zdict)
+        index = []
+        # Priming a compressor with the dictionary costs more than copying a primed one
+        primed = zlib.compressobj(level=6, zdict=zdict)
+        for story, record in zip(stories, records):
+            compressor = primed.copy()
+            data = compressor.compress(record) + compressor.flush()
+            index.append((story['story_id'], f.tell(), len(data)))
+            f.write(data)
+        index_offset = f.tell()
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(index), len(packed_zdict), index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return name
+
+
+class Segment:
+    """
+    A read-only, memory-mapped segment file. Lookups binary-search the index in place, so
+    opening a segment reads nothing but the header and dictionary.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, zdict_length, self.index_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a story segment")
+        self.zdict = zlib.decompress(self.map[HEADER.size:HEADER.size + zdict_length])
+        self.ids = _IndexIds(self)
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.map, self.index_offset + i * INDEX_ENTRY.size)
+
+    def _record(self, offset, length):
+        return json.loads(zlib.decompressobj(zdict=self.zdict).decompress(self.map[offset:offset + length]))
+
+    def get(self, story_id):
+        """
+        Returns:
+        - dict: The archived story, or None if it is not in this segment.
+        """
+        i = bisect.bisect_left(self.ids, story_id)
+        if i < self.count:
+            found_id, offset, length = self._entry(i)
+            if found_id == story_id:
+                return self._record(offset, length)
+        return None
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._record(*self._entry(i)[1:])
+
+    def close(self):
+        self.map.close()
+
+
+class _IndexIds:
+    """
+    The segment's story ids as a sequence for bisect, read straight from the mapped index.
+    """
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.count
+
+    def __getitem__(self, i):
+        return self.segment._entry(i)[0]
+
+
+class ColdStore:
+    """
+    A directory of segment files holding archived stories. The hot database keeps a stub row
+    per archived story naming its segment, so a read opens at most that one file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def segment(self, name):
+        """
+        Returns the named segment, mapping it on first use. Segments written by another
+        process are picked up the same way.
+        """
+        with self.lock:
+            segment = self.segments.get(name)
+            if segment is None:
+                segment = self.segments[name] = Segment(os.path.join(self.directory, name))
+            return segment
+
+    def get(self, name, story_id):
+        """
+        Returns:
+        - dict: The archived story, or None if it cannot be read.
+        """
+        try:
+            story = self.segment(name).get(story_id)
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            logging.error(f"Error reading story {story_id} from archive segment {name}: {e}")
+            return None
+        if story is None:
+            logging.error(f"Story {story_id} is missing from archive segment {name}")
+        return story
+
+    def write(self, stories):
+        """
+        Archives stories into a new segment.
+
+        Returns:
+        - str: The segment's name.
+        """
+        return write_segment(self.directory, stories)
+
+    def remove(self, name):
+        """
+        Deletes a segment file. Readers that already mapped it keep their mapping until they close it.
+        """
+        with self.lock:
+            segment = self.segments.pop(name, None)
+        if segment is not None:
+            segment.close()
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def names(self):
+        """
+        Returns:
+        - list[str]: Every segment on disk, oldest stories first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Number of segments, their total size in bytes and how many are mapped.
+        """
+        names = self.names()
+        with self.lock:
+            mapped = len(self.segments)
+        return {'segments': len(names), 'mapped': mapped,
+                'bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in names)}
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments = {}
@@ -1,23 +1,131 @@
+import argparse
+import hashlib
+import os
 import sqlite3
 import logging
+import re
+import threading
+from story_archive import PartialImport, bulk_insert
+from story_cache import StoryCache
+from cold_storage import ColdStore
+from migrations import migrate, rebuild_story_stats
+
+from storybook.repository import STORY_DATA_COLUMNS, SUMMARY_ORDERS, StoryDataRepository
+from storybook.storage import SQLiteEngine, create_engine
+from storybook.tracing import current_span, traced
+
+# Matches a title in the format "**Title: XYZ**" or "Title: XYZ"
+TITLE_PATTERN = re.compile(r"(?:\*\*Title: (.*?)\*\*|Title: (.*?)(?=\n|$))")
+
+# Columns story_stats can be grouped by
+STATS_GROUPS = ('genre', 'age', 'day')
+
+
+def extract_title(content):
+    """
+    Extracts the title from the content if present, otherwise returns 'Untitled Story'.
+
+    Parameters:
+    - content (str): The story content.
+
+    Returns:
+    - str: The extracted title or 'Untitled Story'.
+    """
+    if content:
+        match = TITLE_PATTERN.search(content)
+        if match:
+            # Return the first matching group that's not None
+            title = (match.group(1) or match.group(2) or '').strip()
+            if title:
+                return title
+    return "Untitled Story"
+
+
+def count_words(content):
+    """
+    Counts the whitespace-separated words in the content.
+    """
+    return len(content.split()) if content else 0
+
+
+def content_hash(content):
+    """
+    The key saved stories are deduplicated by: the hex SHA-256 digest of the content.
+    """
+    return hashlib.sha256(str(content).encode('utf-8')).hexdigest() if content is not None else None
 
 
 class StoryDatabase:
-    def __init__(self, db_path='story_data.db'):
+    def __init__(self, db_path=None, cache_entries=1024, cache_bytes=32 * 1024 * 1024, pool_size=4,
+                 archive_dir=None):
         """
-        Initializes the database connection and creates the story table if it does not exist.
+        Initializes the database connections and creates the story tables if they do not exist.
+        Stories and starter pages are read and written through storybook.repository.StoryDataRepository,
+        so they can live in any database storybook.storage supports. On SQLite, writes go through one
+        connection, one at a time, and reads use a pool of connections (see storybook.storage.SQLiteEngine).
+
+        Parameters:
+        - db_path (str, optional): Path of the SQLite database file, or a database URL.
+          Defaults to STORAGE_URL, else story_data.db.
+        - cache_entries (int): Maximum number of cached lookups (0 disables the cache).
+        - cache_bytes (int): Approximate memory budget of the cache.
+        - pool_size (int): Maximum number of reader (or pooled) connections.
+        - archive_dir (str, optional): Directory of the cold store that archive_stories moves old
+          stories to. Defaults to STORY_ARCHIVE_DIR, else <db name>_archive beside a SQLite file;
+          an in-memory database or a database URL has none unless given.
         """
+        db_path = db_path or os.getenv("STORAGE_URL") or 'story_data.db'
         self.db_path = db_path
+        # The maintenance jobs (archive, stats, import, dedup, vacuum) work on SQLite files only
+        self.sqlite = '://' not in db_path
+        archive_dir = archive_dir or os.getenv("STORY_ARCHIVE_DIR")
+        if not archive_dir and self.sqlite and db_path != ':memory:':
+            archive_dir = f"{os.path.splitext(db_path)[0]}_archive"
+        self.cold = ColdStore(archive_dir) if archive_dir else None
+        # Read-through cache for story lookups. Single stories are keyed by story_id and
+        # invalidated when that story changes; other results are keyed by self.version,
+        # which every write bumps, so a list cached before a write is never served after it.
+        self.cache = StoryCache(max_entries=cache_entries, max_bytes=cache_bytes)
+        self.version = 0
+        self.version_lock = threading.Lock()
+        self.data_version = None
+        self.engine = create_engine(db_path, pool_size=pool_size)
+        self.errors = self.engine.errors
         try:
-            self.sqlconn = sqlite3.connect(db_path, check_same_thread=False)
-            self.create_table()
-        except sqlite3.Error as e:
+            if self.sqlite:
+                self.create_table()
+            self.repository = StoryDataRepository(self.engine, migrated=self.sqlite)
+        except self.errors as e:
             logging.error(f"Error connecting to database at {db_path}: {e}")
             raise
 
+    @property
+    def sqlconn(self):
+        """
+        The SQLite writer connection. Assigning a connection makes it the only one used, for reads too.
+        """
+        return self.engine.writer
+
+    @sqlconn.setter
+    def sqlconn(self, conn):
+        self.engine = SQLiteEngine.from_connection(conn)
+        self.errors = self.engine.errors
+        self.sqlite = True
+        self.repository = StoryDataRepository(self.engine, migrated=True)
+
+    def _sqlite_only(self, job):
+        """
+        Logs an error and returns False if the database is not SQLite.
+        """
+        if not self.sqlite:
+            logging.error(f"{job} needs a SQLite database; {self.engine.dialect} is not supported.")
+        return self.sqlite
+
     def create_table(self):
         """
-        Creates the story_data table and necessary indexes if they do not already exist.
+        Creates the story_data table if it does not already exist and applies any pending
+        schema migrations (indexes, added columns and the other tables; see migrations.py).
+        SQLite only: elsewhere StoryDataRepository creates the tables at the current schema.
         """
         try:
             query = '''
@@ -27,17 +135,142 @@ class StoryDatabase:
                 age INTEGER NOT NULL,
                 choice_count INTEGER NOT NULL,
                 segment_count INTEGER NOT NULL,
-                content TEXT NOT NULL
+                content TEXT NOT NULL,
+                title TEXT,
+                word_count INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )'''
-            self.sqlconn.execute(query)
-            self.sqlconn.execute("CREATE INDEX IF NOT EXISTS idx_genre ON story_data (genre)")
-            self.sqlconn.execute("CREATE INDEX IF NOT EXISTS idx_age ON story_data (age)")
-            self.sqlconn.commit()
+            with self.engine.write(transaction=False) as conn:
+                conn.execute(query)
+                conn.commit()
+                migrate(conn)
         except sqlite3.Error as e:
             logging.error(f"Error creating table: {e}")
             raise
 
-    def save_story(self, genre, age, choice_count, segment_count, content):
+    def _invalidate(self, story_id=None, all_stories=False):
+        """
+        Bumps the version and drops cached results affected by a committed write.
+
+        Parameters:
+        - story_id (int, optional): The story that changed or was created, if a single story did.
+        - all_stories (bool): Drop every cached story, for writes that touch many rows.
+        """
+        with self.version_lock:
+            self.version += 1
+        if all_stories:
+            self.cache.clear()
+            return
+        if story_id is not None:
+            self.cache.discard(('story', story_id))
+        self.cache.discard_where(lambda key: key[0] != 'story')
+
+    def _check_external_writes(self):
+        """
+        Clears the cache if another connection (a CLI job or second process) committed a write.
+        On SQLite, PRAGMA data_version only changes for commits made through other connections;
+        elsewhere the story_data version row is compared, which this process's writes bump too.
+        """
+        if self.sqlite:
+            # Read outside the write lock: a PRAGMA neither starts nor ends a transaction
+            data_version = self.sqlconn.execute("PRAGMA data_version").fetchone()[0]
+        else:
+            data_version = self.repository.table_version()[0]
+        if data_version != self.data_version:
+            if self.data_version is not None:
+                self._invalidate(all_stories=True)
+            self.data_version = data_version
+
+    def _read_through(self, key, load):
+        """
+        Returns a cached result, or loads it and caches it if no write happened in the meantime.
+        Cached results are shared, so callers must treat them as read-only.
+        """
+        self._check_external_writes()
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+        version = self.version
+        value = load()
+        if version == self.version:
+            self.cache.put(key, value)
+        return value
+
+    def _stories(self, rows):
+        """
+        Turns StoryDataRepository rows into stories, reading the content of archived ones from the cold store.
+        """
+        for story in rows:
+            segment = story.pop('archive_segment', None)
+            if segment:
+                archived = self.cold.get(segment, story['story_id']) if self.cold else None
+                story['content'] = archived['content'] if archived else ''
+        return rows
+
+    def table_version(self):
+        """
+        Returns the persistent write counter of story_data, maintained by triggers on SQLite.
+
+        Returns:
+        - tuple: (version, updated_at), or (0, None) if it cannot be read.
+        """
+        try:
+            return self.repository.table_version()
+        except self.errors as e:
+            logging.error(f"Error reading table version: {e}")
+            return (0, None)
+
+    def cache_stats(self):
+        """
+        Returns:
+        - dict: Cache hits, misses, hit rate, evictions, size and the current data version.
+        """
+        stats = self.cache.stats()
+        stats['version'] = self.version
+        return stats
+
+    def backfill_metadata(self, batch_size=500):
+        """
+        Fills in title, word_count and created_at for stories saved before those columns existed.
+        Works in batches so it can run against a large live database.
+
+        Parameters:
+        - batch_size (int): Number of stories updated per transaction.
+
+        Returns:
+        - int: Number of stories updated.
+        """
+        updated = 0
+        if not self._sqlite_only("Backfilling story metadata"):
+            return updated
+        try:
+            while True:
+                with self.engine.read() as conn:
+                    rows = conn.execute(
+                        "SELECT story_id, content FROM story_data WHERE title IS NULL OR word_count IS NULL LIMIT ?",
+                        (batch_size,),
+                    ).fetchall()
+                if not rows:
+                    break
+                with self.engine.write() as conn:
+                    conn.executemany(
+                        "UPDATE story_data SET title = ?, word_count = ? WHERE story_id = ?",
+                        [(extract_title(content), count_words(content), story_id) for story_id, content in rows],
+                    )
+                updated += len(rows)
+            with self.engine.write() as conn:
+                conn.execute("UPDATE story_data SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+            self._invalidate(all_stories=True)
+            if updated:
+                logging.info(f"Backfilled metadata for {updated} stories")
+            return updated
+        except sqlite3.Error as e:
+            logging.error(f"Error backfilling story metadata: {e}")
+            self._invalidate(all_stories=True)
+            return updated
+
+    @traced('db.save_story')
+    def save_story(self, genre, age, choice_count, segment_count, content, title=None):
         """
         Saves a story to the database.
 
@@ -47,24 +280,32 @@ class StoryDatabase:
         - choice_count (int): Number of choices per story segment.
         - segment_count (int): Total number of segments in the story.
         - content (str): Full text of the story.
+        - title (str, optional): Title of the story. Extracted from the content when not given.
+
+        Content that is already stored is not saved again: the existing story's id is returned
+        after a single indexed read, without taking the write lock.
 
         Returns:
-        - bool: True if the story was saved successfully, False otherwise.
+        - int: The story's id (the existing one for duplicate content), or False if it could not be saved.
         """
         if not all(isinstance(arg, (str, int)) for arg in [genre, age, choice_count, segment_count]):
             logging.error("Invalid input types for story fields.")
             return False
         try:
-            query = '''INSERT INTO story_data (genre, age, choice_count, segment_count, content)
-            VALUES (?, ?, ?, ?, ?)'''
-
-            self.sqlconn.execute(query, (genre, age, choice_count, segment_count, content))
-            self.sqlconn.commit()
-            return True
-        except sqlite3.Error as e:
+            story = {'genre': genre, 'age': age, 'choice_count': choice_count, 'segment_count': segment_count,
+                     'content': content, 'title': title or extract_title(content),
+                     'word_count': count_words(content), 'content_hash': content_hash(content)}
+            story_id, created = self.repository.save_story(story)
+            current_span().set(chars=len(content or ''), duplicate=not created)
+            if created:
+                # The new id may have been looked up, and its miss cached, before the story existed
+                self._invalidate(story_id=story_id)
+            return story_id
+        except self.errors as e:
             logging.error(f"Error saving story: {e}")
             return False
 
+    @traced('db.fetch_story')
     def fetch_story(self, story_id=None, genre=None, age=None):
         """
         Fetches stories based on optional filters.
@@ -78,42 +319,21 @@ class StoryDatabase:
         - list[dict]: A list of matching stories or an empty list if no matches found.
         """
         try:
-            query = "SELECT * FROM story_data WHERE 1=1"
-            parameters = [] # Lsit for query params
-
-            # append based on args
             if story_id is not None:
-                query += " AND story_id = ?"
-                parameters.append(story_id)
-            if genre is not None:
-                query += " AND genre = ?"
-                parameters.append(genre)
-            if age is not None:
-                query += " AND age = ?"
-                parameters.append(age)
-
-            cursor = self.sqlconn.execute(query, tuple(parameters))
-            results = cursor.fetchall()
-            
-            # Format the output for readability
-            stories = []
-            for row in results:
-                # New dictionary with story details for each row.
-                story = {
-                    'story_id': row[0],
-                    'genre': row[1],
-                    'age': row[2],
-                    'choice_count': row[3],
-                    'segment_count': row[4],
-                    'content': row[5]
-                }
-                stories.append(story)  # update the story dictionary or list
-
-            return stories # list of stories
-        except sqlite3.Error as e:
+                # Cache the story itself and apply the other filters here, so every lookup of a story shares one entry
+                stories = self._read_through(('story', story_id), lambda: self._query_stories(story_id=story_id))
+                return [story for story in stories
+                        if (genre is None or story['genre'] == genre) and (age is None or story['age'] == age)]
+            return self._read_through(('fetch', self.version, genre, age),
+                                      lambda: self._query_stories(genre=genre, age=age))
+        except self.errors as e:
             logging.error(f"Error fetching story: {e}")
             return []
-        
+
+    def _query_stories(self, story_id=None, genre=None, age=None):
+        return self._stories(self.repository.find_stories(story_id=story_id, genre=genre, age=age))
+
+    @traced('db.fetch_all_stories')
     def fetch_all_stories(self):
         """
         Fetches all stories from the database.
@@ -122,27 +342,154 @@ class StoryDatabase:
         - list[dict]: A list of all stories.
         """
         try:
-            query = "SELECT * FROM story_data"
-            cursor = self.sqlconn.execute(query)
-            results = cursor.fetchall()
-            return [
-                {
-                    'story_id': row[0],
-                    'genre': row[1],
-                    'age': row[2],
-                    'choice_count': row[3],
-                    'segment_count': row[4],
-                    'content': row[5],
-                }
-                for row in results
-            ]
-        except sqlite3.Error as e:
+            return self._read_through(('all', self.version), lambda: self._stories(self.repository.find_stories()))
+        except self.errors as e:
             logging.error(f"Error fetching all stories: {e}")
             return []
 
+    @traced('db.list_stories')
+    def list_stories(self, order_by='created_at', descending=True, limit=None, offset=0, genre=None, age=None):
+        """
+        Lists story metadata without the content, for list and sort views.
+        On SQLite it is served entirely from the summary and genre/age covering indexes, so the story bodies are never read.
+
+        Parameters:
+        - order_by (str): 'created_at' or 'title'.
+        - descending (bool): Newest/last first when True.
+        - limit (int, optional): Maximum number of stories to return.
+        - offset (int): Number of stories to skip.
+        - genre (str, optional): Genre filter.
+        - age (int, optional): Age filter.
+
+        Returns:
+        - list[dict]: Story metadata (everything except content).
+        """
+        if order_by not in SUMMARY_ORDERS:
+            logging.error(f"Invalid sort order: {order_by}")
+            return []
+        try:
+            arguments = (order_by, descending, limit, offset, genre, age)
+            return self._read_through(('list', self.version, arguments),
+                                      lambda: self.repository.list_summaries(*arguments))
+        except self.errors as e:
+            logging.error(f"Error listing stories: {e}")
+            return []
+
+    def iter_stories(self, batch_size=500):
+        """
+        Iterates over all stories without loading the whole table into memory.
+
+        Parameters:
+        - batch_size (int): Number of rows pulled from the cursor at a time.
+
+        Yields:
+        - dict: One story at a time, ordered by story_id.
+        """
+        try:
+            for story in self.repository.iter_stories(batch_size=batch_size):
+                yield from self._stories([story])
+        except self.errors as e:
+            logging.error(f"Error iterating stories: {e}")
+
+    @traced('db.import_stories')
+    def import_stories(self, stories, batch_size=5000, keep_ids=True):
+        """
+        Bulk-loads stories in batched transactions. The indexes stay in place, so queries
+        served while the import runs keep using them.
+
+        Parameters:
+        - stories (iterable[dict]): Stories in the same shape as fetch_all_stories returns.
+        - batch_size (int): Number of stories per transaction.
+        - keep_ids (bool): Keep each story's story_id. Stories whose id or content already exists are skipped.
+
+        Returns:
+        - int: Number of stories inserted. Batches before a database error stay committed and are counted.
+
+        Raises:
+        - story_archive.PartialImport: The input could not be read, e.g. a malformed line;
+          inserted counts the stories committed before it.
+        """
+        if not self._sqlite_only("Importing stories"):
+            return 0
+        stories = (dict(story, content_hash=content_hash(story.get('content'))) for story in stories)
+        try:
+            with self.engine.write(transaction=False) as conn:
+                try:
+                    return bulk_insert(conn, 'story_data', stories, batch_size=batch_size, keep_ids=keep_ids,
+                                       defer_indexes=False)
+                except PartialImport:
+                    conn.rollback()
+                    raise
+        except PartialImport as e:
+            logging.error(f"Error importing stories: {e}")
+            if not isinstance(e.error, sqlite3.Error):
+                raise
+            return e.inserted
+        finally:
+            # Earlier batches are committed even if a later one fails, and kept ids may fill cached misses
+            self._invalidate(all_stories=True)
+
+    @traced('db.deduplicate')
+    def deduplicate(self, batch_size=500):
+        """
+        One-off job for stories saved before content hashes existed: hashes them in batches and
+        deletes every story whose content is stored under a lower story_id, so the oldest copy
+        of each story is kept. Archived content is read from the cold store; stories whose
+        content cannot be read are left unhashed. Deleted archived copies stay in their segments
+        until compact_archive runs.
+
+        Parameters:
+        - batch_size (int): Stories hashed per transaction.
+
+        Returns:
+        - dict: Stories hashed and duplicates removed.
+        """
+        hashed = removed = 0
+        last_id = 0
+        if not self._sqlite_only("Deduplicating stories"):
+            return {'hashed': hashed, 'removed': removed}
+        try:
+            while True:
+                with self.engine.session() as session:
+                    rows = session.all(
+                        f"SELECT {', '.join(STORY_DATA_COLUMNS)} FROM story_data "
+                        "WHERE content_hash IS NULL AND story_id > :last_id ORDER BY story_id LIMIT :limit",
+                        {'last_id': last_id, 'limit': batch_size})
+                if not rows:
+                    break
+                last_id = rows[-1]['story_id']
+                archived = {row['story_id'] for row in rows if row['archive_segment']}
+                readable = [story for story in self._stories(rows)
+                            if story['content'] or story['story_id'] not in archived]
+                with self.engine.write() as conn:
+                    for story in readable:
+                        digest = content_hash(story['content'])
+                        existing = conn.execute("SELECT story_id FROM story_data WHERE content_hash = ?",
+                                                (digest,)).fetchone()
+                        if existing and existing[0] < story['story_id']:
+                            conn.execute("DELETE FROM story_data WHERE story_id = ?", (story['story_id'],))
+                            removed += 1
+                            continue
+                        if existing:
+                            conn.execute("DELETE FROM story_data WHERE story_id = ?", (existing[0],))
+                            removed += 1
+                        conn.execute("UPDATE story_data SET content_hash = ? WHERE story_id = ?",
+                                     (digest, story['story_id']))
+                        hashed += 1
+            if removed:
+                logging.info(f"Removed {removed} duplicate stories")
+            return {'hashed': hashed, 'removed': removed}
+        except sqlite3.Error as e:
+            logging.error(f"Error deduplicating stories: {e}")
+            return {'hashed': hashed, 'removed': removed}
+        finally:
+            self._invalidate(all_stories=True)
+
+    @traced('db.delete_story')
     def delete_story(self, story_id):
         """
-        Deletes a story by its ID.
+        Deletes a story by its ID. An archived story's content stays in its immutable segment,
+        recorded in archive_tombstones, until compact_archive rewrites the segment.
 
         Parameters:
         - story_id (int): The ID of the story to delete.
@@ -151,19 +498,343 @@ class StoryDatabase:
         - bool: True if the deletion was successful, False otherwise.
         """
         try:
-            query = "DELETE FROM story_data WHERE story_id = ?"
-            self.sqlconn.execute(query, (story_id,))
-            self.sqlconn.commit()
+            self.repository.delete_story(story_id)
+            self._invalidate(story_id=story_id)
             return True
-        except sqlite3.Error as e:
+        except self.errors as e:
             logging.error(f"Error deleting story: {e}")
             return False
 
-    def close(self):
+    @traced('db.archive_stories')
+    def archive_stories(self, older_than_days=90, batch_size=1000):
+        """
+        Moves the content of stories older than the threshold to the cold store, one segment
+        per batch. Each story keeps a stub row with its metadata and segment name, so list views
+        are unchanged and reads fetch the content from the segment transparently.
+
+        A segment is written and synced before any row points at it, so a failed run leaves at
+        most an unreferenced segment file and the stories stay hot.
+
+        Parameters:
+        - older_than_days (float): Archive stories created more than this many days ago.
+        - batch_size (int): Stories per segment and per transaction.
+
+        Returns:
+        - int: Number of stories archived.
+        """
+        if not self._sqlite_only("Archiving stories"):
+            return 0
+        if self.cold is None:
+            logging.error("No archive directory configured; nothing archived.")
+            return 0
+        query = f'''SELECT {', '.join(STORY_DATA_COLUMNS)} FROM story_data
+        WHERE archive_segment IS NULL AND created_at < datetime('now', :age) AND story_id > :last_id
+        ORDER BY story_id LIMIT :limit'''
+        archived = 0
+        last_id = 0
+        try:
+            while True:
+                with self.engine.session() as session:
+                    rows = session.all(query, {'age': f"-{older_than_days} days", 'last_id': last_id,
+                                               'limit': batch_size})
+                if not rows:
+                    break
+                stories = self._stories(rows)
+                segment = self.cold.write(stories)
+                with self.engine.write() as conn:
+                    # Stories deleted since they were read are simply left out
+                    cursor = conn.executemany(
+                        "UPDATE story_data SET content = '', archive_segment = ? "
+                        "WHERE story_id = ? AND archive_segment IS NULL",
+                        [(segment, story['story_id']) for story in stories])
+                archived += cursor.rowcount
+                last_id = stories[-1]['story_id']
+            if archived:
+                logging.info(f"Archived {archived} stories to {self.cold.directory}")
+            return archived
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Error archiving stories: {e}")
+            return archived
+        finally:
+            self._invalidate(all_stories=True)
+
+    @traced('db.compact_archive')
+    def compact_archive(self):
+        """
+        Rewrites every archive segment holding deleted stories (see archive_tombstones) without
+        them, then removes the old segment, so deleted content does not linger in cold storage.
+        The remaining stories are written to a new segment and repointed in one transaction
+        before the old file is removed; a failed run leaves the old segment and its tombstones
+        for the next one.
+
+        Returns:
+        - dict: Segments rewritten and deleted stories purged.
+        """
+        result = {'segments': 0, 'purged': 0}
+        if not self._sqlite_only("Compacting the archive") or self.cold is None:
+            return result
+        try:
+            with self.engine.read() as conn:
+                names = [row[0] for row in conn.execute("SELECT DISTINCT archive_segment FROM archive_tombstones")]
+            for name in names:
+                with self.engine.read() as conn:
+                    live = {row[0] for row in conn.execute(
+                        "SELECT story_id FROM story_data WHERE archive_segment = ?", (name,))}
+                try:
+                    segment = self.cold.segment(name)
+                    kept = [story for story in segment if story['story_id'] in live]
+                    purged = segment.count - len(kept)
+                except FileNotFoundError:
+                    kept, purged = [], 0
+                if len(kept) < len(live):
+                    logging.error(f"Archive segment {name} is missing {len(live) - len(kept)} stories; left as it is")
+                    continue
+                replacement = self.cold.write(kept) if kept else None
+                with self.engine.write() as conn:
+                    conn.execute("UPDATE story_data SET archive_segment = ? WHERE archive_segment = ?",
+                                 (replacement, name))
+                    conn.execute("DELETE FROM archive_tombstones WHERE archive_segment = ?", (name,))
+                self.cold.remove(name)
+                result['segments'] += 1
+                result['purged'] += purged
+            if result['segments']:
+                logging.info(f"Compacted {result['segments']} archive segments, purging {result['purged']} stories")
+            return result
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logging.error(f"Error compacting the archive: {e}")
+            return result
+        finally:
+            self._invalidate(all_stories=True)
+
+    @traced('db.story_stats')
+    def story_stats(self, group_by=STATS_GROUPS, genre=None, age=None, since=None, until=None):
+        """
+        Story counts, total words and average segments per group, read from the story_stats
+        aggregates that triggers keep up to date, so the cost grows with the number of groups
+        rather than the number of stories.
+
+        Parameters:
+        - group_by (iterable[str]): Any of 'genre', 'age' and 'day'; none gives one overall row.
+        - genre (str, optional): Genre filter.
+        - age (int, optional): Age filter.
+        - since (str, optional): First day to include, as YYYY-MM-DD.
+        - until (str, optional): Last day to include, as YYYY-MM-DD.
+
+        Returns:
+        - list[dict]: Per group, the group_by columns plus stories, words and avg_segments
+          (None when no story in the group has a numeric segment count).
+        """
+        if not self._sqlite_only("Story stats"):
+            return []
+        group_by = [column for column in STATS_GROUPS if column in group_by]
+        query = f"""SELECT {''.join(f'{column}, ' for column in group_by)}SUM(stories), SUM(words),
+        CAST(SUM(segments) AS REAL) / NULLIF(SUM(segmented), 0) FROM story_stats WHERE 1=1"""
+        parameters = []
+        for condition, value in (("genre = ?", genre), ("age = ?", age), ("day >= ?", since), ("day <= ?", until)):
+            if value is not None:
+                query += f" AND {condition}"
+                parameters.append(value)
+        if group_by:
+            query += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+        columns = group_by + ['stories', 'words', 'avg_segments']
+
+        def load():
+            with self.engine.read() as conn:
+                rows = conn.execute(query, tuple(parameters)).fetchall()
+            # An empty table still aggregates to one row of NULLs
+            return [dict(zip(columns, row)) for row in rows if row[len(group_by)] is not None]
+        try:
+            return self._read_through(('stats', self.version, query, tuple(parameters)), load)
+        except sqlite3.Error as e:
+            logging.error(f"Error reading story stats: {e}")
+            return []
+
+    def rebuild_stats(self):
+        """
+        Recomputes the story_stats aggregates from story_data with a full scan, as a consistency
+        check: the triggers should have kept them exact, so any difference is reported.
+
+        Returns:
+        - int: Number of groups that were wrong or missing, or None if the rebuild failed.
+        """
+        if not self._sqlite_only("Rebuilding story stats"):
+            return None
+        try:
+            with self.engine.write() as conn:
+                corrected = rebuild_story_stats(conn)
+            self._invalidate()
+            if corrected:
+                logging.error(f"Rebuilt story stats: {corrected} groups were out of date")
+            return corrected
+        except sqlite3.Error as e:
+            logging.error(f"Error rebuilding story stats: {e}")
+            return None
+
+    def archive_stats(self):
+        """
+        Returns:
+        - dict: Stories in the hot database and in the cold store, the database file size and
+          the cold store's segments and bytes.
+        """
+        if not self._sqlite_only("Archive stats"):
+            return {}
+        try:
+            with self.engine.read() as conn:
+                hot, archived = conn.execute(
+                    "SELECT COUNT(*) - COUNT(archive_segment), COUNT(archive_segment) FROM story_data").fetchone()
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Error reading archive stats: {e}")
+            return {}
+        stats = {'hot_stories': hot, 'archived_stories': archived, 'hot_bytes': page_count * page_size}
+        if self.cold is not None:
+            stats.update(self.cold.stats())
+        return stats
+
+    def vacuum(self):
         """
-        Closes the database connection.
+        Rebuilds the database file to return the space freed by archiving to the filesystem.
+
+        Returns:
+        - bool: True if the database was vacuumed, False otherwise.
         """
+        if not self._sqlite_only("Vacuuming"):
+            return False
         try:
-            self.sqlconn.close()
+            with self.engine.write(transaction=False) as conn:
+                conn.commit()
+                conn.execute("VACUUM")
+            return True
         except sqlite3.Error as e:
-            logging.error(f"Error closing the database: {e}")
\ No newline at end of file
+            logging.error(f"Error vacuuming the database: {e}")
+            return False
+
+    @staticmethod
+    def starter_key(genre, age, choice_count, length):
+        """
+        Normalizes a story configuration into the starter_pages key.
+        Frontends send numbers as strings, so ages and choice counts are coerced to int.
+
+        Returns:
+        - tuple: (genre, age, choice_count, length), or None if the configuration is invalid.
+        """
+        try:
+            return (str(genre).strip(), int(age), int(choice_count), str(length).strip())
+        except (TypeError, ValueError):
+            return None
+
+    def save_starter_page(self, genre, age, choice_count, length, content, variant=0, tokens=0):
+        """
+        Stores a pre-generated first page for a story configuration.
+
+        Parameters:
+        - genre, age, choice_count, length: The story configuration.
+        - content (str): The generated first page.
+        - variant (int): Which of several pages for the same configuration this is.
+        - tokens (int): Tokens spent generating the page.
+
+        Returns:
+        - bool: True if the page was saved successfully, False otherwise.
+        """
+        key = self.starter_key(genre, age, choice_count, length)
+        if key is None or not content:
+            logging.error("Invalid starter page configuration or empty content.")
+            return False
+        try:
+            self.repository.save_starter_page(key, variant, content, tokens)
+            return True
+        except self.errors as e:
+            logging.error(f"Error saving starter page: {e}")
+            return False
+
+    @traced('db.fetch_starter_page')
+    def fetch_starter_page(self, genre, age, choice_count, length):
+        """
+        Fetches a pre-generated first page for a story configuration, picking a random variant.
+
+        Returns:
+        - str: The first page, or None if none is stored.
+        """
+        key = self.starter_key(genre, age, choice_count, length)
+        if key is None:
+            return None
+        try:
+            return self.repository.fetch_starter_page(key)
+        except self.errors as e:
+            logging.error(f"Error fetching starter page: {e}")
+            return None
+
+    def starter_page_keys(self):
+        """
+        Returns the configurations and variants that already have a stored first page.
+
+        Returns:
+        - set[tuple]: (genre, age, choice_count, length, variant) for every stored page.
+        """
+        try:
+            return self.repository.starter_page_keys()
+        except self.errors as e:
+            logging.error(f"Error fetching starter page keys: {e}")
+            return set()
+
+    def close(self):
+        """
+        Closes the database connections.
+        """
+        try:
+            self.engine.close()
+            if self.cold is not None:
+                self.cold.close()
+        except self.errors as e:
+            logging.error(f"Error closing the database: {e}")
+
+
+def main():
+    """
+    CLI for database maintenance jobs.
+
+    Examples:
+    - python database.py backfill --db story_data.db
+    - python database.py archive --older-than-days 90 --vacuum
+    - python database.py rebuild-stats
+    - python database.py dedup --vacuum
+    - python database.py compact-archive
+    """
+    parser = argparse.ArgumentParser(description="Story database maintenance.")
+    parser.add_argument('action', choices=['backfill', 'archive', 'rebuild-stats', 'dedup', 'compact-archive'])
+    parser.add_argument('--db', help="SQLite database file (defaults to STORAGE_URL or story_data.db).")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--archive-dir', help="Cold store directory (defaults to STORY_ARCHIVE_DIR or <db>_archive).")
+    parser.add_argument('--older-than-days', type=float, default=float(os.getenv("STORY_ARCHIVE_DAYS", "90")))
+    parser.add_argument('--vacuum', action='store_true', help="Shrink the database file after archiving or dedup.")
+    args = parser.parse_args()
+
+    db = StoryDatabase(args.db, archive_dir=args.archive_dir)
+    try:
+        if args.action == 'backfill':
+            updated = db.backfill_metadata(batch_size=args.batch_size)
+            logging.info(f"Backfill complete: {updated} stories updated")
+        elif args.action == 'rebuild-stats':
+            corrected = db.rebuild_stats()
+            logging.info(f"Stats rebuilt: {corrected} groups corrected")
+        elif args.action == 'dedup':
+            result = db.deduplicate(batch_size=args.batch_size)
+            if args.vacuum:
+                db.vacuum()
+            logging.info(f"Dedup complete: {result['hashed']} stories hashed, {result['removed']} duplicates removed")
+        elif args.action == 'compact-archive':
+            result = db.compact_archive()
+            logging.info(f"Compaction complete: {result['segments']} segments rewritten, {result['purged']} stories purged")
+        else:
+            archived = db.archive_stories(older_than_days=args.older_than_days, batch_size=args.batch_size)
+            if args.vacuum:
+                db.vacuum()
+            logging.info(f"Archive complete: {archived} stories archived; {db.archive_stats()}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
@@ -1,16 +1,59 @@
-from flask import Flask, jsonify, request
-from database import StoryDatabase
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
+from database import StoryDatabase, extract_title
 from flask_cors import CORS
 from story_text import Author
+from story_archive import PartialImport, iter_ndjson, read_ndjson
 import logging
+import os
+
+from storybook.profiling import Profiler
+from storybook.responses import versioned_json
+from storybook.scheduler import PREFETCH, FairScheduler, SchedulerFull, request_user
+from storybook.segments import render_segment
+from storybook.tracing import Tracer
+from storybook.warm_pool import PoolSettings, WarmPool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__)
 db = StoryDatabase()
-agent = Author()
+# Every model call goes through here: per-user queues, interactive work ahead of prefetching
+scheduler = FairScheduler.from_env()
+# First pages kept ready per configuration, written like live first pages (see Author.write_warm_page);
+# refills pause while the model circuit breaker is open
+warm_pool = WarmPool(db.db_path, lambda key: scheduler.run('warm-pool', lambda: agent.write_warm_page(key), PREFETCH),
+                     settings=PoolSettings.from_env(),
+                     workers=int(os.getenv("WARM_POOL_WORKERS", "2")), available=lambda: not agent.retry_after())
+agent = Author(db=db, warm_pool=warm_pool)
+warm_pool.warm()
 CORS(app, resources={r"/api/*": {"origins": "*"}})  # Allow all origins for development
+# Requests sending X-Trace: 1, or picked at TRACE_SAMPLE_RATE, are traced; see /api/traces/slow
+tracer = Tracer.from_env()
+tracer.instrument(app)
+# Off unless PROFILE_DIR is set; then requests sending X-Profile: 1, or picked at PROFILE_SAMPLE_RATE,
+# are profiled into it. See /api/profiles
+profiler = Profiler.from_env()
+profiler.instrument(app)
+
+
+def generation_failed(message):
+    """
+    Error response for a failed generation: 503 with Retry-After while the circuit breaker
+    is open, since retrying sooner is pointless, 502 otherwise.
+    """
+    retry_after = agent.retry_after()
+    if retry_after:
+        return jsonify({"error": f"{message}: story generation is temporarily unavailable",
+                        "retry_after": round(retry_after)}), 503, {'Retry-After': str(max(1, round(retry_after)))}
+    return jsonify({"error": message}), 502
+
+
+def too_busy(error):
+    """
+    Error response for a client that already has the most generation requests allowed waiting.
+    """
+    return jsonify({"error": str(error)}), 429, {'Retry-After': '5'}
 
 
 @app.route('/api/start-story', methods=['POST'])
@@ -26,7 +69,9 @@ def start_story():
     - key_moments (list[str], optional): Key moments to include in the story.
 
     Returns:
-    - JSON with the first page of the story and the generated title.
+    - JSON with the first page of the story, the generated title and the parsed segment
+      (title, body, choices with ids, is_final). degraded is true when generation is unavailable
+      and a stored story for the genre and age is served instead.
     """
     try:
         data = request.get_json()
@@ -39,16 +84,15 @@ def start_story():
         page_count = data['page_count']
         key_moments = data.get('key_moments')
 
-        # Extract the title from the first line of the story
-        story = agent.first_page(genre, age, choice_count, page_count, key_moments)
-        title = story.split("\n")[0].strip()
-        if not title.startswith("Title: "):  # Validate title prefix
-            title = "Untitled Story"
-        else:
-            title = title.replace("Title: ", "").strip()
-            
-        response = agent.first_page(genre, age, choice_count, page_count, key_moments)
-        return jsonify({"content": response}), 200
+        segment = scheduler.run(request_user(request), lambda: agent.first_page_segment(
+            genre, age, choice_count, page_count, key_moments))
+        if segment is None:
+            return generation_failed("Failed to start story")
+        content = render_segment(segment)
+        return jsonify({"content": content, "title": segment['title'] or extract_title(content),
+                        "segment": segment, "degraded": segment.get('degraded', False)}), 200
+    except SchedulerFull as e:
+        return too_busy(e)
     except Exception as e:
         logging.error(f"Error in /api/start-story: {e}")
         return jsonify({"error": "Failed to start story"}), 500
@@ -63,7 +107,7 @@ def continue_story():
     - text (str): The user's choice or input for the next segment.
 
     Returns:
-    - JSON with the next segment of the story.
+    - JSON with the next segment of the story as text and as a parsed segment.
     """
     try:
         data = request.get_json()
@@ -71,8 +115,12 @@ def continue_story():
             return jsonify({"error": "Missing required field: text"}), 400
         
         user_input = data['text']
-        response = agent.execute(user_input)
-        return jsonify({"content": response}), 200
+        segment = scheduler.run(request_user(request), lambda: agent.execute_segment(user_input))
+        if segment is None:
+            return generation_failed("Failed to continue story")
+        return jsonify({"content": render_segment(segment), "segment": segment}), 200
+    except SchedulerFull as e:
+        return too_busy(e)
     except Exception as e:
         logging.error(f"Error in /api/continue-story: {e}")
         return jsonify({"error": "Failed to continue story"}), 500
@@ -89,9 +137,11 @@ def save_story():
     - choice_count (int): Number of choices per segment.
     - page_count (int): Length of the story.
     - content (str): The complete story content.
+    - title (str, optional): Title of the story. Extracted from the content when not given.
 
     Returns:
-    - Success or error message.
+    - Success or error message, with the story_id. Content that is already saved is not stored
+      again; the existing story's id is returned.
     """
     try:
         data = request.get_json()
@@ -104,8 +154,10 @@ def save_story():
         page_count = data['page_count']
         content = data['content']
 
-        db.save_story(genre, age, choice_count, page_count, content)
-        return jsonify({"message": "Story saved successfully"}), 200
+        story_id = db.save_story(genre, age, choice_count, page_count, content, title=data.get('title'))
+        if not story_id:
+            return jsonify({"error": "Failed to save story"}), 500
+        return jsonify({"message": "Story saved successfully", "story_id": story_id}), 200
     except Exception as e:
         logging.error(f"Error in /api/save-story: {e}")
         return jsonify({"error": f"Failed to save story: {str(e)}"}), 500
@@ -116,32 +168,216 @@ def get_stories():
     """
     Retrieves all saved stories from the database.
 
+    Query Parameters:
+    - view (str, optional): 'summary' to return metadata only (no content), for list views.
+    - order_by (str, optional): Sort order for the summary view, 'created_at' (default) or 'title'.
+    - order (str, optional): 'desc' (default) or 'asc'.
+
     Returns:
-    - JSON list of all stories with details.
+    - JSON list of all stories with details, compressed when the client accepts it. The ETag and
+      Last-Modified headers follow the table version, so unchanged lists return 304.
     """
     try:
-        # Grab DB Tables
-        cursor = db.sqlconn.cursor()
-        cursor.execute("SELECT * FROM story_data")
-        rows = cursor.fetchall()
-        # Convert to dict
-        stories = [
-            {
-                'story_id': row[0],
-                'genre': row[1],
-                'age': row[2],
-                'choice_count': row[3],
-                'segment_count': row[4],
-                'content': row[5],
-            }
-            for row in rows
-        ]
+        version, updated_at = db.table_version()
+        if request.args.get('view') == 'summary':
+            order_by = request.args.get('order_by', 'created_at')
+            if order_by not in ('created_at', 'title'):
+                return jsonify({"error": "Invalid order_by"}), 400
+            descending = request.args.get('order', 'desc') != 'asc'
+            return versioned_json(lambda: db.list_stories(order_by=order_by, descending=descending),
+                                  version, updated_at)
         # Return json for frontend
-        return jsonify(stories), 200
+        return versioned_json(db.fetch_all_stories, version, updated_at)
     except Exception as e:
         logging.error(f"Error in /api/stories: {e}")
         return jsonify({"error": "Failed to retrieve stories"}), 500
 
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """
+    Returns story counts, total words and average segments per genre, age and day, read from
+    aggregates kept up to date on every save and delete.
+
+    Query Parameters:
+    - group_by (str, optional): Comma-separated subset of genre, age and day (default all three);
+      empty for one overall row.
+    - genre (str, optional): Genre filter.
+    - age (int, optional): Age filter.
+    - since, until (str, optional): First and last day to include, as YYYY-MM-DD.
+
+    Returns:
+    - JSON list of groups with stories, words and avg_segments. ETag and Last-Modified follow
+      the table version, like /api/stories.
+    """
+    try:
+        group_by = [column for column in request.args.get('group_by', 'genre,age,day').split(',') if column]
+        if not set(group_by) <= {'genre', 'age', 'day'}:
+            return jsonify({"error": "Invalid group_by"}), 400
+        age = request.args.get('age')
+        if age is not None and not age.isdigit():
+            return jsonify({"error": "Invalid age"}), 400
+        version, updated_at = db.table_version()
+        return versioned_json(lambda: db.story_stats(group_by=group_by, genre=request.args.get('genre'),
+                                                     age=int(age) if age is not None else None,
+                                                     since=request.args.get('since'), until=request.args.get('until')),
+                              version, updated_at)
+    except Exception as e:
+        logging.error(f"Error in /api/stats: {e}")
+        return jsonify({"error": "Failed to retrieve stats"}), 500
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Returns the story cache's hit/miss statistics.
+
+    Returns:
+    - JSON with hits, misses, hit_rate, evictions, entries, bytes and the data version.
+    """
+    return jsonify(db.cache_stats()), 200
+
+@app.route('/api/archive/stats', methods=['GET'])
+def archive_stats():
+    """
+    Returns how stories are split between the database and the cold store.
+
+    Returns:
+    - JSON with hot_stories, archived_stories, hot_bytes and the cold store's segments and bytes.
+    """
+    return jsonify(db.archive_stats()), 200
+
+@app.route('/api/warm-pool/stats', methods=['GET'])
+def warm_pool_stats():
+    """
+    Returns the warm pool's statistics.
+
+    Returns:
+    - JSON with hits, misses, hit_rate, refill cost (pages, tokens, seconds) and depth per configuration.
+    """
+    return jsonify(warm_pool.stats()), 200
+
+@app.route('/api/policy/stats', methods=['GET'])
+def policy_stats():
+    """
+    Returns the model call policy's statistics.
+
+    Returns:
+    - JSON keyed by call type with calls, fallbacks, failures, p50/p99 latency and model health.
+    """
+    return jsonify(agent.policy.stats()), 200
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """
+    Returns the generation scheduler's statistics.
+
+    Returns:
+    - JSON with queued tasks, waiting users, dispatches and queue wait p50/p95 per priority class,
+      and tasks running per user.
+    """
+    return jsonify(scheduler.stats()), 200
+
+@app.route('/api/traces/slow', methods=['GET'])
+def slow_traces():
+    """
+    Returns recent traced requests, slowest first, with their spans.
+
+    Query Parameters:
+    - min_ms (float, optional): Only traces that took at least this long. Defaults to 0.
+    - limit (int, optional): Most traces to return. Defaults to 20.
+
+    Returns:
+    - JSON list of traces: trace_id, name, duration_ms and spans (name, parent, timing, attributes).
+    """
+    try:
+        min_ms = float(request.args.get('min_ms', 0))
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "min_ms and limit must be numbers"}), 400
+    return jsonify(tracer.buffer.slow(min_ms, limit)), 200
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """
+    Lists recent request profiles.
+
+    Query Parameters:
+    - limit (int, optional): Most profiles to return. Defaults to 50.
+
+    Returns:
+    - JSON list of profiles, newest first: name, route, latency_ms, session, format, bytes and created.
+    """
+    if not profiler.enabled:
+        return jsonify({"error": "Profiling is off; set PROFILE_DIR to enable it"}), 404
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    return jsonify(profiler.list_dumps(limit)), 200
+
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """
+    Downloads a request profile: a .pstats file (open with python -m pstats) or .folded stacks
+    (for flame graph tools).
+    """
+    path = profiler.dump_path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+
+@app.route('/api/stories/export', methods=['GET'])
+def export_stories():
+    """
+    Streams every saved story as newline-delimited JSON.
+
+    Query Parameters:
+    - gzip (bool, optional): Compress the stream with gzip when set to 1/true.
+
+    Returns:
+    - NDJSON (or gzipped NDJSON) attachment, one story per line.
+    """
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = 'stories.ndjson.gz' if compress else 'stories.ndjson'
+    body = stream_with_context(iter_ndjson(db.iter_stories(), compress=compress))
+    return Response(
+        body,
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+@app.route('/api/stories/import', methods=['POST'])
+def import_stories():
+    """
+    Bulk-imports stories from an NDJSON (or gzipped NDJSON) request body.
+
+    Query Parameters:
+    - new_ids (bool, optional): Assign new story ids instead of keeping the exported ones.
+
+    Returns:
+    - JSON with the number of stories imported. A body that turns out to be invalid part way
+      is answered with 400, along with the number of stories imported before it.
+    """
+    try:
+        keep_ids = request.args.get('new_ids', '').lower() not in ('1', 'true', 'yes')
+        imported = db.import_stories(read_ndjson(request.stream), keep_ids=keep_ids)
+        return jsonify({"imported": imported}), 200
+    except PartialImport as e:
+        logging.error(f"Error in /api/stories/import: {e}")
+        return jsonify({"error": "Invalid NDJSON body", "imported": e.inserted}), 400
+    except ValueError as e:
+        logging.error(f"Error in /api/stories/import: {e}")
+        return jsonify({"error": "Invalid NDJSON body"}), 400
+    except Exception as e:
+        logging.error(f"Error in /api/stories/import: {e}")
+        return jsonify({"error": "Failed to import stories"}), 500
+
+
 @app.route('/api/stories/<int:story_id>', methods=['DELETE'])
 def delete_story(story_id):
     """
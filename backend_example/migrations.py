@@ -0,0 +1,275 @@
+import logging
+import sqlite3
+
+# Columns added to story_data after the original schema, in the order they are appended
+STORY_METADATA_COLUMNS = [
+    ('title', 'TEXT'),
+    ('word_count', 'INTEGER'),
+    ('created_at', 'TIMESTAMP'),
+]
+
+# Metadata columns returned by list views; covered by the summary indexes so content is never read
+SUMMARY_COLUMNS = ['story_id', 'genre', 'age', 'choice_count', 'segment_count', 'title', 'word_count', 'created_at']
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _summary_rest(*leading):
+    return ', '.join(column for column in SUMMARY_COLUMNS if column not in leading)
+
+
+# Every step must be idempotent: databases created before the migration table existed
+# may already have some of these changes applied.
+
+def story_indexes(conn):
+    """The original single-column indexes."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_genre ON story_data (genre)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_age ON story_data (age)")
+
+
+def story_metadata_columns(conn):
+    """Adds title, word_count and created_at to tables created before they existed."""
+    existing = _columns(conn, 'story_data')
+    for name, column_type in STORY_METADATA_COLUMNS:
+        if name not in existing:
+            # SQLite cannot add a column with a CURRENT_TIMESTAMP default, so save_story sets created_at itself
+            conn.execute(f"ALTER TABLE story_data ADD COLUMN {name} {column_type}")
+
+
+def summary_indexes(conn):
+    """Covering indexes for the list views, one per sort order."""
+    for name, column in (('idx_summary_created', 'created_at'), ('idx_summary_title', 'title')):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON story_data "
+                     f"({column}, story_id, {_summary_rest(column, 'story_id')})")
+
+
+def starter_pages_table(conn):
+    """Pre-generated first pages, keyed by story configuration."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS starter_pages (
+        genre VARCHAR(60) NOT NULL,
+        age INTEGER NOT NULL,
+        choice_count INTEGER NOT NULL,
+        length VARCHAR(20) NOT NULL,
+        variant INTEGER NOT NULL DEFAULT 0,
+        content TEXT NOT NULL,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (genre, age, choice_count, length, variant)
+    )''')
+
+
+def genre_age_index(conn):
+    """
+    Composite index for fetch_story's genre + age filter, ordered by story_id.
+    It also covers the summary columns, so filtered list views never read content.
+    idx_genre is a prefix of it and is dropped.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_genre_age ON story_data "
+                 f"(genre, age, story_id, {_summary_rest('genre', 'age', 'story_id')})")
+    conn.execute("DROP INDEX IF EXISTS idx_genre")
+
+
+def table_versions(conn):
+    """
+    Persistent per-table write counter and timestamp, kept up to date by triggers so that
+    writes from any connection (the app, CLI jobs, other workers) are counted.
+    Used for HTTP validators (ETag/Last-Modified) on the story lists.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('story_data', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS story_data_version_{event.lower()} AFTER {event} ON story_data
+        BEGIN
+            UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE name = 'story_data';
+        END''')
+
+
+def archive_segment_column(conn):
+    """
+    Names the cold storage segment holding an archived story's content. Archived rows keep
+    their metadata, so list views still come from the hot database, and their content is emptied.
+    """
+    if 'archive_segment' not in _columns(conn, 'story_data'):
+        conn.execute("ALTER TABLE story_data ADD COLUMN archive_segment TEXT")
+
+
+# story_stats group of a story_data row, and what the row adds to it. segment_count holds a
+# length such as 'Short' for stories started in the app, so only numeric counts are averaged.
+STATS_DAY = "COALESCE(date({row}.created_at), 'unknown')"
+STATS_WORDS = "COALESCE({row}.word_count, 0)"
+STATS_SEGMENTS = "CASE WHEN typeof({row}.segment_count) = 'integer' THEN {row}.segment_count ELSE 0 END"
+STATS_SEGMENTED = "(typeof({row}.segment_count) = 'integer')"
+
+
+def _stats_add(row):
+    return f'''
+    INSERT INTO story_stats (genre, age, day, stories, words, segments, segmented)
+    VALUES ({row}.genre, {row}.age, {STATS_DAY.format(row=row)}, 1, {STATS_WORDS.format(row=row)},
+            {STATS_SEGMENTS.format(row=row)}, {STATS_SEGMENTED.format(row=row)})
+    ON CONFLICT (genre, age, day) DO UPDATE SET
+        stories = stories + 1, words = words + excluded.words,
+        segments = segments + excluded.segments, segmented = segmented + excluded.segmented;'''
+
+
+def _stats_remove(row):
+    group = f"genre = {row}.genre AND age = {row}.age AND day = {STATS_DAY.format(row=row)}"
+    return f'''
+    UPDATE story_stats SET
+        stories = stories - 1, words = words - {STATS_WORDS.format(row=row)},
+        segments = segments - {STATS_SEGMENTS.format(row=row)}, segmented = segmented - {STATS_SEGMENTED.format(row=row)}
+    WHERE {group};
+    DELETE FROM story_stats WHERE {group} AND stories <= 0;'''
+
+
+def rebuild_story_stats(conn):
+    """
+    Recomputes story_stats from story_data. Call it inside a transaction.
+
+    Returns:
+    - int: Number of groups whose stored aggregates were missing or wrong.
+    """
+    columns = "genre, age, day, stories, words, segments, segmented"
+    fresh = f'''SELECT genre, age, {STATS_DAY.format(row='s')} AS day, COUNT(*) AS stories,
+    SUM({STATS_WORDS.format(row='s')}) AS words, SUM({STATS_SEGMENTS.format(row='s')}) AS segments,
+    SUM({STATS_SEGMENTED.format(row='s')}) AS segmented
+    FROM story_data s GROUP BY 1, 2, 3'''
+    # Groups missing on either side or with different numbers
+    wrong = conn.execute(f'''SELECT COUNT(*) FROM (
+        SELECT genre, age, day FROM (SELECT * FROM ({fresh}) EXCEPT SELECT {columns} FROM story_stats)
+        UNION
+        SELECT genre, age, day FROM (SELECT {columns} FROM story_stats EXCEPT SELECT * FROM ({fresh})))''')
+    corrected = wrong.fetchone()[0]
+    conn.execute("DELETE FROM story_stats")
+    conn.execute(f"INSERT INTO story_stats ({columns}) {fresh}")
+    return corrected
+
+
+def story_stats_table(conn):
+    """
+    Stories, words and segments per genre, age and day, kept up to date by triggers so that
+    dashboards read one row per group instead of scanning story_data. Archiving only empties
+    content, so it does not touch the aggregates.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS story_stats (
+        genre VARCHAR(60) NOT NULL,
+        age INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        stories INTEGER NOT NULL DEFAULT 0,
+        words INTEGER NOT NULL DEFAULT 0,
+        segments INTEGER NOT NULL DEFAULT 0,
+        segmented INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (genre, age, day)
+    ) WITHOUT ROWID''')
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS story_stats_insert AFTER INSERT ON story_data BEGIN {_stats_add('NEW')} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS story_stats_delete AFTER DELETE ON story_data BEGIN {_stats_remove('OLD')} END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS story_stats_update "
+                 "AFTER UPDATE OF genre, age, segment_count, word_count, created_at ON story_data "
+                 f"BEGIN {_stats_remove('OLD')} {_stats_add('NEW')} END")
+    rebuild_story_stats(conn)
+
+
+def content_hash_column(conn):
+    """
+    SHA-256 of each story's content with a unique index, so saving content that is already
+    stored returns the existing story. Rows saved before this migration keep a NULL hash,
+    which the index ignores, until `python database.py dedup` hashes them and drops their duplicates.
+    """
+    if 'content_hash' not in _columns(conn, 'story_data'):
+        conn.execute("ALTER TABLE story_data ADD COLUMN content_hash TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_content_hash ON story_data (content_hash)")
+
+
+def archive_tombstones(conn):
+    """
+    Archived stories that were deleted, with the segment still holding their content. Segments
+    are immutable, so the content stays on disk until `python database.py compact-archive`
+    rewrites the segment without it. A trigger records every deletion, from any connection.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive_tombstones (
+        story_id INTEGER PRIMARY KEY,
+        archive_segment TEXT NOT NULL,
+        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tombstone_segment ON archive_tombstones (archive_segment)")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS archive_tombstone_delete AFTER DELETE ON story_data
+    WHEN OLD.archive_segment IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO archive_tombstones (story_id, archive_segment) VALUES (OLD.story_id, OLD.archive_segment);
+    END''')
+
+
+# Ordered list of (version, step). Append new steps; never reorder or renumber applied ones.
+MIGRATIONS = [
+    (1, story_indexes),
+    (2, story_metadata_columns),
+    (3, summary_indexes),
+    (4, starter_pages_table),
+    (5, genre_age_index),
+    (6, table_versions),
+    (7, archive_segment_column),
+    (8, story_stats_table),
+    (9, content_hash_column),
+    (10, archive_tombstones),
+]
+
+
+def current_version(conn):
+    """
+    Returns the highest applied migration version, or 0 for a database without the version table.
+    """
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+        return row[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    Applies every migration newer than the database's version, each in its own transaction.
+
+    Parameters:
+    - conn (sqlite3.Connection): Database connection.
+    - migrations (list[tuple]): Ordered (version, step) pairs.
+
+    Returns:
+    - list[int]: The versions that were applied.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.commit()
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    newly_applied = []
+    for version, step in migrations:
+        if version in applied:
+            continue
+        # DDL does not open a transaction implicitly, so begin one explicitly to make each step atomic
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, step.__name__))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Migration {version} ({step.__name__}) failed: {e}")
+            raise
+        logging.info(f"Applied migration {version}: {step.__name__}")
+        newly_applied.append(version)
+    return newly_applied
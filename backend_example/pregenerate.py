@@ -0,0 +1,235 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import product
+
+from dotenv import load_dotenv
+from openai import OpenAI
+from database import StoryDatabase
+from story_text import MODEL, WRITER_JOB, first_page_prompt
+
+from storybook.http_clients import openai_http_client
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# The options offered by testing_streamlit/AdventureMode.py
+GENRES = ["Fantasy", "Sci-Fi", "Mystery", "Adventure"]
+AGES = range(5, 13)
+CHOICE_COUNTS = range(2, 5)
+LENGTHS = [3]
+
+
+def build_matrix(genres=GENRES, ages=AGES, choice_counts=CHOICE_COUNTS, lengths=LENGTHS, variants=1):
+    """
+    Expands the configuration options into the list of pages to pre-generate.
+
+    Returns:
+    - list[tuple]: (genre, age, choice_count, length, variant) for every page.
+    """
+    return [
+        (genre, int(age), int(choice_count), str(length), variant)
+        for genre, age, choice_count, length, variant
+        in product(genres, ages, choice_counts, lengths, range(variants))
+    ]
+
+
+class ChatPageWriter:
+    """
+    Generates first pages with one chat completion per page.
+
+    Every page is written from a fresh conversation, so it is safe to share a
+    writer between worker threads. The endpoint can be pointed anywhere with
+    base_url (for example a local fake server in tests).
+    """
+
+    def __init__(self, model=MODEL, base_url=None, api_key=None):
+        self.model = model
+        self.client = OpenAI(
+            api_key=api_key or os.getenv("GPT_API_KEY"),
+            base_url=base_url or os.getenv("PREGEN_BASE_URL"),
+            http_client=openai_http_client(),
+        )
+
+    def __call__(self, genre, age, choice_count, length):
+        """
+        Writes one first page.
+
+        Returns:
+        - tuple: (page text, tokens spent).
+        """
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": WRITER_JOB},
+                {"role": "user", "content": first_page_prompt(genre, age, choice_count, length)},
+            ],
+        )
+        tokens = response.usage.total_tokens if response.usage else 0
+        return response.choices[0].message.content, tokens
+
+
+class Checkpoint:
+    """
+    Records finished pages and spend in a JSON file so an interrupted run can resume.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.done = set()
+        self.failed = {}
+        self.tokens = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            self.done = {tuple(key) for key in state.get('done', [])}
+            self.failed = {tuple(json.loads(key)): count for key, count in state.get('failed', {}).items()}
+            self.tokens = state.get('tokens', 0)
+
+    def record(self, key, tokens, ok=True):
+        with self.lock:
+            self.tokens += tokens
+            if ok:
+                self.done.add(key)
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = self.failed.get(key, 0) + 1
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        state = {
+            'done': sorted(self.done),
+            'failed': {json.dumps(key): count for key, count in self.failed.items()},
+            'tokens': self.tokens,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)  # atomic, so a crash never leaves a half-written checkpoint
+
+
+def run_batch(db, matrix, writer, workers=4, max_tokens=None, max_stories=None,
+              checkpoint_path=None, max_attempts=3):
+    """
+    Pre-generates first pages for every configuration in the matrix.
+
+    Pages already stored in the database or recorded in the checkpoint are skipped,
+    so rerunning after an interruption only generates what is missing. No new pages
+    are started once the token or story cap is reached.
+
+    Parameters:
+    - db (StoryDatabase): Where generated pages are stored.
+    - matrix (list[tuple]): Output of build_matrix.
+    - writer (callable): (genre, age, choice_count, length) -> (page, tokens).
+    - workers (int): Number of concurrent generations.
+    - max_tokens (int, optional): Spend cap in tokens, including spend from earlier runs.
+    - max_stories (int, optional): Cap on pages generated in this run.
+    - checkpoint_path (str, optional): JSON file used to resume interrupted runs.
+    - max_attempts (int): How many times a failing configuration is tried across runs.
+
+    Returns:
+    - dict: Report with counts, tokens spent, elapsed seconds and stories per minute.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    stored = db.starter_page_keys()
+    pending = [
+        key for key in matrix
+        if key not in stored and key not in checkpoint.done
+        and checkpoint.failed.get(key, 0) < max_attempts
+    ]
+    report = {'planned': len(matrix), 'skipped': len(matrix) - len(pending),
+              'generated': 0, 'failed': 0, 'tokens': 0, 'capped': False}
+
+    def over_cap():
+        if max_tokens is not None and checkpoint.tokens >= max_tokens:
+            return True
+        return max_stories is not None and report['generated'] + len(in_flight) >= max_stories
+
+    started = time.monotonic()
+    in_flight = {}
+    queue = iter(pending)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Keep at most `workers` generations in flight so the caps are honoured closely
+            while len(in_flight) < workers and not over_cap():
+                key = next(queue, None)
+                if key is None:
+                    break
+                in_flight[pool.submit(writer, *key[:4])] = key
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = in_flight.pop(future)
+                try:
+                    page, tokens = future.result()
+                except Exception as e:
+                    logging.error(f"Error pre-generating {key}: {e}")
+                    report['failed'] += 1
+                    checkpoint.record(key, 0, ok=False)
+                    continue
+                # Database writes stay on this thread; the workers only talk to the model
+                if page and db.save_starter_page(*key[:4], page, variant=key[4], tokens=tokens):
+                    report['generated'] += 1
+                    report['tokens'] += tokens
+                    checkpoint.record(key, tokens)
+                else:
+                    report['failed'] += 1
+                    checkpoint.record(key, tokens, ok=False)
+    report['capped'] = len(pending) > report['generated'] + report['failed']
+    report['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    minutes = report['elapsed_seconds'] / 60
+    report['stories_per_minute'] = round(report['generated'] / minutes, 2) if minutes else 0.0
+    return report
+
+
+def _int_range(value):
+    """Parses '5-12' or '3' into a list of ints."""
+    start, _, end = value.partition('-')
+    return list(range(int(start), int(end or start) + 1))
+
+
+def main():
+    """
+    CLI for the offline pre-generation job.
+
+    Example:
+    - python pregenerate.py --genres Fantasy Mystery --ages 5-8 --choices 2-3 --workers 8 --max-tokens 200000
+    """
+    parser = argparse.ArgumentParser(description="Pre-generate first pages for common story configurations.")
+    parser.add_argument('--genres', nargs='+', default=GENRES)
+    parser.add_argument('--ages', type=_int_range, default=list(AGES), help="Age range, e.g. 5-12.")
+    parser.add_argument('--choices', type=_int_range, default=list(CHOICE_COUNTS), help="Choice range, e.g. 2-4.")
+    parser.add_argument('--lengths', nargs='+', default=[str(length) for length in LENGTHS])
+    parser.add_argument('--variants', type=int, default=1, help="Pages to keep per configuration.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-tokens', type=int, help="Stop starting new pages after this many tokens.")
+    parser.add_argument('--max-stories', type=int, help="Stop after generating this many pages.")
+    parser.add_argument('--checkpoint', default='pregenerate_checkpoint.json')
+    parser.add_argument('--db', default='story_data.db')
+    parser.add_argument('--base-url', help="Model endpoint (defaults to OpenAI).")
+    parser.add_argument('--model', default=MODEL)
+    args = parser.parse_args()
+
+    db = StoryDatabase(args.db)
+    try:
+        matrix = build_matrix(args.genres, args.ages, args.choices, args.lengths, args.variants)
+        writer = ChatPageWriter(model=args.model, base_url=args.base_url)
+        report = run_batch(db, matrix, writer, workers=args.workers, max_tokens=args.max_tokens,
+                           max_stories=args.max_stories, checkpoint_path=args.checkpoint)
+        logging.info(f"Pre-generation finished: {json.dumps(report)}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
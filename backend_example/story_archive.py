@@ -0,0 +1,273 @@
+import argparse
+import gzip
+import io
+import json
+import logging
+import sqlite3
+import sys
+import zlib
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Tables that can be exported or imported, mapped to the database they normally live in
+ARCHIVE_TABLES = {
+    'story_data': 'story_data.db',
+    'stories': '../testing_streamlit/story_db.sqlite',
+}
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class PartialImport(Exception):
+    """
+    Raised by bulk_insert when loading stops part way. Batches before the failing one stay committed.
+
+    Attributes:
+    - error (Exception): What stopped the load, e.g. sqlite3.Error or ValueError for a malformed row.
+    - inserted (int): Rows committed before it.
+    """
+
+    def __init__(self, error, inserted):
+        super().__init__(f"{error} ({inserted} rows were inserted before it)")
+        self.error = error
+        self.inserted = inserted
+
+
+def _check_table(table):
+    if table not in ARCHIVE_TABLES:
+        raise ValueError(f"Unsupported table: {table}")
+
+
+def iter_table(conn, table, batch_size=500):
+    """
+    Iterates over every row of a table without loading the whole table into memory.
+
+    Parameters:
+    - conn (sqlite3.Connection): Database connection.
+    - table (str): Name of the table to read.
+    - batch_size (int): Number of rows pulled from the cursor at a time.
+
+    Yields:
+    - dict: One row, keyed by column name.
+    """
+    _check_table(table)
+    cursor = conn.execute(f"SELECT * FROM {table} ORDER BY rowid")
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def iter_ndjson(rows, compress=False):
+    """
+    Encodes rows as newline-delimited JSON, optionally gzip-compressed.
+
+    Parameters:
+    - rows (iterable[dict]): Rows to encode.
+    - compress (bool): Whether to gzip the output.
+
+    Yields:
+    - bytes: Chunks of the encoded stream.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+    for row in rows:
+        line = (json.dumps(row, ensure_ascii=False) + "\n").encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(line)
+            if chunk:
+                yield chunk
+        else:
+            yield line
+    if compressor:
+        yield compressor.flush()
+
+
+def read_ndjson(fileobj):
+    """
+    Decodes a newline-delimited JSON stream, detecting gzip compression automatically.
+
+    Parameters:
+    - fileobj (file-like): Binary stream to read from.
+
+    Yields:
+    - dict: One decoded row per non-empty line.
+    """
+    if not hasattr(fileobj, 'peek'):
+        fileobj = io.BufferedReader(fileobj)
+    if fileobj.peek(2)[:2] == GZIP_MAGIC:
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _index_statements(conn, table):
+    """
+    Returns the CREATE INDEX statements for the explicit, non-unique indexes on a table.
+    Unique indexes enforce constraints that INSERT OR IGNORE relies on, so they stay in place.
+    """
+    unique = {row[1] for row in conn.execute(f"PRAGMA index_list({table})") if row[2]}
+    cursor = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    )
+    return [(name, sql) for name, sql in cursor.fetchall() if name not in unique]
+
+
+def bulk_insert(conn, table, rows, batch_size=5000, keep_ids=True, defer_indexes=True):
+    """
+    Inserts rows in large batched transactions, optionally with the table's indexes deferred.
+
+    Deferring drops the non-unique indexes before loading and rebuilds them once at the end, which
+    is much cheaper than updating them row by row, but leaves queries without them meanwhile: use
+    it offline, not on a database that is serving reads.
+
+    Parameters:
+    - conn (sqlite3.Connection): Database connection.
+    - table (str): Name of the table to load into.
+    - rows (iterable[dict]): Rows to insert, keyed by column name.
+    - batch_size (int): Number of rows per transaction.
+    - keep_ids (bool): Keep the primary key of each row. Rows whose id already exists are skipped.
+    - defer_indexes (bool): Drop and rebuild the non-unique indexes around the load.
+
+    Returns:
+    - int: Number of rows inserted.
+
+    Raises:
+    - PartialImport: Loading failed; carries how many rows were committed before the failure.
+    """
+    _check_table(table)
+    table_info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = [column[1] for column in table_info if keep_ids or not column[5]]
+    query = (f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+             f"VALUES ({', '.join('?' for _ in columns)})")
+
+    indexes = _index_statements(conn, table) if defer_indexes else []
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+
+    inserted = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(tuple(row.get(column) for column in columns))
+            if len(batch) >= batch_size:
+                inserted += _insert_batch(conn, query, batch)
+                batch = []
+        if batch:
+            inserted += _insert_batch(conn, query, batch)
+    except Exception as e:
+        raise PartialImport(e, inserted) from e
+    finally:
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.commit()
+    return inserted
+
+
+def _insert_batch(conn, query, batch):
+    with conn:
+        cursor = conn.executemany(query, batch)
+    return cursor.rowcount
+
+
+def write_ndjson(rows, fileobj, compress=False):
+    """
+    Writes rows to a binary file as NDJSON.
+
+    Returns:
+    - int: Number of bytes written.
+    """
+    written = 0
+    for chunk in iter_ndjson(rows, compress=compress):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def export_table(conn, table, fileobj, compress=False):
+    """
+    Writes a table to a binary file as NDJSON, row by row as stored. Archived story_data rows
+    are stubs whose content is in the cold store; export those with StoryDatabase.iter_stories.
+
+    Returns:
+    - int: Number of bytes written.
+    """
+    return write_ndjson(iter_table(conn, table), fileobj, compress=compress)
+
+
+def import_table(conn, table, fileobj, batch_size=5000, keep_ids=True):
+    """
+    Loads an NDJSON (or gzipped NDJSON) file into a table.
+
+    Returns:
+    - int: Number of rows inserted.
+    """
+    return bulk_insert(conn, table, read_ndjson(fileobj), batch_size=batch_size, keep_ids=keep_ids)
+
+
+def main():
+    """
+    CLI for exporting and importing the story archive. story_data goes through StoryDatabase,
+    so archived stories are exported with their content from the cold store and imported
+    stories get their content hashes.
+
+    Examples:
+    - python story_archive.py export backup.ndjson.gz --gzip
+    - python story_archive.py import backup.ndjson.gz --db new_story_data.db
+    """
+    parser = argparse.ArgumentParser(description="Export or import the story archive as NDJSON.")
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('path', help="NDJSON file to write or read ('-' for stdout/stdin).")
+    parser.add_argument('--table', default='story_data', choices=sorted(ARCHIVE_TABLES))
+    parser.add_argument('--db', help="Database file (defaults to the table's usual database).")
+    parser.add_argument('--gzip', action='store_true', help="Compress the export with gzip.")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows per import transaction.")
+    parser.add_argument('--new-ids', action='store_true', help="Assign new ids instead of keeping exported ones.")
+    args = parser.parse_args()
+
+    path = args.db or ARCHIVE_TABLES[args.table]
+    errors = (sqlite3.Error, OSError, ValueError, PartialImport)
+    if args.table == 'story_data':
+        # Imported here since database imports this module. Run as a script, this module is
+        # __main__, and StoryDatabase raises the PartialImport of story_archive instead.
+        from database import PartialImport as DatabasePartialImport, StoryDatabase
+        errors += (DatabasePartialImport,)
+        db = StoryDatabase(path, cache_entries=0)
+        export_rows = db.iter_stories
+        import_rows = lambda rows: db.import_stories(rows, batch_size=args.batch_size, keep_ids=not args.new_ids)
+        close = db.close
+    else:
+        conn = sqlite3.connect(path)
+        export_rows = lambda: iter_table(conn, args.table)
+        import_rows = lambda rows: bulk_insert(conn, args.table, rows, batch_size=args.batch_size,
+                                               keep_ids=not args.new_ids)
+        close = conn.close
+    try:
+        if args.action == 'export':
+            if args.path == '-':
+                write_ndjson(export_rows(), sys.stdout.buffer, compress=args.gzip)
+            else:
+                with open(args.path, 'wb') as f:
+                    written = write_ndjson(export_rows(), f, compress=args.gzip)
+                logging.info(f"Exported {args.table} to {args.path} ({written} bytes)")
+        else:
+            source = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+            with source:
+                inserted = import_rows(read_ndjson(source))
+            logging.info(f"Imported {inserted} rows into {args.table}")
+    except errors as e:
+        logging.error(f"Archive {args.action} failed: {e}")
+        raise SystemExit(1)
+    finally:
+        close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+import logging
+import threading
+from time import sleep
+
+from storybook.breaker import CircuitBreaker
+from storybook.policy import (CONTINUATION, FIRST_PAGE, CallPolicy, ExecutionPolicy, hedge_percentile_from_env,
+                              tiers_from_env)
+from storybook.segments import response_format
+from storybook.tracing import span
+
+ASSISTANTS = 'assistants'
+CHAT = 'chat'
+
+
+def chat_completion(tier, messages, call_type, structured):
+    """
+    One chat.completions request with the tier's client and model.
+
+    Returns:
+    - tuple: (reply text, total tokens spent).
+    """
+    extra = {'response_format': response_format()} if structured else {}
+    with span('openai.chat.completions', model=tier.model, call_type=call_type, messages=len(messages)) as call_span:
+        response = tier.client.chat.completions.create(model=tier.model, messages=messages, **extra)
+        reply = response.choices[0].message.content
+        usage = getattr(response, 'usage', None)
+        call_span.set(chars=len(reply or ''), prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                      completion_tokens=getattr(usage, 'completion_tokens', None))
+    return reply, getattr(usage, 'total_tokens', None) or 0
+
+
+class AssistantsEngine:
+    """
+    Sends turns through the Assistants API, which keeps the conversation in a server-side thread.
+    Every turn is at least four sequential requests: messages.create, runs.create, runs.retrieve
+    every half second until the run finishes, and messages.list.
+    """
+    name = ASSISTANTS
+
+    def __init__(self, client, model, instructions, structured):
+        """
+        Parameters:
+        - client (OpenAI): API client.
+        - model (str): Default model; STORY_MODELS_<TYPE> adds fallbacks.
+        - instructions (str): The assistant's instructions.
+        - structured (bool): Ask for schema-validated JSON segments.
+        """
+        self.client = client
+        self.structured = structured
+        self.instructions = instructions
+        self.assistant = client.beta.assistants.create(name="Script Writer", instructions=instructions, model=model)
+        self.thread = self.create_thread()
+        # A thread allows one active run at a time, so runs are never hedged here; a failed
+        # run is retried on the next model in STORY_MODELS_<TYPE> instead. Fallback endpoints
+        # do not apply either, since the thread lives on this one.
+        # The breaker fails calls fast while the API is down; see Author.degraded_segment.
+        self.policy = ExecutionPolicy({
+            call_type: CallPolicy(tiers_from_env(call_type, model, client), hedge_percentile=None)
+            for call_type in (FIRST_PAGE, CONTINUATION)
+        }, breaker=CircuitBreaker.from_env())
+
+    def create_thread(self):
+        """
+        Creates a new thread for communication with the OpenAI assistant.
+
+        Returns:
+        - Thread object if successful, None otherwise.
+        """
+        try:
+            return self.client.beta.threads.create()
+        except Exception as e:
+            logging.error(f"Error creating OpenAI thread: {e}")
+            return None
+
+    def create_message(self, text_input, role="user"):
+        """
+        Adds a message to the thread.
+
+        Returns:
+        - Message object.
+
+        Raises:
+        - ValueError: The input is empty.
+        - openai.OpenAIError: The message could not be created.
+        """
+        if not text_input:
+            raise ValueError("Empty input provided to create_message.")
+        with span('openai.messages.create', chars=len(text_input)):
+            return self.client.beta.threads.messages.create(thread_id=self.thread.id, role=role,
+                                                            content=text_input)
+
+    def new_story(self):
+        # Stories share the one thread, as they always have
+        pass
+
+    def turn(self, text_input, call_type=CONTINUATION):
+        """
+        Sends the input to the thread, runs the assistant and waits for its reply. The whole
+        turn runs under the policy, so a failure at any step counts towards the breaker.
+
+        Returns:
+        - str: The raw reply, or None if the run left no reply.
+
+        Raises:
+        - Exception: The last error when the turn failed on every tier.
+        """
+        message = None
+
+        def call(tier):
+            nonlocal message
+            # A fallback tier reuses the message rather than adding it to the thread again
+            if message is None:
+                message = self.create_message(text_input)
+            self.run_assistant(tier)
+            with span('openai.messages.list') as list_span:
+                messages = self.client.beta.threads.messages.list(thread_id=self.thread.id, order='asc',
+                                                                  after=message.id)
+                for m in messages:
+                    reply = m.content[0].text.value
+                    list_span.set(chars=len(reply))
+                    return reply
+            return None
+
+        return self.policy.run(call_type, call)
+
+    def run_assistant(self, tier):
+        """
+        Runs the assistant on the thread with the tier's model and waits for it to finish.
+        Raises if the run does not complete, so the policy can fall back to the next model.
+        """
+        with span('openai.runs.create', model=tier.model):
+            run = tier.client.beta.threads.runs.create(
+                thread_id=self.thread.id,
+                assistant_id=self.assistant.id,
+                model=tier.model,
+                **({'response_format': response_format()} if self.structured else {}),
+            )
+        # One span for the whole poll loop: how many polls, and how long the run sat queued
+        with span('openai.runs.poll', model=tier.model) as poll_span:
+            polls = 0
+            queued_polls = 0
+            while run.status == 'queued' or run.status == 'in_progress':
+                queued_polls += run.status == 'queued'
+                run = tier.client.beta.threads.runs.retrieve(thread_id=self.thread.id, run_id=run.id)
+                polls += 1
+                sleep(.5)
+            usage = getattr(run, 'usage', None)
+            poll_span.set(polls=polls, queued_polls=queued_polls, status=run.status,
+                          prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                          completion_tokens=getattr(usage, 'completion_tokens', None))
+        if run.status != 'completed':
+            raise RuntimeError(f"Run {run.status}: {run.last_error}")
+        return run
+
+    def seed(self, command, page):
+        """
+        Adds a prompt and a ready-made reply to the thread, as if the assistant had written it.
+
+        Returns:
+        - bool: True once the thread is seeded.
+
+        Raises:
+        - Exception: A message could not be created, or the breaker is open.
+        """
+        def call():
+            self.create_message(command)
+            self.create_message(page, role="assistant")
+            return True
+        return self.policy.guarded(call)
+
+    def complete(self, text_input, call_type=FIRST_PAGE):
+        """
+        Answers the input in a one-off chat completion with the assistant's instructions and
+        models, under the policy, leaving the thread alone. Used for pages written ahead of
+        time, which are added to the thread with seed once served.
+
+        Returns:
+        - tuple: (raw reply, tokens spent).
+        """
+        messages = [{'role': 'system', 'content': self.instructions}, {'role': 'user', 'content': text_input}]
+        return self.policy.run(call_type, lambda tier: chat_completion(tier, messages, call_type, self.structured))
+
+
+class ChatEngine:
+    """
+    Sends turns through chat.completions, keeping the conversation here: one request per turn
+    with the instructions, the story's opening exchange and the latest history_messages
+    messages. Requests are self-contained, so unlike runs they can be hedged and fall back
+    to other endpoints (see storybook.policy).
+    """
+    name = CHAT
+
+    def __init__(self, client, model, instructions, structured, make_client=None, history_messages=40):
+        """
+        Parameters:
+        - client (OpenAI): API client.
+        - model (str): Default model; STORY_MODELS_<TYPE> adds fallbacks.
+        - instructions (str): The system message.
+        - structured (bool): Ask for schema-validated JSON segments.
+        - make_client (callable, optional): Builds a client for a fallback base_url.
+        - history_messages (int): Most recent messages sent besides the opening exchange.
+        """
+        self.client = client
+        self.structured = structured
+        self.instructions = instructions
+        self.history_messages = history_messages
+        self.history = []
+        self.lock = threading.Lock()
+        self.policy = ExecutionPolicy({
+            call_type: CallPolicy(tiers_from_env(call_type, model, client, make_client),
+                                  hedge_percentile=hedge_percentile_from_env(call_type, 0.95))
+            for call_type in (FIRST_PAGE, CONTINUATION)
+        }, breaker=CircuitBreaker.from_env())
+
+    def new_story(self):
+        with self.lock:
+            self.history = []
+
+    def messages(self, text_input):
+        """
+        Returns:
+        - list[dict]: The request for a turn: instructions, opening exchange, recent history, then the input.
+        """
+        with self.lock:
+            opening, rest = self.history[:2], self.history[2:]
+            recent = rest[-self.history_messages:] if self.history_messages else []
+        return [{'role': 'system', 'content': self.instructions}, *opening, *recent,
+                {'role': 'user', 'content': text_input}]
+
+    def turn(self, text_input, call_type=CONTINUATION):
+        """
+        Sends the conversation and the input in one request. The exchange joins the history
+        only once it succeeds, so a failed turn can simply be retried.
+
+        Returns:
+        - str: The raw reply.
+        """
+        messages = self.messages(text_input)
+        reply, _ = self.policy.run(call_type, lambda tier: chat_completion(tier, messages, call_type, self.structured))
+        if reply:
+            with self.lock:
+                self.history += [messages[-1], {'role': 'assistant', 'content': reply}]
+        return reply
+
+    def seed(self, command, page):
+        """
+        Adds a prompt and a ready-made reply to the history, as if the model had written it.
+
+        Returns:
+        - bool: Always True; nothing is sent.
+        """
+        with self.lock:
+            self.history += [{'role': 'user', 'content': command}, {'role': 'assistant', 'content': page}]
+        return True
+
+    def complete(self, text_input, call_type=FIRST_PAGE):
+        """
+        Answers the input in a request of its own, under the policy, without touching the
+        history. Used for pages written ahead of time, which join the history through seed.
+
+        Returns:
+        - tuple: (raw reply, tokens spent).
+        """
+        messages = [{'role': 'system', 'content': self.instructions}, {'role': 'user', 'content': text_input}]
+        return self.policy.run(call_type, lambda tier: chat_completion(tier, messages, call_type, self.structured))
+
+
+ENGINES = {ASSISTANTS: AssistantsEngine, CHAT: ChatEngine}
+
+
+def make_engine(name, client, model, instructions, structured, make_client=None, history_messages=40):
+    """
+    Builds the story engine called name: 'chat' or 'assistants'.
+    """
+    if name == CHAT:
+        return ChatEngine(client, model, instructions, structured, make_client, history_messages)
+    if name == ASSISTANTS:
+        return AssistantsEngine(client, model, instructions, structured)
+    raise ValueError(f"Unknown story engine {name}; expected one of {sorted(ENGINES)}")
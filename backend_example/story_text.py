@@ -2,36 +2,86 @@ from time import sleep
 from openai import OpenAI, OpenAIError
 import logging
 import os 
+import random
 from dotenv import load_dotenv
 from database import StoryDatabase
 
+from storybook.http_clients import openai_http_client
+from storybook.policy import CONTINUATION, FIRST_PAGE
+from storybook.segments import SEGMENT_INSTRUCTIONS, parse_segment, render_segment
+from story_engines import CHAT, make_engine
+
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+WRITER_JOB = """You are an author for childrens books. Your job is to create
+                choose your own adventure style stories giving the child
+                the option to select various paths in a story. Stories should vary
+                based on genre and age of the child"""
+
+MODEL = os.getenv("STORY_MODEL", 'gpt-4o-mini-2024-07-18') #whatever model we end up using
+
+# How many recent stories of a genre and age degraded mode picks from
+DEGRADED_CANDIDATES = 20
+
+
+def first_page_prompt(genre, age, choice_count, length):
+    """
+    Builds the prompt that asks for the first page of a story.
+    Shared by Author.first_page and the offline pre-generation job so cached pages match live ones.
+    """
+    return f"""Write the first page of an interactive {genre} story for a {age} year
+                    old child. Give the reader {choice_count} choices per story segment. Only create one
+                    segment at a time before hearing what the reader chooses then move on from there. Try to keep
+                    the story to a {length} length. Always end the story with "The End" and
+                    don't say anything past that. No need to give "turn to page" sections at the end of choices."""
+
+
+def warm_key(genre, age, choice_count, length):
+    """
+    Warm pool key for a first page configuration. Everything is a string so that
+    values arriving as numbers or as text share a key.
+    """
+    return (str(genre), str(age), str(choice_count), str(length))
+
 
 class Author:
-    def __init__(self):
+    def __init__(self, structured=None, db=None, warm_pool=None, engine=None):
         """
         Represents an author that writes stories.
-        Initializes OpenAI API client and a database connection.
+        Initializes OpenAI API client, the story engine and a database connection.
+
+        Parameters:
+        - structured (bool, optional): Ask for schema-validated JSON segments instead of free text.
+          Defaults to the STRUCTURED_SEGMENTS environment variable (on unless set to 0).
+        - db (StoryDatabase, optional): Database to save stories to. Sharing the app's instance
+          keeps its story cache consistent; a new connection is opened when not given.
+        - warm_pool (storybook.warm_pool.WarmPool, optional): Ready first pages keyed by warm_key,
+          served before anything is generated.
+        - engine (str, optional): How turns reach the model, 'chat' or 'assistants' (see story_engines).
+          Defaults to the STORY_ENGINE environment variable, else 'chat'.
         """
-        writer_job = """You are an author for childrens books. Your job is to create
-                        choose your own adventure style stories giving the child
-                        the option to select various paths in a story. Stories should vary
-                        based on genre and age of the child"""
-        
+        if structured is None:
+            structured = os.getenv("STRUCTURED_SEGMENTS", "1") != "0"
+        self.structured = structured
+        self.warm_pool = warm_pool
         try:
-            self.client = OpenAI(api_key=os.getenv("GPT_API_KEY")) #whatever our key is
-            self.assistant = self.client.beta.assistants.create(
-                    name="Script Writer",
-                    instructions= writer_job,
-                    model = 'gpt-4o-mini-2024-07-18' #whatever model we end up using
-                )
-            self.thread = self.create_thread()
-
-            self.db = StoryDatabase()
+            # OPENAI_CASSETTE records or replays every call (see storybook.cassettes). The
+            # engine's execution policy hedges and falls back, so the client itself does not retry
+            self.client = OpenAI(api_key=os.getenv("GPT_API_KEY"), #whatever our key is
+                                 timeout=float(os.getenv("OPENAI_TIMEOUT", "60")),
+                                 max_retries=0, http_client=openai_http_client())
+            # The chat engine sends one request per turn and keeps the story's opening and the
+            # last CHAT_HISTORY_MESSAGES messages; the assistants engine keeps it in a thread
+            self.engine = make_engine(engine or os.getenv("STORY_ENGINE", CHAT), self.client, MODEL, WRITER_JOB,
+                                      structured, self.client_for,
+                                      int(os.getenv("CHAT_HISTORY_MESSAGES", "40")))
+            self.policy = self.engine.policy
+
+            self.owns_db = db is None
+            self.db = db or StoryDatabase()
         except OpenAIError as e:
             logging.error(f"OpenAI API initialization error: {e}")
             raise
@@ -39,46 +89,53 @@ class Author:
             logging.error(f"Error initializing Author: {e}")
             raise
 
-    def create_thread(self):
+    def client_for(self, base_url):
+        """
+        Builds a client for a fallback endpoint.
+        """
+        return OpenAI(api_key=os.getenv("FALLBACK_API_KEY") or os.getenv("GPT_API_KEY"), base_url=base_url,
+                      timeout=float(os.getenv("OPENAI_TIMEOUT", "60")), max_retries=0,
+                      http_client=openai_http_client())
+
+    def run_turn(self, text_input, call_type=CONTINUATION):
         """
-        Creates a new thread for communication with the OpenAI assistant.
+        Sends the input to the engine and waits for the reply.
+
+        Parameters:
+        - text_input (str): The user's choice or continuation input.
+        - call_type (str): Selects the fallback models (FIRST_PAGE or CONTINUATION).
 
         Returns:
-        - Thread object if successful, None otherwise.
+        - str: The raw reply, or None if the model left no reply.
+
+        Raises:
+        - Exception: The turn failed, or the circuit breaker is open.
         """
-        try:
-            thread = self.client.beta.threads.create()
-            return thread
-        except Exception as e:
-            logging.error(f"Error creating OpenAI thread: {e}")
-            return None
-    
-    def create_message(self, text_input):
+        if self.structured:
+            text_input = f"{text_input}\n\n{SEGMENT_INSTRUCTIONS}"
+        return self.engine.turn(text_input, call_type)
+
+    def execute_segment(self, text_input, call_type=CONTINUATION):
         """
-        Sends a message to the OpenAI thread.
+        Generates the next segment of the story as a parsed segment.
 
         Parameters:
-        - text_input (str): The input text to send.
+        - text_input (str): The user's choice or continuation input.
+        - call_type (str): FIRST_PAGE or CONTINUATION.
 
         Returns:
-        - Message object if successful, None otherwise.
+        - dict: Segment with title, body, choices and is_final (see storybook.segments),
+          or None if generation failed.
         """
-        if not text_input:
-            logging.error("Empty input provided to create_message.")
-            return None
         try:
-            message = self.client.beta.threads.messages.create(
-                thread_id=self.thread.id,
-                role="user",
-                content=text_input,
-            )
-            return message
+            response_text = self.run_turn(text_input, call_type)
+            return parse_segment(response_text) if response_text else None
+        except OpenAIError as e:
+            logging.error(f"OpenAI execution error: {e}")
+            return None
         except Exception as e:
-            logging.error(f"Error creating message: {e}")
+            logging.error(f"Error during story execution: {e}")
             return None
-        
-    def writer_thread(self):
-        return self.thread
 
     def execute(self, text_input):
         """
@@ -91,40 +148,24 @@ class Author:
         - str: Generated text response or an error message.
         """
         try:
-            message = self.create_message(text_input=text_input)
-            if not message:
+            response_text = self.run_turn(text_input)
+            if not response_text:
                 return "Failed to process your input. Please try again."
-            run = self.client.beta.threads.runs.create(
-                thread_id = self.thread.id,
-                assistant_id = self.assistant.id,
-            )
-            while run.status == 'queued' or run.status == 'in_progress':
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id = self.thread.id,
-                    run_id=run.id,
-                )
-                sleep(.5)
-            messages = self.client.beta.threads.messages.list(
-                thread_id=self.thread.id,
-                order='asc',
-                after=message.id
-                )
-            for m in messages:
-                response_text = m.content[0].text.value
-                if "The End" in response_text or "end of the story" in response_text:
-                    self.db_close()
-                    return "Thank you for reading. The story has concluded!"
-                return response_text
+            segment = parse_segment(response_text)
+            if segment['is_final']:
+                self.db_close()
+                return "Thank you for reading. The story has concluded!"
+            return render_segment(segment)
         except OpenAIError as e:
             logging.error(f"OpenAI execution error: {e}")
             return "Error generating story content. Please try again."
         except Exception as e:
             logging.error(f"Error during story execution: {e}")
             return "An unexpected error occurred."
-    
-    def first_page(self, genre, age, choice_count, length, key_moments=None):
+
+    def first_page_segment(self, genre, age, choice_count, length, key_moments=None):
         """
-        Generates the first page of the story.
+        Generates the first page of the story as a parsed segment and saves it.
 
         Parameters:
         - genre (str): The genre of the story.
@@ -134,25 +175,135 @@ class Author:
         - key_moments (list[str], optional): Key moments to include.
 
         Returns:
-        - str: The generated first page or an error message.
+        - dict: The first page as a segment, or None if generation failed and there was no
+          stored story to serve instead. Stored stories are flagged with degraded=True.
         """
-        command = f"""Write the first page of an interactive {genre} story for a {age} year
-                    old child. Give the reader {choice_count} choices per story segment. Only create one
-                    segment at a time before hearing what the reader chooses then move on from there. Try to keep
-                    the story to a {length} length. Always end the story with "The End" and
-                    don't say anything past that. No need to give "turn to page" sections at the end of choices."""
+        command = first_page_prompt(genre, age, choice_count, length)
+        self.engine.new_story()
         if key_moments:
             command += f" During the story, incorporate the following key moments given by the reader: {key_moments}"
-        response = self.execute(command)
-        if response and response != "Error during story generation":
+            segment = self.execute_segment(command, FIRST_PAGE)
+        else:
+            page = (self.serve_warm_page(command, genre, age, choice_count, length)
+                    or self.serve_starter_page(command, genre, age, choice_count, length))
+            segment = parse_segment(page) if page else self.execute_segment(command, FIRST_PAGE)
+        if segment is None:
+            # A degraded page is a story already stored, so it is returned without being saved again
+            return self.degraded_segment(genre, age, choice_count, length)
+        if segment:
             try:
-                self.db.save_story(genre, age, choice_count, length, response)
+                self.db.save_story(genre, age, choice_count, length, render_segment(segment),
+                                   title=segment['title'])
             except Exception as e:
                 logging.error(f"Error saving story to database: {e}")
-        return response
+        return segment
+
+    def first_page(self, genre, age, choice_count, length, key_moments=None):
+        """
+        Generates the first page of the story.
+
+        Parameters:
+        - genre (str): The genre of the story.
+        - age (int): Target age group.
+        - choice_count (int): Number of choices per segment.
+        - length (str): Story length (Short, Medium, Long).
+        - key_moments (list[str], optional): Key moments to include.
+
+        Returns:
+        - str: The generated first page or an error message.
+        """
+        segment = self.first_page_segment(genre, age, choice_count, length, key_moments)
+        if segment is None:
+            return "Error generating story content. Please try again."
+        return render_segment(segment)
+
+    def write_warm_page(self, key):
+        """
+        Warm pool generator: writes a first page for a warm_key configuration like a live one,
+        with the same prompt (and segment instructions and response format when structured output
+        is on) and through the engine's execution policy, but outside the current conversation.
+
+        Returns:
+        - tuple: (raw reply, tokens spent).
+
+        Raises:
+        - Exception: Every tier failed, or the circuit breaker is open.
+        """
+        command = first_page_prompt(*key)
+        if self.structured:
+            command = f"{command}\n\n{SEGMENT_INSTRUCTIONS}"
+        return self.engine.complete(command, FIRST_PAGE)
+
+    def serve_warm_page(self, command, genre, age, choice_count, length):
+        """
+        Serves a first page from the warm pool, which then refills in the background.
+        The page is added to the conversation like a starter page.
+
+        Returns:
+        - str: The page, or None if the pool has none ready for this configuration.
+        """
+        if self.warm_pool is None:
+            return None
+        page = self.warm_pool.pop(warm_key(genre, age, choice_count, length))
+        return self.seed_thread(command, page) if page else None
+
+    def serve_starter_page(self, command, genre, age, choice_count, length):
+        """
+        Serves a pre-generated first page for this configuration if one is stored.
+        The prompt and page are added to the conversation so the story can be continued as usual.
+
+        Returns:
+        - str: The stored first page, or None if there is none.
+        """
+        page = self.db.fetch_starter_page(genre, age, choice_count, length)
+        return self.seed_thread(command, page) if page else None
+
+    def seed_thread(self, command, page):
+        """
+        Adds a prompt and a ready-made reply to the conversation, as if the model had written it.
+
+        Returns:
+        - str: The page, or None if the conversation could not be seeded.
+        """
+        try:
+            return page if self.engine.seed(command, page) else None
+        except Exception as e:
+            logging.error(f"Error seeding thread with starter page: {e}")
+            return None
+
+    def degraded_segment(self, genre, age, choice_count, length):
+        """
+        Serves a stored story when a new one cannot be generated, e.g. while the circuit
+        breaker is open: a pre-generated first page for this configuration if there is one,
+        otherwise one of the recent stories of the same genre and age. Nothing is saved, and
+        the conversation is not seeded since the API is unavailable.
+
+        Returns:
+        - dict: The stored story as a segment with degraded=True, or None if nothing matches.
+        """
+        page = self.db.fetch_starter_page(genre, age, choice_count, length)
+        if not page:
+            recent = self.db.list_stories(genre=genre, age=age, limit=DEGRADED_CANDIDATES)
+            stories = self.db.fetch_story(story_id=random.choice(recent)['story_id']) if recent else []
+            page = stories[0]['content'] if stories else None
+        if not page:
+            return None
+        logging.info(f"Serving a stored {genre} story for age {age} in degraded mode")
+        segment = parse_segment(page)
+        segment['degraded'] = True
+        return segment
+
+    def retry_after(self):
+        """
+        Returns:
+        - float: Seconds until the circuit breaker lets model calls through again, 0 if it does now.
+        """
+        return self.policy.breaker.retry_after()
 
     def db_close(self):
-        self.db.close()
+        # A database passed in by the caller is theirs to close
+        if self.owns_db:
+            self.db.close()
 
 def main():
     """
@@ -0,0 +1,111 @@
+"""
+Compares backend_example's story engines turn by turn: requests sent and latency per turn.
+
+The OpenAI API is simulated behind the real client: every request costs --rtt-ms, and a reply
+takes --model-ms to write (log-normal jitter), inside the chat.completions request for the chat
+engine and while the run is in progress for the assistants engine, which polls for it every
+half second as Author always has.
+
+Example:
+- python benchmarks/bench_engines.py --turns 10 --output bench_engines.json
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+from openai import OpenAI
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / 'backend_example'), str(ROOT)]
+from story_engines import ASSISTANTS, CHAT, make_engine  # noqa: E402
+
+
+class SimulatedAPI:
+    def __init__(self, rtt_ms, model_ms, seed=0):
+        self.rtt = rtt_ms / 1000
+        self.model = model_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.messages = []
+        self.runs = {}
+
+    def write_time(self):
+        with self.lock:
+            return self.model * self.rng.lognormvariate(0, 0.3)
+
+    def __call__(self, request):
+        self.requests += 1
+        time.sleep(self.rtt)
+        path = request.url.path
+        body = json.loads(request.content) if request.content else {}
+        if path.endswith('/chat/completions'):
+            time.sleep(self.write_time())
+            return httpx.Response(200, json={
+                'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': "Title: Ember\nA page."}}]})
+        if path.endswith('/assistants') or path.endswith('/threads'):
+            return httpx.Response(200, json={'id': 'obj_1'})
+        if path.endswith('/messages') and request.method == 'POST':
+            self.messages.append(f"msg_{len(self.messages)}")
+            return httpx.Response(200, json={'id': self.messages[-1]})
+        if path.endswith('/messages'):
+            return httpx.Response(200, json={'object': 'list', 'data': [
+                {'id': 'msg_reply', 'content': [{'type': 'text', 'text': {
+                    'value': "Title: Ember\nA page.", 'annotations': []}}]}]})
+        if request.method == 'POST':
+            run_id = f"run_{len(self.runs)}"
+            self.runs[run_id] = time.perf_counter() + self.write_time()
+            return httpx.Response(200, json={'id': run_id, 'status': 'queued'})
+        run_id = path.rsplit('/', 1)[-1]
+        status = 'completed' if time.perf_counter() >= self.runs[run_id] else 'in_progress'
+        return httpx.Response(200, json={'id': run_id, 'status': status})
+
+
+def measure(name, args):
+    """
+    Returns:
+    - dict: Requests per turn and p50/max turn latency in ms for the engine called name.
+    """
+    api = SimulatedAPI(args.rtt_ms, args.model_ms)
+    client = OpenAI(api_key='sk-bench', base_url='https://api.bench/v1', max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(api)))
+    engine = make_engine(name, client, 'gpt-bench', "You write stories.", structured=False)
+    engine.seed("Write the first page.", "Title: Ember\nOnce upon a time.")
+    setup = api.requests
+    latencies = []
+    for turn in range(args.turns):
+        start = time.perf_counter()
+        engine.turn(f"Choice {turn % 3 + 1}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        'requests_per_turn': round((api.requests - setup) / args.turns, 2),
+        'turn_p50_ms': round(statistics.median(latencies), 1),
+        'turn_max_ms': round(max(latencies), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--rtt-ms', type=float, default=80, help="Simulated network time per request")
+    parser.add_argument('--model-ms', type=float, default=1500, help="Simulated time to write one segment")
+    parser.add_argument('--output', help="Write the results here as well as to stdout")
+    args = parser.parse_args()
+
+    report = {'config': vars(args), 'results': {name: measure(name, args) for name in (ASSISTANTS, CHAT)}}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Measures what hedging and model fallback do to tail latency, against a local fake
+chat-completions server with injected slowness.
+
+A fraction of requests (--slow-rate) stall for --slow-seconds; the rest answer after
+--base-ms. The same calls are run with hedging off and on, and a final run points the
+primary at a model the server fails, so calls fall back until the primary is marked degraded.
+
+Example:
+- python benchmarks/bench_hedging.py --calls 400 --slow-rate 0.05
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from openai import OpenAI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from storybook.policy import FIRST_PAGE, CallPolicy, ExecutionPolicy, Tier, percentile  # noqa: E402
+
+BROKEN_MODEL = 'broken-model'
+
+
+def make_handler(base_seconds, slow_rate, slow_seconds, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class SlowChatHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if body['model'] == BROKEN_MODEL:
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            with lock:
+                slow = rng.random() < slow_rate
+            time.sleep(slow_seconds if slow else base_seconds * (0.5 + rng.random()))
+            payload = json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": body['model'],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Title: Bench\nOnce upon a time."}}],
+            }).encode()
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return SlowChatHandler
+
+
+def run_calls(policy, client, calls, concurrency):
+    def call(tier):
+        response = tier.client.chat.completions.create(
+            model=tier.model, messages=[{"role": "user", "content": "Write a page."}])
+        return response.choices[0].message.content
+
+    latencies = []
+    lock = threading.Lock()
+    remaining = iter(range(calls))
+
+    def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            policy.run(FIRST_PAGE, call)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = policy.stats()[FIRST_PAGE]
+    return {
+        'calls': calls,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'hedge_rate': stats['hedge_rate'],
+        'hedge_wins': stats['hedge_wins'],
+        'fallbacks': stats['fallbacks'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hedged requests and model fallback.")
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--base-ms', type=float, default=20)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-seconds', type=float, default=1.0)
+    parser.add_argument('--percentile', type=float, default=0.9, help="Hedge past this latency percentile")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)  # the fallback run logs every failed primary call
+
+    handler = make_handler(args.base_ms / 1000, args.slow_rate, args.slow_seconds, args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+
+    results = {}
+    for name, hedge_percentile, models in (('baseline', None, ['bench-model']),
+                                           ('hedged', args.percentile, ['bench-model']),
+                                           ('fallback', args.percentile, [BROKEN_MODEL, 'bench-model'])):
+        policy = ExecutionPolicy({FIRST_PAGE: CallPolicy(
+            [Tier(model, client) for model in models], hedge_percentile=hedge_percentile,
+            degrade_after=3, cooldown=3600)})
+        results[name] = run_calls(policy, client, args.calls, args.concurrency)
+
+    baseline, hedged = results['baseline']['p99_ms'], results['hedged']['p99_ms']
+    results['p99_improvement'] = round(1 - hedged / baseline, 4) if baseline else None
+    results['config'] = vars(args)
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Measures what connection reuse saves: per-request latency and connections opened, for the
+Streamlit pages calling the backend and for Authors calling OpenAI.
+
+A local keep-alive server stands in for both. Each new connection costs --handshake-ms before its
+first response (the TCP and TLS setup a remote host would cost), each request --rtt-ms.
+
+- frontend: requests.get per click (a new connection each time) vs the shared backend_session().
+- openai: one OpenAI client per Author with its own default pool vs clients over the shared transport.
+
+Example:
+- python benchmarks/bench_http.py --requests 50 --output bench_http.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import requests
+from openai import OpenAI
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from storybook.http_clients import backend_session, openai_http_client  # noqa: E402
+
+
+class SimulatedHost(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handshake_ms, rtt_ms):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.handshake = handshake_ms / 1000
+        self.rtt = rtt_ms / 1000
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        self.reply(b'{"object": "list", "data": []}')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.reply(b'{"object": "list", "data": []}')
+
+    def reply(self, body):
+        time.sleep(self.server.rtt)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(host, call, count):
+    host.connections = 0
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        call(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'requests': count,
+        'connections': host.connections,
+        'p50_ms': round(statistics.median(timings), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request and pooled HTTP clients.")
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--requests-per-author', type=int, default=2,
+                        help="OpenAI requests each Author makes before the next one is created.")
+    parser.add_argument('--handshake-ms', type=float, default=60)
+    parser.add_argument('--rtt-ms', type=float, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    os.environ.pop('OPENAI_CASSETTE', None)
+
+    host = SimulatedHost(args.handshake_ms, args.rtt_ms)
+    threading.Thread(target=host.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{host.server_port}"
+
+    def author_calls(make_http_client):
+        clients = {}
+
+        def call(i):
+            author = i // args.requests_per_author
+            if author not in clients:
+                clients.clear()
+                clients[author] = OpenAI(api_key="bench", base_url=url, http_client=make_http_client())
+            clients[author].models.list()
+        return call
+
+    results = {
+        'frontend': {
+            'per_request': measure(host, lambda i: requests.get(f"{url}/api/stories"), args.requests),
+            'session': measure(host, lambda i: backend_session().get(f"{url}/api/stories"), args.requests),
+        },
+        'openai': {
+            'per_author': measure(host, author_calls(httpx.Client), args.requests),
+            'shared': measure(host, author_calls(openai_http_client), args.requests),
+        },
+    }
+    host.shutdown()
+
+    for side, variants in results.items():
+        for name, result in variants.items():
+            print(f"{side:9} {name:12} connections={result['connections']:3}  "
+                  f"p50={result['p50_ms']:7.2f} ms  mean={result['mean_ms']:7.2f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures the bytes a History page and a story view download with the original generated
+PNGs versus the resized WebP/JPEG files of storybook.images.ImageStore.
+
+The default image is a synthetic 512x512 illustration (smooth shading, shapes and grain);
+pass --image to measure a real one.
+
+Example:
+- python benchmarks/bench_images.py --stories 20 --pages 3
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from storybook.images import FORMATS, ImageStore  # noqa: E402
+
+
+def synthetic_illustration(size=512, seed=1):
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    image = Image.merge('RGB', (image.getchannel(0), image.getchannel(0).rotate(90), Image.new('L', (size, size), 160)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(30):
+        x, y, r = rng.randrange(size), rng.randrange(size), rng.randrange(10, 80)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(2))
+    grain = Image.effect_noise((size, size), 12).convert('RGB')
+    image = Image.blend(image, grain, 0.08)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image bytes per page view.")
+    parser.add_argument('--image', help="A generated PNG to measure instead of the synthetic one")
+    parser.add_argument('--stories', type=int, default=20, help="Stories on a History page")
+    parser.add_argument('--pages', type=int, default=3, help="Illustrations per story")
+    parser.add_argument('--thumbnail-width', type=int, default=256)
+    parser.add_argument('--view-width', type=int, default=512)
+    args = parser.parse_args()
+
+    original = Path(args.image).read_bytes() if args.image else synthetic_illustration()
+    with tempfile.TemporaryDirectory() as root:
+        store = ImageStore(root)
+        asset_id = store.ingest(original)
+        sizes = {f"{width}.{fmt}": store.path(asset_id, width, fmt).stat().st_size
+                 for width in store.widths for fmt, _ in FORMATS}
+        thumbnail = store.pick_width(args.thumbnail_width)
+        view = store.pick_width(args.view_width)
+
+    images_per_history_page = args.stories * args.pages
+    results = {'original_png': len(original), 'variants': sizes, 'pages': {}}
+    for fmt, _ in FORMATS:
+        history = sizes[f"{thumbnail}.{fmt}"] * images_per_history_page
+        story = sizes[f"{view}.{fmt}"] * args.pages
+        results['pages'][fmt] = {
+            'history_bytes': history, 'history_png_bytes': len(original) * images_per_history_page,
+            'history_reduction': round(1 - history / (len(original) * images_per_history_page), 3),
+            'story_bytes': story, 'story_png_bytes': len(original) * args.pages,
+            'story_reduction': round(1 - story / (len(original) * args.pages), 3),
+        }
+    print(json.dumps({'results': results, 'config': vars(args)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
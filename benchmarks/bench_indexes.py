@@ -0,0 +1,91 @@
+"""
+Benchmarks the story_data query shapes with the original single-column indexes and with
+the composite/covering indexes added by the schema migrations.
+
+Example:
+- python benchmarks/bench_indexes.py --rows 1000000 --content-bytes 300
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "backend_example"), str(ROOT)]
+from database import StoryDatabase  # noqa: E402
+
+GENRES = ["Fantasy", "Sci-Fi", "Mystery", "Adventure"]
+
+
+def synthetic_rows(count, content_bytes, seed=0):
+    rng = random.Random(seed)
+    filler = "word " * (content_bytes // 5)
+    for i in range(count):
+        yield {
+            'genre': rng.choice(GENRES),
+            'age': rng.randint(5, 12),
+            'choice_count': rng.randint(2, 4),
+            'segment_count': rng.randint(1, 5),
+            'content': f"Title: Story {i}\n{filler}",
+            'title': f"Story {i}",
+            'word_count': content_bytes // 5 + 2,
+            'created_at': f"2024-01-01 00:00:{i % 60:02d}",
+        }
+
+
+def use_original_indexes(conn):
+    conn.execute("DROP INDEX IF EXISTS idx_genre_age")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_genre ON story_data (genre)")
+    conn.commit()
+
+
+def time_queries(db, repeat):
+    rng = random.Random(1)
+    cases = {
+        'fetch_story(genre, age)': lambda: db.fetch_story(genre=rng.choice(GENRES), age=rng.randint(5, 12)),
+        'list_stories(genre, age, limit=20)': lambda: db.list_stories(
+            genre=rng.choice(GENRES), age=rng.randint(5, 12), limit=20),
+    }
+    results = {}
+    for name, query in cases.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        results[name] = round((time.perf_counter() - started) / repeat * 1000, 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--content-bytes', type=int, default=300, help="Size of each story's content.")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Without the story cache every query reaches SQLite; dropping an index does not invalidate it
+        db = StoryDatabase(os.path.join(tmpdir, 'bench.db'), cache_entries=0)
+        started = time.perf_counter()
+        db.import_stories(synthetic_rows(args.rows, args.content_bytes), keep_ids=False)
+        load_seconds = round(time.perf_counter() - started, 2)
+
+        migrated = time_queries(db, args.repeat)
+        use_original_indexes(db.sqlconn)
+        original = time_queries(db, args.repeat)
+        db.close()
+
+    print(json.dumps({
+        'rows': args.rows,
+        'load_seconds': load_seconds,
+        'ms_per_query': {'original_indexes': original, 'migrated_indexes': migrated},
+        'sqlite_version': sqlite3.sqlite_version,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares writing a multi-page story in one completion with the outline-then-parallel
+pipeline (storybook.outline.write_story), against a local fake chat-completions server
+whose latency grows with the number of words it is asked for, like a real model.
+
+Example:
+- python benchmarks/bench_pages.py --ms-per-word 2 --max-pages 5
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from openai import OpenAI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from storybook.outline import WORDS_PER_PAGE, story_prompt, write_story  # noqa: E402
+
+OUTLINE_WORDS_PER_PAGE = 40
+
+
+def make_handler(seconds_per_word):
+    class FakeModelHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            prompt = body['messages'][-1]['content']
+            schema = (body.get('response_format') or {}).get('json_schema', {}).get('name')
+            if schema == 'story_outline':
+                pages = int(re.search(r"is (\d+) pages long", prompt).group(1))
+                words = OUTLINE_WORDS_PER_PAGE * pages
+                content = json.dumps({"title": "Bench", "characters": "A cat.", "setting": "A town.",
+                                      "pages": [{"beat": f"Beat {i}"} for i in range(pages)]})
+            else:
+                match = re.search(r"exactly (\d+) page", prompt)
+                words = WORDS_PER_PAGE * (int(match.group(1)) if match else 1)
+                content = " ".join(["word"] * words)
+            time.sleep(words * seconds_per_word)
+            payload = json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": body['model'],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeModelHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-call vs outline-then-parallel story writing.")
+    parser.add_argument('--ms-per-word', type=float, default=2.0, help="Simulated generation speed")
+    parser.add_argument('--max-pages', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=5, help="Pages written at the same time")
+    parser.add_argument('--consistency', action='store_true', help="Include the consistency pass")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.ms_per_word / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+
+    def complete(text, call_type=None, json_format=None):
+        extra = {'response_format': json_format} if json_format else {}
+        response = client.chat.completions.create(
+            model='bench-model', messages=[{"role": "user", "content": text}], **extra)
+        return response.choices[0].message.content
+
+    results = []
+    for pages in range(1, args.max_pages + 1):
+        start = time.perf_counter()
+        complete(story_prompt("a cat", pages))
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        story, _ = write_story("a cat", pages, complete, max_workers=args.workers, consistency=args.consistency)
+        parallel = time.perf_counter() - start
+        assert story, "the pipeline failed"
+        results.append({'pages': pages, 'single_call_s': round(single, 3), 'parallel_s': round(parallel, 3),
+                        'speedup': round(single / parallel, 2)})
+
+    server.shutdown()
+    print(json.dumps({'results': results, 'config': vars(args)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+End-to-end latency of the story flows with OpenAI recorded once and replayed after that
+(see storybook.cassettes), so runs are repeatable offline and in CI.
+
+Record a cassette against the real API once (needs GPT_API_KEY), then replay it at recorded
+speed, or at --speed 0 to measure only this code's overhead:
+- python benchmarks/bench_replay.py --app backend_example --mode record --cassette flows.jsonl
+- python benchmarks/bench_replay.py --app backend_example --cassette flows.jsonl --speed 1 --runs 5
+
+Replay matches requests by method, path and body, so the flow and the prompts must be the
+ones recorded. Warm pools are turned off, since their background calls are not deterministic.
+Illustration downloads (testing_streamlit) are plain HTTP, not OpenAI calls, and are not replayed.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ADVENTURE = {'genre': 'Fantasy', 'age': 7, 'choice_count': 2, 'page_count': 3}
+
+
+def backend_example_flow(app, turns):
+    """
+    Starts an adventure and continues it turns times, like the React frontend.
+    """
+    client = app.test_client()
+    timings = []
+    start = time.perf_counter()
+    response = client.post('/api/start-story', json={**ADVENTURE, 'page_count': 'Short', 'key_moments': ['a lost map']})
+    timings.append(('start-story', response.status_code, time.perf_counter() - start))
+    for _ in range(turns):
+        start = time.perf_counter()
+        response = client.post('/api/continue-story', json={'text': '1'})
+        timings.append(('continue-story', response.status_code, time.perf_counter() - start))
+    return timings
+
+
+def testing_streamlit_flow(app, turns):
+    """
+    Creates a two-page story and waits for its job, then plays an adventure like the Streamlit pages.
+    """
+    client = app.test_client()
+    timings = []
+    start = time.perf_counter()
+    job = client.post('/create_story', json={'prompt': 'a dragon who is afraid of the dark', 'pages': 2}).json
+    while job.get('status') not in ('succeeded', 'failed', 'cancelled'):
+        time.sleep(0.01)
+        job = client.get(f"/jobs/{job['job_id']}").json | {'job_id': job['job_id']}
+    timings.append(('create_story (job)', job['status'], time.perf_counter() - start))
+
+    start = time.perf_counter()
+    response = client.post('/start_story', json=ADVENTURE)
+    timings.append(('start_story', response.status_code, time.perf_counter() - start))
+    session_id = (response.json or {}).get('session_id')
+    for _ in range(turns):
+        start = time.perf_counter()
+        response = client.post('/continue_story', json={'user_input': '1', 'session_id': session_id, **ADVENTURE})
+        timings.append(('continue_story', response.status_code, time.perf_counter() - start))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=('backend_example', 'testing_streamlit'), default='backend_example')
+    parser.add_argument('--cassette', required=True)
+    parser.add_argument('--mode', choices=('record', 'replay'), default='replay')
+    parser.add_argument('--speed', type=float, default=1.0, help="Replayed latency multiplier; 0 answers at once")
+    parser.add_argument('--turns', type=int, default=3, help="Continuations per adventure")
+    parser.add_argument('--runs', type=int, default=1, help="Replays of the flow (record mode runs it once)")
+    args = parser.parse_args()
+
+    if args.mode == 'record' and os.path.exists(args.cassette):
+        parser.error(f"{args.cassette} exists; recording appends, so remove it first")
+    runs = 1 if args.mode == 'record' else args.runs
+    scratch = tempfile.TemporaryDirectory()
+    os.environ.update({'OPENAI_CASSETTE': str(Path(args.cassette).resolve()), 'OPENAI_CASSETTE_MODE': args.mode,
+                       'OPENAI_CASSETTE_SPEED': str(args.speed), 'WARM_POOL_DEPTH': '0',
+                       'IMAGE_DIR': os.path.join(scratch.name, 'images')})
+    if args.mode == 'replay':
+        os.environ.setdefault('GPT_API_KEY', 'replay')
+    # The apps keep their databases in the working directory
+    os.chdir(scratch.name)
+    sys.path[:0] = [str(ROOT / args.app), str(ROOT)]
+    from storybook.cassettes import cassette_transport
+
+    if args.app == 'backend_example':
+        from flask_db import app
+        flow = backend_example_flow
+    else:
+        from CreateStoryBackend import app
+        flow = testing_streamlit_flow
+
+    transport = cassette_transport()
+    runs_report = []
+    for run in range(runs):
+        if run:
+            transport.rewind()
+        timings = flow(app, args.turns)
+        steps = [{'step': step, 'status': status, 'seconds': round(seconds, 4)} for step, status, seconds in timings]
+        entry = {'steps': steps, 'total_seconds': round(sum(step['seconds'] for step in steps), 4)}
+        if args.mode == 'replay':
+            # Misses mean the flow asked for something not recorded, so its timings are not comparable
+            entry.update({'misses': transport.misses, 'unused_interactions': transport.remaining()})
+        runs_report.append(entry)
+
+    report = {'app': args.app, 'mode': args.mode, 'speed': args.speed, 'runs': runs_report}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
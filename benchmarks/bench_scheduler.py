@@ -0,0 +1,133 @@
+"""
+Simulates mixed generation load against storybook.scheduler.FairScheduler and against the
+first-come-first-served pool it replaced, and reports per-class latency.
+
+Model calls are replaced by sleeps (one page = --page-ms, log-normal jitter), so the run shows
+queueing alone. The load:
+- --light users play adventures: a continuation, then a pause to read it
+- one heavy user sends continuations back to back from --heavy-clients tabs and keeps
+  --heavy-stories long stories (--story-pages pages each) in flight
+- the warm pool keeps --prefetchers refills in flight
+
+Example:
+- python benchmarks/bench_scheduler.py --seconds 20 --output bench_scheduler.json
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from storybook.scheduler import BATCH, INTERACTIVE, PREFETCH, FairScheduler  # noqa: E402
+
+
+class FifoScheduler:
+    """
+    The baseline: every call shares one pool in arrival order, whoever makes it.
+    """
+
+    def __init__(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def run(self, user, fn, priority=INTERACTIVE, cost=1.0):
+        return self.pool.submit(fn).result()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else None
+
+
+def simulate(scheduler, args, seed=0):
+    """
+    Runs the load for args.seconds.
+
+    Returns:
+    - dict: per (who, class): requests completed and p50/p95/p99 latency in ms.
+    """
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+    latencies = {}
+    stop = time.perf_counter() + args.seconds
+
+    def service(pages):
+        with rng_lock:
+            jitter = rng.lognormvariate(0, 0.3)
+        time.sleep(pages * args.page_ms / 1000 * jitter)
+
+    def pause(ms):
+        with rng_lock:
+            seconds = rng.uniform(0.5, 1.5) * ms / 1000
+        time.sleep(seconds)
+
+    def client(who, user, priority, pages, think_ms):
+        samples = latencies.setdefault((who, priority), [])
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            scheduler.run(user, lambda: service(pages), priority, cost=pages)
+            samples.append((time.perf_counter() - start) * 1000)
+            if think_ms:
+                pause(think_ms)
+
+    clients = [(('light', f"reader-{i}", INTERACTIVE, 1, args.think_ms)) for i in range(args.light)]
+    clients += [('heavy', 'heavy', INTERACTIVE, 1, 0)] * args.heavy_clients
+    clients += [('heavy', 'heavy', BATCH, args.story_pages, 0)] * args.heavy_stories
+    clients += [('warm pool', 'warm-pool', PREFETCH, 1, 0)] * args.prefetchers
+    threads = [threading.Thread(target=client, args=spec) for spec in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {f"{who} {priority}": {
+        'requests': len(samples),
+        'p50_ms': round(percentile(samples, 0.5), 1),
+        'p95_ms': round(percentile(samples, 0.95), 1),
+        'p99_ms': round(percentile(samples, 0.99), 1),
+    } for (who, priority), samples in sorted(latencies.items()) if samples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent model calls")
+    parser.add_argument('--page-ms', type=float, default=40, help="Simulated time to write one page")
+    parser.add_argument('--light', type=int, default=8, help="Users reading adventures")
+    parser.add_argument('--think-ms', type=float, default=150, help="Reading time between continuations")
+    parser.add_argument('--heavy-clients', type=int, default=4)
+    parser.add_argument('--heavy-stories', type=int, default=2)
+    parser.add_argument('--story-pages', type=int, default=10)
+    parser.add_argument('--prefetchers', type=int, default=2)
+    parser.add_argument('--user-concurrency', type=int, default=2)
+    parser.add_argument('--reserved', type=int, default=1)
+    parser.add_argument('--output', help="Write the results here as well as to stdout")
+    args = parser.parse_args()
+
+    report = {'config': vars(args), 'results': {}}
+    for name, make in (('fifo', lambda: FifoScheduler(args.workers)),
+                       ('fair', lambda: FairScheduler(workers=args.workers, user_concurrency=args.user_concurrency,
+                                                      reserved=args.reserved, max_queued=math.inf))):
+        scheduler = make()
+        try:
+            report['results'][name] = simulate(scheduler, args)
+        finally:
+            scheduler.shutdown()
+        print(f"{name}: done", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Benchmarks both story stores as they grow: backend_example/database.py (StoryDatabase,
+story_data) and testing_streamlit/database.py (the stories table).
+
+At each table size the table is topped up with synthetic stories (word counts drawn from a
+log-normal distribution, genres and ages skewed like real traffic), then every operation runs
+at each concurrency level and reports throughput and latency percentiles. Results are JSON,
+with the commit they were measured at; --compare checks them against an earlier run.
+
+Examples:
+- python benchmarks/bench_storage.py --sizes 10000,100000,1000000 --output bench_storage.json
+- python benchmarks/bench_storage.py --sizes 10000 --compare bench_storage.json --tolerance 0.25
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "backend_example"), str(ROOT)]
+from database import StoryDatabase  # noqa: E402
+
+# Both apps name their module database.py, so the Streamlit one is loaded under another name
+_spec = importlib.util.spec_from_file_location("streamlit_database", ROOT / "testing_streamlit" / "database.py")
+streamlit_database = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(streamlit_database)
+
+# Genre and age mix of generated stories: a few genres dominate, most readers are 5-9
+GENRE_WEIGHTS = {"Fantasy": 35, "Adventure": 25, "Animals": 15, "Mystery": 10, "Sci-Fi": 8, "Fairy Tale": 5, "Horror": 2}
+AGE_WEIGHTS = {3: 3, 4: 6, 5: 12, 6: 16, 7: 18, 8: 15, 9: 11, 10: 8, 11: 6, 12: 5}
+# Reads whose result grows with the table; they only run up to --full-scan-max rows, fewer times
+UNBOUNDED = {'fetch_all_stories', 'fetch_story(genre, age)', 'get_all_stories'}
+
+VOCABULARY = ("the a cat dog moon forest castle dragon little brave curious friend happy ran jumped found "
+              "door tree river star night morning magic secret map boat wind hill asked said").split()
+
+
+class StoryGenerator:
+    """
+    Synthetic stories with a realistic shape: word counts are log-normal around median_words
+    (clamped to 40-4000), genres and ages follow GENRE_WEIGHTS and AGE_WEIGHTS.
+    """
+
+    def __init__(self, seed=0, median_words=350, sigma=0.6):
+        self.rng = random.Random(seed)
+        self.median_words = median_words
+        self.sigma = sigma
+        self.genres, self.genre_weights = zip(*GENRE_WEIGHTS.items())
+        self.ages, self.age_weights = zip(*AGE_WEIGHTS.items())
+        self.count = 0
+
+    def genre(self):
+        return self.rng.choices(self.genres, self.genre_weights)[0]
+
+    def age(self):
+        return self.rng.choices(self.ages, self.age_weights)[0]
+
+    def story(self):
+        self.count += 1
+        words = int(min(4000, max(40, self.rng.lognormvariate(math.log(self.median_words), self.sigma))))
+        title = f"The {self.rng.choice(VOCABULARY).title()} {self.rng.choice(VOCABULARY).title()} {self.count}"
+        body = " ".join(self.rng.choices(VOCABULARY, k=words))
+        return {
+            'genre': self.genre(),
+            'age': self.age(),
+            'choice_count': self.rng.randint(2, 4),
+            'segment_count': self.rng.randint(1, 8),
+            'title': title,
+            'content': f"Title: {title}\n{body}",
+            'word_count': words + len(title.split()),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1.7e9 + self.count)),
+        }
+
+
+class BackendExampleTarget:
+    """
+    StoryDatabase with its cache off, so every operation reaches SQLite.
+    """
+    name = 'backend_example'
+
+    def __init__(self, directory, generator):
+        self.db = StoryDatabase(os.path.join(directory, 'story_data.db'), cache_entries=0)
+        self.generator = generator
+
+    def rows(self):
+        return self.db.sqlconn.execute("SELECT COUNT(*) FROM story_data").fetchone()[0]
+
+    def grow(self, count):
+        self.db.import_stories((self.generator.story() for _ in range(count)), keep_ids=False)
+
+    def operations(self, rows):
+        max_id = self.db.sqlconn.execute("SELECT MAX(story_id) FROM story_data").fetchone()[0]
+        rng = random.Random(rows)
+        gen = self.generator
+
+        def save():
+            story = gen.story()
+            return self.db.save_story(story['genre'], story['age'], story['choice_count'],
+                                      story['segment_count'], story['content'], title=story['title'])
+
+        def delete():
+            # Deletes a story just saved, so the table size stays put
+            save()
+            return self.db.delete_story(self.db.sqlconn.execute("SELECT MAX(story_id) FROM story_data").fetchone()[0])
+
+        return {
+            'save_story': save,
+            'fetch_story(id)': lambda: self.db.fetch_story(story_id=rng.randint(1, max_id)),
+            'fetch_story(genre, age)': lambda: self.db.fetch_story(genre=gen.genre(), age=gen.age()),
+            'list_stories(limit=20)': lambda: self.db.list_stories(limit=20),
+            'list_stories(genre, age, limit=20)': lambda: self.db.list_stories(genre=gen.genre(), age=gen.age(), limit=20),
+            'save_story+delete_story': delete,
+            'fetch_all_stories': self.db.fetch_all_stories,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+class StreamlitTarget:
+    """
+    The module-level functions of testing_streamlit/database.py, pointed at a scratch file.
+    """
+    name = 'testing_streamlit'
+
+    def __init__(self, directory, generator):
+        streamlit_database.DB_NAME = os.path.join(directory, 'story_db.sqlite')
+        streamlit_database.init_db()
+        self.generator = generator
+
+    def _connect(self):
+        return sqlite3.connect(streamlit_database.DB_NAME)
+
+    def rows(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def grow(self, count):
+        # There is no bulk insert in this module, so the table is filled directly
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO stories (title, content, image_url) VALUES (?, ?, ?)",
+                             ((story['title'], story['content'], None)
+                              for story in (self.generator.story() for _ in range(count))))
+
+    def operations(self, rows):
+        with self._connect() as conn:
+            max_id = conn.execute("SELECT MAX(id) FROM stories").fetchone()[0]
+        rng = random.Random(rows)
+        gen = self.generator
+
+        def save():
+            story = gen.story()
+            return streamlit_database.save_story(story['title'], story['content']) is not None
+
+        return {
+            'save_story': save,
+            'get_story_images(10 ids)': lambda: streamlit_database.get_story_images(
+                [rng.randint(1, max_id) for _ in range(10)]),
+            'find_similar_story': lambda: streamlit_database.find_similar_story(
+                f"a {gen.genre()} story about a {rng.choice(VOCABULARY)}"),
+            'get_all_stories': streamlit_database.get_all_stories,
+        }
+
+    def close(self):
+        pass
+
+
+TARGETS = {target.name: target for target in (BackendExampleTarget, StreamlitTarget)}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(operation, concurrency, count):
+    """
+    Runs an operation count times spread over concurrency threads.
+
+    Returns:
+    - dict: ops, errors, seconds, ops_per_s and p50/p95/p99 latency in milliseconds.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(share):
+        local = []
+        for _ in range(share):
+            start = time.perf_counter()
+            try:
+                ok = operation()
+            except Exception:
+                ok = False
+            local.append((time.perf_counter() - start) * 1000)
+            if ok is False:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    shares = [count // concurrency + (i < count % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, shares))
+    seconds = time.perf_counter() - started
+    return {
+        'ops': count, 'errors': errors[0], 'seconds': round(seconds, 4),
+        'ops_per_s': round(count / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Prints each operation's p95 latency and throughput against a baseline run.
+
+    Returns:
+    - int: How many operations regressed by more than tolerance (a fraction).
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['target'], r['rows'], r['operation'], r['concurrency']): r for r in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        before = baseline.get((result['target'], result['rows'], result['operation'], result['concurrency']))
+        if before is None:
+            continue
+        p95_ratio = result['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+        throughput_ratio = result['ops_per_s'] / before['ops_per_s'] if before['ops_per_s'] else 1.0
+        regressed = p95_ratio > 1 + tolerance or throughput_ratio < 1 - tolerance
+        regressions += regressed
+        print(f"{'REGRESSED' if regressed else 'ok':9} {result['target']} rows={result['rows']} "
+              f"c={result['concurrency']} {result['operation']}: p95 x{p95_ratio:.2f}, throughput x{throughput_ratio:.2f}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="Table sizes to measure at, ascending")
+    parser.add_argument('--concurrency', default='1,4,16', help="Thread counts to run each operation with")
+    parser.add_argument('--ops', type=int, default=200, help="Operations per measurement")
+    parser.add_argument('--targets', default=','.join(TARGETS), help="Stores to benchmark")
+    parser.add_argument('--full-scan-max', type=int, default=100_000,
+                        help="Largest table to run reads returning a share of the whole table on")
+    parser.add_argument('--full-scan-ops', type=int, default=3, help="Operations per such read measurement")
+    parser.add_argument('--output', help="Write the results here as well as to stdout")
+    parser.add_argument('--compare', help="A previous --output file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # every save logs a line
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    levels = [int(level) for level in args.concurrency.split(',')]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for target_name in args.targets.split(','):
+            target = TARGETS[target_name](directory, StoryGenerator(seed=1))
+            for size in sizes:
+                started = time.perf_counter()
+                target.grow(size - target.rows())
+                print(f"{target_name}: {size} rows loaded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+                for name, operation in target.operations(size).items():
+                    if name in UNBOUNDED and size > args.full_scan_max:
+                        continue
+                    for concurrency in levels:
+                        result = measure(operation, concurrency, args.full_scan_ops if name in UNBOUNDED else args.ops)
+                        results.append({'target': target_name, 'rows': size, 'operation': name,
+                                        'concurrency': concurrency, **result})
+            target.close()
+
+    report = {
+        'commit': git_commit(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'python': platform.python_version(),
+        'config': vars(args),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
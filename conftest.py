@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The backend modules import each other by bare name because they are run from
+# inside backend_example/, so make that directory importable for the tests too.
+sys.path.insert(0, str(Path(__file__).parent / "backend_example"))
@@ -10,7 +10,7 @@ function History() {
   useEffect(() => {
     const fetchStories = async () => {
       try {
-        const response = await axios.get('http://127.0.0.1:5000/api/stories'); // Update the URL if needed
+        const response = await axios.get('http://127.0.0.1:5000/api/stories?view=summary'); // Metadata only, no story bodies
         setStories(response.data); // Assuming the API returns an array of stories
       } catch (err) {
         console.error('Error fetching stories:', err);
@@ -31,7 +31,7 @@ function History() {
         {stories.map((story) => (
           <li key={story.story_id} className="story-item">
             <Link to={`/story/${story.story_id}`} className="story-link">
-              <span role="img" aria-label="book">📖</span> {story.genre} - {story.content.slice(0, 50)}...
+              <span role="img" aria-label="book">📖</span> {story.genre} - {story.title}
             </Link>
           </li>
         ))}
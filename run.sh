@@ -0,0 +1,24 @@
+#!/bin/sh
+# Runs one of the apps' scripts from its own directory, with the repository root on PYTHONPATH
+# so the shared storybook package can be imported.
+#
+# Usage:
+#   ./run.sh backend_example/flask_db.py
+#   ./run.sh backend_example/database.py archive --vacuum
+#   ./run.sh testing_streamlit/CreateStoryBackend.py
+#   ./run.sh streamlit testing_streamlit/Home.py
+set -e
+ROOT=$(cd "$(dirname "$0")" && pwd)
+export PYTHONPATH="$ROOT${PYTHONPATH:+:$PYTHONPATH}"
+
+if [ "$1" = "streamlit" ]; then
+    shift
+    script=$1
+    shift
+    cd "$(dirname "$script")"
+    exec streamlit run "$(basename "$script")" "$@"
+fi
+script=$1
+shift
+cd "$(dirname "$script")"
+exec python "$(basename "$script")" "$@"
@@ -0,0 +1,6 @@
+"""
+Code shared by the Flask backend in backend_example/ and the Streamlit app in testing_streamlit/.
+
+Both apps are run from their own directories with the repository root on PYTHONPATH, which
+run.sh at the repository root sets up, e.g. ./run.sh backend_example/flask_db.py.
+"""
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a call while the circuit is open.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Model calls are paused; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated model call failures instead of letting every request wait them out.
+
+    Closed: calls go through and consecutive failures are counted. Reaching failure_threshold
+    opens the circuit. Open: calls are rejected with CircuitOpenError until reset_timeout has
+    passed. Half-open: one trial call is let through; success closes the circuit, failure
+    reopens it. Calls slower than slow_call_seconds count as failures even though their
+    result is still used.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, slow_call_seconds=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.counters = {'opened': 0, 'rejected': 0, 'failures': 0, 'slow_calls': 0}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a breaker from BREAKER_FAILURES, BREAKER_RESET_SECONDS and BREAKER_SLOW_SECONDS.
+        """
+        slow = os.getenv("BREAKER_SLOW_SECONDS")
+        return cls(failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+                   reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+                   slow_call_seconds=float(slow) if slow else None)
+
+    def retry_after(self):
+        """
+        Returns:
+        - float: Seconds until calls are let through again, 0 if they are now.
+        """
+        with self.lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def is_open(self):
+        """
+        Returns:
+        - bool: True while calls would be rejected.
+        """
+        return self.retry_after() > 0
+
+    def before_call(self):
+        """
+        Admits a call or raises CircuitOpenError. Moves an open circuit to half-open once
+        reset_timeout has passed, admitting a single trial call.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_timeout:
+                    self.counters['rejected'] += 1
+                    raise CircuitOpenError(self.reset_timeout - waited)
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == HALF_OPEN:
+                if self.trial_in_flight:
+                    self.counters['rejected'] += 1
+                    raise CircuitOpenError(self.reset_timeout)
+                self.trial_in_flight = True
+
+    def record_success(self, duration):
+        if self.slow_call_seconds is not None and duration > self.slow_call_seconds:
+            with self.lock:
+                self.counters['slow_calls'] += 1
+            self.record_failure()
+            return
+        with self.lock:
+            if self.state != CLOSED:
+                logging.info("Circuit closed: model calls are succeeding again")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.counters['failures'] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.counters['opened'] += 1
+                    logging.error(f"Circuit opened after {self.failures} failures; "
+                                  f"pausing model calls for {self.reset_timeout}s")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.failures = 0
+                self.trial_in_flight = False
+
+    def stats(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, **self.counters}
@@ -0,0 +1,181 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import httpx
+
+# Response headers worth keeping; the rest (dates, request ids, rate limit counters) vary per run
+KEPT_HEADERS = ('content-type', 'openai-model', 'openai-processing-ms')
+
+# Headers describing the encoded body; recorded responses are passed on decoded, so these are dropped
+ENCODING_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+
+def _body_key(content):
+    """
+    Canonical form of a request body, so bodies that differ only in key order match.
+    """
+    if not content:
+        return ""
+    try:
+        return json.dumps(json.loads(content), sort_keys=True, separators=(',', ':'))
+    except (ValueError, UnicodeDecodeError):
+        return base64.b64encode(content).decode('ascii')
+
+
+def _encode(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode(body):
+    if 'base64' in body:
+        return base64.b64decode(body['base64'])
+    return body['text'].encode('utf-8')
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """
+    Passes requests through to the real transport and appends every request/response pair,
+    with how long it took, to a cassette: a JSON Lines file, one interaction per line.
+    Request headers (and with them the API key) are never written.
+    """
+
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or httpx.HTTPTransport()
+        self.lock = threading.Lock()
+
+    def handle_request(self, request):
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        content = response.read()
+        elapsed = time.perf_counter() - start
+        interaction = {
+            'method': request.method,
+            'path': request.url.raw_path.decode('ascii'),
+            'body': _body_key(request.content),
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            'response': _encode(content),
+            'elapsed': round(elapsed, 4),
+        }
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(interaction) + "\n")
+        headers = [(name, value) for name, value in response.headers.items() if name not in ENCODING_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=content)
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """
+    Serves a cassette's responses instead of calling the API.
+
+    A request gets the next unused interaction with the same method, path and body, or failing
+    that the same method and path, so repeated calls (polling a run) replay in recorded order.
+    Each response is delayed by its recorded time multiplied by speed: 1 replays real latency,
+    0 answers at once. A request with nothing recorded gets a 400 so the client does not retry it.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self.lock = threading.Lock()
+        with open(path, encoding='utf-8') as f:
+            self.interactions = [json.loads(line) for line in f if line.strip()]
+        self.rewind()
+
+    def rewind(self):
+        """
+        Makes every recorded interaction available again, to replay the cassette from the start.
+        """
+        with self.lock:
+            self.by_body = defaultdict(deque)
+            self.by_path = defaultdict(deque)
+            self.misses = 0
+            for interaction in self.interactions:
+                interaction['used'] = False
+                self.by_body[(interaction['method'], interaction['path'], interaction['body'])].append(interaction)
+                self.by_path[(interaction['method'], interaction['path'])].append(interaction)
+
+    @staticmethod
+    def _take(queue):
+        while queue:
+            interaction = queue.popleft()
+            if not interaction['used']:
+                interaction['used'] = True
+                return interaction
+        return None
+
+    def handle_request(self, request):
+        method = request.method
+        path = request.url.raw_path.decode('ascii')
+        with self.lock:
+            interaction = (self._take(self.by_body[(method, path, _body_key(request.content))])
+                           or self._take(self.by_path[(method, path)]))
+            if interaction is None:
+                self.misses += 1
+        if interaction is None:
+            return httpx.Response(400, json={'error': {'message': f"No recorded interaction for {method} {path}",
+                                                       'type': 'cassette_miss'}})
+        if self.speed:
+            time.sleep(interaction['elapsed'] * self.speed)
+        return httpx.Response(interaction['status'], headers=interaction['headers'],
+                              content=_decode(interaction['response']))
+
+    def remaining(self):
+        """
+        Returns:
+        - int: Recorded interactions not replayed yet.
+        """
+        with self.lock:
+            return sum(not interaction['used'] for interaction in self.interactions)
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def cassette_transport(transport=None):
+    """
+    Returns the transport selected by OPENAI_CASSETTE (a cassette file) and OPENAI_CASSETTE_MODE
+    ('record' or 'replay', default replay), with OPENAI_CASSETTE_SPEED scaling replayed latency.
+    Every client in the process shares it, so a cassette is replayed once, not once per client.
+
+    Parameters:
+    - transport (httpx.BaseTransport, optional): What recording passes requests on to.
+
+    Returns:
+    - httpx.BaseTransport, or None when no cassette is configured.
+    """
+    path = os.getenv("OPENAI_CASSETTE")
+    if not path:
+        return None
+    mode = os.getenv("OPENAI_CASSETTE_MODE", REPLAY)
+    if mode not in (RECORD, REPLAY):
+        raise ValueError(f"OPENAI_CASSETTE_MODE must be {RECORD} or {REPLAY}, not {mode}")
+    with _transports_lock:
+        if (mode, path) not in _transports:
+            _transports[(mode, path)] = (RecordingTransport(path, transport) if mode == RECORD else
+                                         ReplayTransport(path, speed=float(os.getenv("OPENAI_CASSETTE_SPEED", "1"))))
+        return _transports[(mode, path)]
+
+
+def cassette_http_client(timeout=None):
+    """
+    An httpx client for OpenAI(http_client=...) that records or replays a cassette, or None
+    (the OpenAI default) when no cassette is configured.
+    """
+    transport = cassette_transport()
+    if transport is None:
+        return None
+    return httpx.Client(transport=transport, timeout=timeout)
@@ -0,0 +1,179 @@
+import os
+import threading
+
+import httpx
+
+from storybook.cassettes import cassette_transport
+
+# h2 is optional: without it the shared transport speaks HTTP/1.1 only
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class ClientSettings:
+    """
+    Connection pool limits for the process-wide OpenAI transport.
+
+    Parameters:
+    - max_connections (int): Most connections open at once, across every client.
+    - max_keepalive (int): Idle connections kept open for reuse.
+    - keepalive_expiry (float): Seconds an idle connection is kept before it is closed.
+    - http2 (bool): Use HTTP/2 when h2 is installed, multiplexing requests over fewer connections.
+    - retries (int): Times a failed connection attempt is retried. Requests are never re-sent.
+    """
+
+    def __init__(self, max_connections=50, max_keepalive=20, keepalive_expiry=60, http2=True, retries=2):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and h2 is not None
+        self.retries = retries
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, OPENAI_KEEPALIVE_EXPIRY,
+        OPENAI_HTTP2 ('0' to disable) and OPENAI_CONNECT_RETRIES.
+        """
+        return cls(max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "50")),
+                   max_keepalive=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+                   keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60")),
+                   http2=os.getenv("OPENAI_HTTP2", "1") != "0",
+                   retries=int(os.getenv("OPENAI_CONNECT_RETRIES", "2")))
+
+
+class SharedTransport(httpx.BaseTransport):
+    """
+    A transport shared by many clients. Closing one client must not close the pool under
+    every other client, so close() is a no-op; the connections live as long as the process.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        return self.transport.handle_request(request)
+
+    def close(self):
+        pass
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_transport():
+    """
+    Returns the process-wide transport for OpenAI traffic, built from ClientSettings.from_env()
+    on first use. Every Author reuses its connections, so a request only pays for connection
+    setup (and the TLS handshake) when the pool has no idle connection to hand out.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            settings = ClientSettings.from_env()
+            limits = httpx.Limits(max_connections=settings.max_connections,
+                                  max_keepalive_connections=settings.max_keepalive,
+                                  keepalive_expiry=settings.keepalive_expiry)
+            _shared = SharedTransport(httpx.HTTPTransport(limits=limits, http2=settings.http2,
+                                                          retries=settings.retries))
+        return _shared
+
+
+def openai_http_client(timeout=None):
+    """
+    An httpx client for OpenAI(http_client=...). Clients are cheap; the connection pool behind
+    them is shared. When a cassette is configured it is used instead, recording through the
+    shared transport.
+
+    Parameters:
+    - timeout (float, optional): Default timeout. The OpenAI client passes its own on each request.
+
+    Returns:
+    - httpx.Client: Client over the shared (or cassette) transport.
+    """
+    transport = cassette_transport(shared_transport()) or shared_transport()
+    return httpx.Client(transport=transport, timeout=timeout)
+
+
+class SessionSettings:
+    """
+    How the Streamlit pages talk to the backend.
+
+    Parameters:
+    - pool_size (int): Keep-alive connections kept per backend host.
+    - retries (int): Retries for failed connections, and for idempotent requests answered with
+      502, 503 or 504. A POST that reached the backend is never retried.
+    - backoff (float): Backoff factor between retries, in seconds.
+    - connect_timeout (float): Seconds to wait for a connection.
+    - read_timeout (float): Seconds to wait for a response; generating a page takes a while.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff=0.3, connect_timeout=3.05, read_timeout=180):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads BACKEND_POOL_SIZE, BACKEND_RETRIES, BACKEND_RETRY_BACKOFF, BACKEND_CONNECT_TIMEOUT
+        and BACKEND_READ_TIMEOUT.
+        """
+        return cls(pool_size=int(os.getenv("BACKEND_POOL_SIZE", "10")),
+                   retries=int(os.getenv("BACKEND_RETRIES", "3")),
+                   backoff=float(os.getenv("BACKEND_RETRY_BACKOFF", "0.3")),
+                   connect_timeout=float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3.05")),
+                   read_timeout=float(os.getenv("BACKEND_READ_TIMEOUT", "180")))
+
+
+def make_session(settings=None):
+    """
+    Builds a requests session with a keep-alive connection pool, retries and default timeouts.
+
+    Parameters:
+    - settings (SessionSettings, optional): Defaults to SessionSettings.from_env().
+
+    Returns:
+    - requests.Session: Session whose requests time out unless given their own timeout.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    settings = settings or SessionSettings.from_env()
+    timeout = (settings.connect_timeout, settings.read_timeout)
+
+    class TimeoutSession(requests.Session):
+        def request(self, method, url, **kwargs):
+            kwargs.setdefault('timeout', timeout)
+            return super().request(method, url, **kwargs)
+
+    retry = Retry(total=settings.retries, backoff_factor=settings.backoff,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=settings.pool_size, pool_maxsize=settings.pool_size,
+                          max_retries=retry)
+    session = TimeoutSession()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def backend_session():
+    """
+    Returns the process-wide session the Streamlit pages use to call the backend. Streamlit
+    reruns a page on every interaction, but the session, and its open connections, persist.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
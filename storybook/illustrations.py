@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from storybook.tracing import bind
+
+# Words dropped when comparing prompts, so prompts differing only in these share an image
+FILLER_WORDS = {'a', 'an', 'the', 'of', 'and', 'in', 'on', 'with', 'to', 'is', 'are'}
+
+# OpenAI image URLs expire after an hour, so cached URLs are only reused for a bit less
+DEFAULT_MAX_AGE = 50 * 60
+
+
+def normalize_prompt(prompt):
+    """
+    Reduces a prompt to lowercase words without punctuation or filler words, so that
+    near-identical prompts normalize to the same text.
+    """
+    words = re.findall(r"[a-z0-9']+", prompt.lower())
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+
+
+def _first_sentences(text, count=2, max_chars=300):
+    sentences = re.split(r"(?<=[.!?])\s+", " ".join(text.split()))
+    return " ".join(sentences[:count])[:max_chars]
+
+
+def split_pages(story, pages):
+    """
+    Splits a story into roughly equal runs of words, one per page, ignoring a "Title:" line.
+    """
+    text = re.sub(r"^\s*(?:\*\*)?Title:.*$", "", story, count=1, flags=re.MULTILINE)
+    words = text.split()
+    if not words:
+        return []
+    pages = max(1, min(pages, len(words)))
+    size = -(-len(words) // pages)
+    return [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+
+def image_prompts(idea, story, pages, outline=None):
+    """
+    Derives one illustration prompt per page: from the outline's beats, characters and setting
+    when the story was planned (see storybook.outline), otherwise from the opening sentences of
+    each page of the text.
+
+    Returns:
+    - list[str]: Prompts in page order.
+    """
+    style = "A vivid, friendly children's book illustration"
+    if outline:
+        return [f"{style} for the story \"{outline['title']}\". Characters: {outline['characters']} "
+                f"Setting: {outline['setting']} Scene: {beat}" for beat in outline['pages']]
+    return [f"{style} for a story about {idea}. Scene: {_first_sentences(page)}"
+            for page in split_pages(story, pages)]
+
+
+class RateLimiter:
+    """
+    Spaces out calls to at most `per_minute` a minute across threads. 0 means unlimited.
+    """
+
+    def __init__(self, per_minute=0):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class ImageCache:
+    """
+    Generated image URLs keyed by prompt hash, in the image_cache table of a StoryRepository,
+    so the same or a near-identical prompt is only generated once while its URL is still valid.
+    The cache lives wherever the stories do (STORAGE_URL or the SQLite file), shared by every worker.
+    """
+
+    def __init__(self, repository, max_age=DEFAULT_MAX_AGE):
+        self.repository = repository
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        image_url = self.repository.cached_image(key, self.max_age)
+        with self.lock:
+            if image_url:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return image_url
+
+    def put(self, key, prompt, image_url):
+        self.repository.cache_image(key, prompt, image_url)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+def illustrate(prompts, generate, cache=None, max_workers=3, limiter=None, progress=None):
+    """
+    Generates an image per prompt, concurrently, generating each distinct prompt only once.
+
+    Prompts that normalize to the same text within the list share one generation, and
+    prompts found in the cache are not generated at all.
+
+    Parameters:
+    - prompts (list[str]): One prompt per page, in order.
+    - generate (callable): Takes a prompt and returns an image URL, or None on failure.
+    - cache (ImageCache, optional): Shared prompt-hash cache.
+    - max_workers (int): Most images generated at the same time.
+    - limiter (RateLimiter, optional): Caps how fast generations start.
+    - progress (callable, optional): Called with (distinct prompts done, distinct prompts).
+
+    Returns:
+    - list[dict]: {'position', 'prompt', 'prompt_hash', 'image_url'} in prompt order;
+      image_url is None where generation failed.
+    """
+    keys = [prompt_hash(prompt) for prompt in prompts]
+    urls = {}
+    pending = {}
+    for key, prompt in zip(keys, prompts):
+        if key in urls or key in pending:
+            continue
+        cached = cache.get(key) if cache else None
+        if cached:
+            urls[key] = cached
+        else:
+            pending[key] = prompt
+
+    def run(prompt):
+        if limiter:
+            limiter.wait()
+        return generate(prompt)
+
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending))),
+                                      thread_name_prefix='illustration')
+        try:
+            futures = {executor.submit(bind(run), prompt): key for key, prompt in pending.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                key = futures[future]
+                try:
+                    urls[key] = future.result()
+                except Exception as e:
+                    logging.error(f"Illustration failed: {e}")
+                    urls[key] = None
+                if urls[key] and cache:
+                    cache.put(key, pending[key], urls[key])
+                if progress:
+                    progress(done, len(pending))
+        finally:
+            # A cancelled job must not wait for, or start, the remaining images
+            executor.shutdown(wait=False, cancel_futures=True)
+    return [{'position': position, 'prompt': prompt, 'prompt_hash': key, 'image_url': urls.get(key)}
+            for position, (prompt, key) in enumerate(zip(prompts, keys))]
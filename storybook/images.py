@@ -0,0 +1,152 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import requests
+from flask import jsonify, request, send_file
+from PIL import Image, features
+
+from storybook.tracing import traced
+
+# Widths kept for every image; a request gets the smallest one at least as wide as it asked for
+WIDTHS = (128, 256, 512)
+
+# Encodings in order of preference, with the MIME type clients list in Accept. Pillow 10 has no
+# AVIF encoder, so JPEG is the fallback every client understands.
+FORMATS = [(fmt, mime) for fmt, mime in (('webp', 'image/webp'), ('jpeg', 'image/jpeg'))
+           if fmt != 'webp' or features.check('webp')]
+
+# Stored files never change (their name is their content's hash), so clients may cache them for a year
+CACHE_SECONDS = 365 * 24 * 3600
+
+ASSET_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ImageStore:
+    """
+    Illustrations transcoded to WebP and JPEG at each of WIDTHS, stored on local disk.
+
+    Images are content-addressed: an image's id is the SHA-256 of its original bytes, so the
+    same image is only stored once and its files can be cached forever. Transcoding drops
+    metadata (EXIF, ICC profiles, PNG text chunks) along with the alpha channel.
+    """
+
+    def __init__(self, root, widths=WIDTHS, quality=80):
+        """
+        Parameters:
+        - root (str): Directory the files are stored under.
+        - widths (tuple[int]): Widths to store, in pixels.
+        - quality (int): Lossy encoder quality, 1-100.
+        """
+        self.root = Path(root)
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, asset_id):
+        return self.root / asset_id[:2] / asset_id
+
+    def path(self, asset_id, width, fmt):
+        """
+        Returns:
+        - Path: The stored file, or None if there is none (or asset_id is not a valid id).
+        """
+        if not ASSET_ID.match(asset_id or ''):
+            return None
+        path = self._dir(asset_id) / f"{width}.{fmt}"
+        return path if path.is_file() else None
+
+    def pick_width(self, requested):
+        """
+        Returns the smallest stored width covering the requested one, or the largest if none does.
+        """
+        for width in self.widths:
+            if width >= requested:
+                return width
+        return self.widths[-1]
+
+    def ingest(self, data):
+        """
+        Transcodes an image to every width and format and stores the results.
+
+        Parameters:
+        - data (bytes): The original image, in any format Pillow reads.
+
+        Returns:
+        - str: The image's id.
+        """
+        asset_id = hashlib.sha256(data).hexdigest()
+        directory = self._dir(asset_id)
+        if all((directory / f"{width}.{fmt}").is_file() for width in self.widths for fmt, _ in FORMATS):
+            return asset_id
+        directory.mkdir(parents=True, exist_ok=True)
+        with Image.open(io.BytesIO(data)) as original:
+            image = original.convert('RGB')
+        for width in self.widths:
+            resized = image if width >= image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.LANCZOS)
+            for fmt, _ in FORMATS:
+                buffer = io.BytesIO()
+                options = {'method': 6} if fmt == 'webp' else {'optimize': True, 'progressive': True}
+                resized.save(buffer, fmt.upper(), quality=self.quality, **options)
+                self._write(directory / f"{width}.{fmt}", buffer.getvalue())
+        return asset_id
+
+    @staticmethod
+    def _write(path, data):
+        # Write then rename, so a concurrent reader never sees a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @traced('images.fetch')
+    def fetch(self, url, timeout=30):
+        """
+        Downloads an image and stores it; generated image URLs expire, stored copies do not.
+
+        Returns:
+        - str: The image's id, or None if it could not be downloaded or decoded.
+        """
+        try:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+            return self.ingest(response.content)
+        except Exception as e:
+            logging.error(f"Error storing image {url}: {e}")
+            return None
+
+
+def serve_image(store, asset_id):
+    """
+    Flask response for a stored image.
+
+    The width comes from the w query parameter (default: the largest), the format from the
+    Accept header (WebP when the client lists it, JPEG otherwise). Responses carry a strong
+    ETag and a year-long immutable Cache-Control, and support Range and conditional requests.
+    """
+    try:
+        requested = int(request.args.get('w', store.widths[-1]))
+    except ValueError:
+        return jsonify({"error": "w must be a width in pixels"}), 400
+    width = store.pick_width(requested)
+    # Only clients that name WebP get it; */* alone may come from one that cannot decode it
+    accepted = set(request.accept_mimetypes.values())
+    fmt, mime = next(((fmt, mime) for fmt, mime in FORMATS if mime in accepted), FORMATS[-1])
+    path = store.path(asset_id, width, fmt)
+    if path is None:
+        return jsonify({"error": "Image not found"}), 404
+    response = send_file(path, mimetype=mime, etag=f"{asset_id[:32]}-{width}-{fmt}", conditional=True,
+                         max_age=CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,245 @@
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def check_callback_url(url):
+    """
+    Rejects webhook URLs that would make the server call somewhere it should not.
+
+    Only http and https are accepted. If JOB_CALLBACK_HOSTS (a comma-separated list of host
+    names) is set, the host must be one of them; otherwise every address the host resolves to
+    must be public, ruling out loopback, private, link-local (cloud metadata) and reserved ones.
+
+    Parameters:
+    - url (str): The callback URL.
+
+    Raises:
+    - ValueError: The URL is not allowed.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("callback_url must be an http or https URL")
+    allowed = [host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(',') if host.strip()]
+    if allowed:
+        if parts.hostname.lower() not in allowed:
+            raise ValueError(f"callback_url host {parts.hostname} is not in JOB_CALLBACK_HOSTS")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 80)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"callback_url host {parts.hostname} cannot be resolved: {e}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f"callback_url host {parts.hostname} resolves to a non-public address")
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+
+class JobContext:
+    """
+    Handed to a job handler so it can report progress and notice cancellation.
+    """
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def progress(self, fraction, message=None):
+        """
+        Records how far the job has got (0.0 to 1.0), then stops the job if it was cancelled.
+        """
+        self.queue._update(self.job_id, progress=max(0.0, min(1.0, fraction)), message=message)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.job_id in self.queue.cancel_requested:
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    Runs long generations on a local worker pool and keeps job state in SQLite.
+
+    Request handlers submit a job and return immediately; clients poll get() or receive a
+    webhook when the job finishes. The number of concurrent generations is set by
+    max_workers, independently of how many web workers serve requests.
+    """
+
+    def __init__(self, db_path, max_workers=4):
+        self.db_path = db_path
+        self.handlers = {}
+        self.futures = {}
+        self.cancel_requested = set()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    callback_url TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+
+    def register(self, kind, handler):
+        """
+        Registers the function that runs jobs of a kind.
+
+        Parameters:
+        - kind (str): Job type name.
+        - handler (callable): (params dict, JobContext) -> JSON-serializable result.
+        """
+        self.handlers[kind] = handler
+
+    def recover(self):
+        """
+        Re-queues jobs that were queued when the process stopped and fails the ones that were
+        mid-run, since their partial work is lost. Call once after registering handlers.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE status = ?",
+                (FAILED, "Interrupted by a server restart", RUNNING))
+            queued = self.conn.execute("SELECT id, kind, params FROM jobs WHERE status = ?", (QUEUED,)).fetchall()
+        for row in queued:
+            self._start(row['id'], row['kind'], json.loads(row['params']))
+        return len(queued)
+
+    def submit(self, kind, params, callback_url=None):
+        """
+        Queues a job and returns without waiting for it.
+
+        Parameters:
+        - kind (str): A registered job type.
+        - params (dict): JSON-serializable arguments for the handler.
+        - callback_url (str, optional): URL that receives a POST with the job when it finishes;
+          see check_callback_url for which are accepted.
+
+        Returns:
+        - str: The job id.
+
+        Raises:
+        - ValueError: Unknown kind, or a callback_url that is not allowed.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if callback_url:
+            check_callback_url(callback_url)
+        job_id = uuid.uuid4().hex
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, callback_url) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), callback_url))
+        self._start(job_id, kind, params)
+        return job_id
+
+    def _start(self, job_id, kind, params):
+        future = self.pool.submit(self._run, job_id, kind, params)
+        with self.lock:
+            self.futures[job_id] = future
+
+    def get(self, job_id):
+        """
+        Returns:
+        - dict: The job's status, progress, message, result and error, or None if unknown.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job never starts; a running one stops at its next progress report.
+
+        Returns:
+        - bool: False if the job is unknown or already finished.
+        """
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED:
+            return False
+        with self.lock:
+            self.cancel_requested.add(job_id)
+            future = self.futures.get(job_id)
+        if future is not None and future.cancel():
+            self._finish(job_id, CANCELLED)
+        return True
+
+    def _run(self, job_id, kind, params):
+        context = JobContext(self, job_id)
+        try:
+            context.check_cancelled()
+            self._update(job_id, status=RUNNING)
+            result = self.handlers[kind](params, context)
+            self._finish(job_id, SUCCEEDED, result=result)
+        except JobCancelled:
+            self._finish(job_id, CANCELLED)
+        except Exception as e:
+            logging.error(f"Job {job_id} ({kind}) failed: {e}")
+            self._finish(job_id, FAILED, error=str(e))
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (*fields.values(), job_id))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        fields = {'status': status, 'error': error}
+        if status == SUCCEEDED:
+            fields.update(progress=1.0, result=json.dumps(result))
+        self._update(job_id, **fields)
+        with self.lock:
+            self.futures.pop(job_id, None)
+            self.cancel_requested.discard(job_id)
+        self._notify(job_id)
+
+    def _notify(self, job_id):
+        job = self.get(job_id)
+        if not job or not job['callback_url']:
+            return
+        try:
+            # Checked again in case the host now resolves elsewhere; redirects could lead anywhere
+            check_callback_url(job['callback_url'])
+            requests.post(job['callback_url'], json=job, timeout=10, allow_redirects=False)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Webhook for job {job_id} failed: {e}")
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+        self.conn.close()
@@ -0,0 +1,160 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from storybook.policy import FIRST_PAGE, OUTLINE, PAGE
+from storybook.tracing import bind
+
+WORDS_PER_PAGE = 300
+
+# JSON schema of the outline a multi-page story is expanded from
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "characters": {"type": "string"},
+        "setting": {"type": "string"},
+        "pages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"beat": {"type": "string"}},
+                "required": ["beat"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["title", "characters", "setting", "pages"],
+    "additionalProperties": False,
+}
+
+
+def outline_format():
+    """
+    Returns the response_format argument that asks for a schema-validated outline.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "story_outline", "strict": True, "schema": OUTLINE_SCHEMA},
+    }
+
+
+def story_prompt(prompt, pages):
+    """
+    Prompt for a whole story in a single call, used for one-page stories and when outlining fails.
+    """
+    return f"Write a story about {prompt}. Make sure it is exactly {pages} page(s) long, one page is around {WORDS_PER_PAGE} words and please no page number in the contents"
+
+
+def outline_prompt(prompt, pages):
+    return f"""Plan a children's story about {prompt} that is {pages} pages long. Do not write the story yet.
+Respond only with a JSON object with the keys "title", "characters" (each character's name, look and
+personality, in a few sentences), "setting" (what the places in the story look like, in a few sentences)
+and "pages" (a list of exactly {pages} objects, each with a "beat": one or two sentences on what happens
+on that page)."""
+
+
+def parse_outline(text, pages):
+    """
+    Decodes an outline and checks it has one beat per page.
+
+    Returns:
+    - dict: title, characters, setting and pages (list of beats), or None if it does not match.
+    """
+    try:
+        data = json.loads(text or "")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("pages"), list):
+        return None
+    beats = [page.get("beat") for page in data["pages"] if isinstance(page, dict)]
+    if len(beats) != pages or not all(isinstance(beat, str) and beat.strip() for beat in beats):
+        return None
+    if not all(isinstance(data.get(key), str) for key in ("title", "characters", "setting")):
+        return None
+    return {"title": data["title"].strip(), "characters": data["characters"].strip(),
+            "setting": data["setting"].strip(), "pages": [beat.strip() for beat in beats]}
+
+
+def page_prompt(outline, number):
+    """
+    Prompt for one page. Every page sees the whole plan so it can stay consistent
+    with pages written at the same time.
+    """
+    plan = "\n".join(f"Page {i}: {beat}" for i, beat in enumerate(outline["pages"], start=1))
+    return f"""You are writing page {number} of {len(outline['pages'])} of the children's story "{outline['title']}".
+Characters: {outline['characters']}
+Setting: {outline['setting']}
+The plan for the whole story:
+{plan}
+
+Write only page {number}, about {WORDS_PER_PAGE} words, covering: {outline['pages'][number - 1]}
+Continue naturally from the previous page's beat and lead into the next one. Do not add a title,
+a page number or any heading."""
+
+
+def consistency_prompt(outline, story):
+    return f"""Here is the children's story "{outline['title']}", written one page at a time.
+Characters: {outline['characters']}
+Setting: {outline['setting']}
+
+{story}
+
+Fix any inconsistencies in names, descriptions and events between pages and smooth the transitions,
+changing as little as possible. Keep the paragraph breaks between pages. Respond with the revised story only."""
+
+
+def write_story(prompt, pages, complete, max_workers=5, consistency=False, progress=None, retries=1):
+    """
+    Writes a multi-page story by planning it first and then writing every page at once.
+
+    One call produces an outline with a beat per page and character and setting notes; the pages
+    are then expanded concurrently (at most max_workers at a time) and joined in order, so the
+    wall-clock time is close to that of a single page. A page that fails is written again, up to
+    retries more times, so one bad reply does not cost the whole story. An optional consistency
+    pass revises the joined story in one more call.
+
+    Parameters:
+    - prompt (str): The story idea.
+    - pages (int): Number of pages.
+    - complete (callable): (text, call_type, response_format) -> reply text or None.
+      call_type is OUTLINE, PAGE or FIRST_PAGE (the consistency pass).
+    - max_workers (int): Most pages written at the same time.
+    - consistency (bool): Run the consistency pass.
+    - progress (callable, optional): Called with (pages done, pages) as pages finish.
+    - retries (int): Further attempts at each page that failed.
+
+    Returns:
+    - tuple: (story text, outline), or (None, outline) if a page still failed; the outline is
+      None when planning failed.
+    """
+    outline = parse_outline(complete(outline_prompt(prompt, pages), OUTLINE, outline_format()), pages)
+    if outline is None:
+        logging.error(f"Could not plan a {pages} page story about {prompt}")
+        return None, None
+
+    written = [None] * pages
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, pages)), thread_name_prefix='page')
+    try:
+        futures = {executor.submit(bind(complete), page_prompt(outline, number), PAGE, None): number
+                   for number in range(1, pages + 1)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            written[futures[future] - 1] = future.result()
+            if progress:
+                progress(done, pages)
+    finally:
+        # Returning early (a failed page or a cancelled job) must not wait for the other pages
+        executor.shutdown(wait=False, cancel_futures=True)
+    for _ in range(retries):
+        for index in [index for index, page in enumerate(written) if not page]:
+            logging.error(f"Page {index + 1} of {outline['title']} failed; writing it again")
+            written[index] = complete(page_prompt(outline, index + 1), PAGE, None)
+    if not all(written):
+        logging.error(f"Could not write every page of {outline['title']}")
+        return None, outline
+
+    story = "\n\n".join(page.strip() for page in written)
+    if consistency:
+        revised = complete(consistency_prompt(outline, story), FIRST_PAGE, None)
+        story = revised.strip() if revised else story
+    return f"Title: {outline['title']}\n\n{story}", outline
@@ -0,0 +1,300 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from storybook.tracing import bind, current_span, span
+
+# Call types with their own latency history, hedging and fallback settings
+FIRST_PAGE = 'first_page'
+CONTINUATION = 'continuation'
+IMAGE = 'image'
+OUTLINE = 'outline'
+PAGE = 'page'
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of a list of numbers, or None for an empty list.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class Tier:
+    """
+    One model at one endpoint. Tiers of a call type are tried in order.
+    """
+
+    def __init__(self, model, client=None):
+        self.model = model
+        self.client = client
+        self.failures = 0
+        self.degraded_until = 0.0
+
+    def healthy(self, now):
+        return now >= self.degraded_until
+
+    def __repr__(self):
+        return f"Tier({self.model!r})"
+
+
+class CallPolicy:
+    """
+    How calls of one type are executed.
+
+    Parameters:
+    - tiers (list[Tier]): Primary first, then fallbacks.
+    - hedge_percentile (float, optional): Send a duplicate request once a call runs longer than this
+      percentile of recent latencies. None disables hedging, e.g. for calls that cannot run twice.
+    - min_samples (int): Latencies to collect before hedging starts.
+    - min_hedge_delay (float): Never hedge sooner than this many seconds.
+    - degrade_after (int): Consecutive failures that mark a tier degraded.
+    - cooldown (float): Seconds a degraded tier is skipped before it is tried again.
+    - window (int): Number of recent latencies kept.
+    """
+
+    def __init__(self, tiers, hedge_percentile=0.95, min_samples=20, min_hedge_delay=0.05,
+                 degrade_after=3, cooldown=30.0, window=500):
+        if not tiers:
+            raise ValueError("A call policy needs at least one tier")
+        self.tiers = tiers
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.degrade_after = degrade_after
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.counters = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'hedges_skipped': 0, 'fallbacks': 0, 'failures': 0}
+
+    def hedge_delay(self):
+        """
+        Returns:
+        - float: Seconds to wait before hedging, or None if hedging is off or not warmed up.
+        """
+        if self.hedge_percentile is None or len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, percentile(list(self.latencies), self.hedge_percentile))
+
+
+class ExecutionPolicy:
+    """
+    Runs model calls with hedging and tiered fallback, per call type.
+
+    A call that outlasts its type's latency percentile gets a duplicate; whichever answers first
+    wins. The loser is cancelled if it has not started yet; otherwise it runs to completion,
+    holding a pool thread and spending tokens, and its result is discarded. At most max_losers
+    such abandoned calls run at once: past that, slow calls are waited for rather than hedged.
+    Clients used here should not retry on their own (OpenAI(max_retries=0)), or every hedge and
+    fallback multiplies into the client's retries.
+    A tier that keeps failing is marked degraded and skipped in favour of the next one until
+    its cooldown ends. An optional circuit breaker sees each call as a whole, after hedging
+    and fallback, and rejects calls outright while it is open.
+    """
+
+    def __init__(self, policies, max_workers=32, breaker=None, max_losers=None):
+        self.policies = policies
+        self.breaker = breaker
+        self.max_losers = max(1, max_workers // 4) if max_losers is None else max_losers
+        self.losers = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-call')
+
+    def run(self, call_type, call):
+        """
+        Executes a call under the policy for its type.
+
+        Parameters:
+        - call_type (str): Key into the policies, e.g. FIRST_PAGE.
+        - call (callable): Takes a Tier and returns the result, raising on failure.
+
+        Returns:
+        - The first successful result.
+
+        Raises:
+        - storybook.breaker.CircuitOpenError: The breaker is open; no call was made.
+        - Exception: The last tier's error when every tier failed.
+        """
+        policy = self.policies[call_type]
+
+        def run_tiers():
+            with self.lock:
+                policy.counters['calls'] += 1
+            with span('policy.run', call_type=call_type):
+                return self._run_tiers(call_type, policy, call)
+        return self.guarded(run_tiers)
+
+    def guarded(self, call):
+        """
+        Executes a call under the circuit breaker only, without hedging or fallback: for
+        requests that are part of a model call but are not tied to a tier, e.g. adding a
+        message to a thread.
+
+        Parameters:
+        - call (callable): Takes no arguments, raising on failure.
+
+        Returns:
+        - The call's result.
+
+        Raises:
+        - storybook.breaker.CircuitOpenError: The breaker is open; no call was made.
+        """
+        if self.breaker is None:
+            return call()
+        self.breaker.before_call()
+        start = time.monotonic()
+        try:
+            result = call()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success(time.monotonic() - start)
+        return result
+
+    def _run_tiers(self, call_type, policy, call):
+        now = time.monotonic()
+        # If everything is degraded, try them all anyway rather than failing without a call
+        tiers = [tier for tier in policy.tiers if tier.healthy(now)] or policy.tiers
+        last_error = None
+        for position, tier in enumerate(tiers):
+            if position:
+                with self.lock:
+                    policy.counters['fallbacks'] += 1
+                logging.info(f"{call_type}: falling back to {tier.model}")
+                current_span().set(fallback=tier.model)
+            try:
+                result = self._hedged(policy, tier, call)
+            except Exception as e:
+                last_error = e
+                self._record_failure(call_type, policy, tier, e)
+                continue
+            with self.lock:
+                tier.failures = 0
+            return result
+        with self.lock:
+            policy.counters['failures'] += 1
+        raise last_error
+
+    def _hedged(self, policy, tier, call):
+        start = time.monotonic()
+        call = bind(call)
+        primary = self.pool.submit(call, tier)
+        pending = {primary}
+        delay = policy.hedge_delay()
+        hedge = None
+        while True:
+            done, pending = wait(pending, timeout=delay if hedge is None else None, return_when=FIRST_COMPLETED)
+            if not done:
+                with self.lock:
+                    overloaded = self.losers >= self.max_losers
+                    if overloaded:
+                        policy.counters['hedges_skipped'] += 1
+                if overloaded:
+                    # Enough abandoned calls are still running; wait this one out instead
+                    delay = None
+                    continue
+                hedge = self.pool.submit(call, tier)
+                pending.add(hedge)
+                with self.lock:
+                    policy.counters['hedges'] += 1
+                current_span().set(hedged=True)
+                continue
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                for future in pending:
+                    if not future.cancel():
+                        self._abandon(future)
+                with self.lock:
+                    policy.latencies.append(time.monotonic() - start)
+                    if winner is hedge:
+                        policy.counters['hedge_wins'] += 1
+                return winner.result()
+            if not pending:
+                raise next(iter(done)).exception()
+            if hedge is None:
+                # The primary failed before the hedge was sent; let the caller fall back
+                raise next(iter(done)).exception()
+
+    def _abandon(self, future):
+        """
+        Counts a losing call that already started until it finishes.
+        """
+        def finished(_):
+            with self.lock:
+                self.losers -= 1
+        with self.lock:
+            self.losers += 1
+        future.add_done_callback(finished)
+
+    def _record_failure(self, call_type, policy, tier, error):
+        logging.error(f"{call_type} call to {tier.model} failed: {error}")
+        with self.lock:
+            tier.failures += 1
+            if tier.failures >= policy.degrade_after:
+                tier.degraded_until = time.monotonic() + policy.cooldown
+                tier.failures = 0
+                logging.error(f"{call_type}: {tier.model} degraded for {policy.cooldown}s")
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Per call type counters, hedge rate, p50/p99 latency in seconds and tier health;
+          plus abandoned_calls, the hedge losers still running.
+        """
+        now = time.monotonic()
+        report = {}
+        with self.lock:
+            for call_type, policy in self.policies.items():
+                latencies = list(policy.latencies)
+                calls = policy.counters['calls']
+                report[call_type] = {
+                    **policy.counters,
+                    'hedge_rate': round(policy.counters['hedges'] / calls, 4) if calls else 0.0,
+                    'p50': percentile(latencies, 0.5),
+                    'p99': percentile(latencies, 0.99),
+                    'hedge_delay': policy.hedge_delay(),
+                    'tiers': [{'model': tier.model, 'healthy': tier.healthy(now)} for tier in policy.tiers],
+                }
+            report['abandoned_calls'] = self.losers
+        if self.breaker is not None:
+            report['breaker'] = self.breaker.stats()
+        return report
+
+
+def tiers_from_env(call_type, default_model, client, make_client=None):
+    """
+    Reads the tiers for a call type from STORY_MODELS_<CALL_TYPE>, a comma-separated list of
+    model or model@base_url entries, e.g. "gpt-4o-mini-2024-07-18,gpt-4o-mini@http://backup/v1".
+
+    Parameters:
+    - call_type (str): FIRST_PAGE, CONTINUATION or IMAGE.
+    - default_model (str): Used when the variable is not set.
+    - client: Client for entries without a base_url.
+    - make_client (callable, optional): Builds a client for a base_url; without it base_urls are ignored.
+
+    Returns:
+    - list[Tier]
+    """
+    spec = os.getenv(f"STORY_MODELS_{call_type.upper()}") or default_model
+    tiers = []
+    for entry in spec.split(','):
+        model, _, base_url = entry.strip().partition('@')
+        if not model:
+            continue
+        tier_client = make_client(base_url) if base_url and make_client else client
+        tiers.append(Tier(model, tier_client))
+    return tiers
+
+
+def hedge_percentile_from_env(call_type, default):
+    """
+    Reads HEDGE_<CALL_TYPE>: a percentile such as 0.95, or 0 to turn hedging off.
+    """
+    value = os.getenv(f"HEDGE_{call_type.upper()}")
+    if value is None:
+        return default
+    return float(value) or None
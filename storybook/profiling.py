@@ -0,0 +1,218 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# Dump names carry what the listing needs: <epoch ms>-<route>-<latency>ms-<session>.<ext>
+DUMP_NAME = re.compile(r"^(?P<created>\d+)-(?P<route>[\w.]+)-(?P<latency>\d+)ms-(?P<session>[\w.]+)\.(?P<ext>pstats|folded)$")
+
+MODES = ('cprofile', 'sample')
+
+
+def _slug(text, limit=60):
+    return re.sub(r"[^\w.]+", "_", text).strip("_")[:limit] or "none"
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread at a fixed interval, so work a request hands to
+    executor threads (model calls, parallel pages) shows up too. Much cheaper than cProfile
+    for long requests, at the cost of also seeing other requests' threads.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join([names.get(ident, str(ident)), *reversed(stack)])] += 1
+
+    def dump(self):
+        """
+        Returns:
+        - str: The samples in the folded format flame graph tools read, one stack per line.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Profiler:
+    """
+    Profiles selected Flask requests and keeps the results in a rotating dump directory.
+
+    A request is profiled when it sends X-Profile: 1 or is picked at sample_rate, and its
+    dump is kept if it took at least min_ms. Only one request is profiled at a time; others
+    run normally meanwhile. When disabled, instrument adds no hooks at all.
+    """
+
+    def __init__(self, dump_dir=None, sample_rate=0.0, min_ms=0.0, max_dumps=50, mode='cprofile'):
+        """
+        Parameters:
+        - dump_dir (str, optional): Where dumps are written; profiling is disabled without it.
+        - sample_rate (float): Fraction of requests profiled without the header, 0 to 1.
+        - min_ms (float): Dumps of faster requests are discarded.
+        - max_dumps (int): Dumps kept; the oldest are deleted first.
+        - mode (str): 'cprofile' (.pstats of the request thread) or 'sample' (.folded stacks of all threads).
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}; expected one of {MODES}")
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.sample_rate = sample_rate
+        self.min_ms = min_ms
+        self.max_dumps = max_dumps
+        self.mode = mode
+        self.busy = threading.Lock()
+        self.rotate_lock = threading.Lock()
+        if self.dump_dir:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a profiler from PROFILE_DIR (profiling is off unless set), PROFILE_SAMPLE_RATE,
+        PROFILE_MIN_MS, PROFILE_MAX_DUMPS and PROFILE_MODE.
+        """
+        return cls(dump_dir=os.getenv("PROFILE_DIR"),
+                   sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+                   min_ms=float(os.getenv("PROFILE_MIN_MS", "0")),
+                   max_dumps=int(os.getenv("PROFILE_MAX_DUMPS", "50")),
+                   mode=os.getenv("PROFILE_MODE", "cprofile"))
+
+    @property
+    def enabled(self):
+        return self.dump_dir is not None
+
+    def instrument(self, app):
+        """
+        Adds the profiling hooks to a Flask app, if profiling is enabled.
+        """
+        if not self.enabled:
+            return
+        from flask import g, request
+
+        @app.before_request
+        def start_profile():
+            forced = request.headers.get('X-Profile') == '1'
+            if not forced and not (self.sample_rate and random.random() < self.sample_rate):
+                return
+            if not self.busy.acquire(blocking=False):
+                return
+            if self.mode == 'sample':
+                profile = StackSampler()
+                profile.start()
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+            g.profile = (profile, time.perf_counter())
+
+        @app.teardown_request
+        def finish_profile(exc):
+            started = g.pop('profile', None)
+            if started is None:
+                return
+            profile, start = started
+            try:
+                if isinstance(profile, StackSampler):
+                    profile.stop()
+                else:
+                    profile.disable()
+            finally:
+                self.busy.release()
+            latency_ms = (time.perf_counter() - start) * 1000
+            if latency_ms < self.min_ms:
+                return
+            rule = request.url_rule.rule if request.url_rule else request.path
+            session = request.headers.get('X-Session-Id') or request.args.get('session_id')
+            if not session and request.is_json:
+                body = request.get_json(silent=True)
+                session = body.get('session_id') if isinstance(body, dict) else None
+            self.save(profile, f"{request.method} {rule}", latency_ms, session)
+
+    def save(self, profile, route, latency_ms, session=None):
+        """
+        Writes a finished profile to the dump directory and deletes the oldest dumps past max_dumps.
+
+        Returns:
+        - str: The dump's file name, or None if it could not be written.
+        """
+        ext = 'folded' if isinstance(profile, StackSampler) else 'pstats'
+        name = f"{int(time.time() * 1000)}-{_slug(route)}-{round(latency_ms)}ms-{_slug(str(session or 'none'))}.{ext}"
+        try:
+            if ext == 'folded':
+                (self.dump_dir / name).write_text(profile.dump(), encoding='utf-8')
+            else:
+                profile.dump_stats(str(self.dump_dir / name))
+        except OSError as e:
+            logging.error(f"Error writing profile {name}: {e}")
+            return None
+        with self.rotate_lock:
+            for old in self.dump_names()[self.max_dumps:]:
+                try:
+                    (self.dump_dir / old).unlink()
+                except OSError:
+                    pass
+        return name
+
+    def dump_names(self):
+        """
+        Returns:
+        - list[str]: Dump file names, newest first.
+        """
+        if not self.enabled:
+            return []
+        return sorted((path.name for path in self.dump_dir.iterdir() if DUMP_NAME.match(path.name)),
+                      key=lambda name: int(name.split('-', 1)[0]), reverse=True)
+
+    def list_dumps(self, limit=50):
+        """
+        Returns:
+        - list[dict]: name, route, latency_ms, session, format, bytes and created (epoch seconds), newest first.
+        """
+        dumps = []
+        for name in self.dump_names()[:limit]:
+            match = DUMP_NAME.match(name)
+            try:
+                size = (self.dump_dir / name).stat().st_size
+            except OSError:
+                continue  # rotated away meanwhile
+            dumps.append({'name': name, 'route': match['route'], 'latency_ms': int(match['latency']),
+                          'session': None if match['session'] == 'none' else match['session'],
+                          'format': match['ext'], 'bytes': size, 'created': int(match['created']) / 1000})
+        return dumps
+
+    def dump_path(self, name):
+        """
+        Returns:
+        - Path: The dump with this name, or None if there is none.
+        """
+        if not self.enabled or not DUMP_NAME.match(name or ''):
+            return None
+        path = self.dump_dir / name
+        return path if path.is_file() else None
@@ -0,0 +1,512 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+# Story ids autoincrement differently per database
+ID_COLUMNS = {
+    'sqlite': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+    'postgresql': 'SERIAL PRIMARY KEY',
+    'mysql': 'INTEGER PRIMARY KEY AUTO_INCREMENT',
+}
+
+STORY_COLUMNS = 'id, title, content, created_at, image_url'
+
+# story_data columns of a story, in the order StoryDataRepository returns them
+STORY_DATA_COLUMNS = ['story_id', 'genre', 'age', 'choice_count', 'segment_count', 'content', 'title',
+                      'word_count', 'created_at', 'archive_segment']
+
+# Metadata columns returned by list views; on SQLite the summary indexes cover them, so content is never read
+SUMMARY_COLUMNS = ['story_id', 'genre', 'age', 'choice_count', 'segment_count', 'title', 'word_count', 'created_at']
+
+SUMMARY_ORDERS = {'created_at': 'created_at', 'title': 'title'}
+
+
+def _timestamp(value):
+    # Server databases return datetimes; callers expect SQLite's CURRENT_TIMESTAMP text
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+
+
+def _now():
+    # What CURRENT_TIMESTAMP stores on SQLite, set here so every database gets the same text
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _create_version_row(session, name):
+    session.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    session.execute("INSERT INTO table_versions (name, version) SELECT :name, 0 "
+                    "WHERE NOT EXISTS (SELECT 1 FROM table_versions WHERE name = :name)", {'name': name})
+
+
+def _bump_version(session, name):
+    session.execute("UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE name = :name", {'name': name})
+
+
+def _read_version(session, name):
+    row = session.one("SELECT version, updated_at FROM table_versions WHERE name = :name", {'name': name})
+    return (row['version'], _timestamp(row['updated_at'])) if row else (0, None)
+
+
+class StoryRepository:
+    """
+    Stories with their pages (segments) and illustrations, on an engine from storybook.storage:
+    tuned SQLite or any database SQLAlchemy can pool connections to.
+
+    Like the rest of the storage code, methods log database errors and return an empty result
+    (None, [] or {}) rather than raising.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        # On SQLite, triggers count every write to stories, including ones made outside this
+        # class (archive imports, the sqlite3 shell); elsewhere the repository counts its own
+        self.triggers = engine.dialect == 'sqlite'
+        self.create_tables()
+
+    def create_tables(self):
+        """
+        Creates the stories, story_segments, story_images, image_cache and table_versions tables
+        if they do not exist.
+        """
+        id_column = ID_COLUMNS.get(self.engine.dialect, ID_COLUMNS['sqlite'])
+        with self.engine.transaction() as session:
+            session.execute(f'''
+                CREATE TABLE IF NOT EXISTS stories (
+                    id {id_column},
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    image_url TEXT
+                )
+            ''')
+            session.execute('''
+                CREATE TABLE IF NOT EXISTS story_segments (
+                    story_id INTEGER NOT NULL REFERENCES stories (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (story_id, position)
+                )
+            ''')
+            session.execute('''
+                CREATE TABLE IF NOT EXISTS story_images (
+                    story_id INTEGER NOT NULL REFERENCES stories (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    prompt TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    image_url TEXT,
+                    PRIMARY KEY (story_id, position)
+                )
+            ''')
+            session.execute('''
+                CREATE TABLE IF NOT EXISTS image_cache (
+                    prompt_hash VARCHAR(64) PRIMARY KEY,
+                    prompt TEXT NOT NULL,
+                    image_url TEXT NOT NULL,
+                    created_at DOUBLE PRECISION NOT NULL
+                )
+            ''')
+            _create_version_row(session, 'stories')
+            if self.triggers:
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    session.execute(f'''
+                        CREATE TRIGGER IF NOT EXISTS stories_version_{event.lower()} AFTER {event} ON stories
+                        BEGIN
+                            UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                            WHERE name = 'stories';
+                        END
+                    ''')
+
+    def _bump_version(self, session):
+        if not self.triggers:
+            _bump_version(session, 'stories')
+
+    def save_story(self, title, content, image_url=None, images=None, segments=None):
+        """
+        Saves a story with its pages and illustrations in one transaction, so readers never see
+        a story without them.
+
+        Parameters:
+        - title (str): Title of the story.
+        - content (str): Content of the story.
+        - image_url (str, optional): URL of the story's cover image.
+        - images (list[dict], optional): Illustrations with position, prompt, prompt_hash and image_url.
+        - segments (list[str], optional): The story's pages in order.
+
+        Returns:
+        - int: The new story's id, or None if it could not be saved.
+        """
+        try:
+            with self.engine.transaction() as session:
+                story_id = session.insert('stories', {'title': title, 'content': content, 'image_url': image_url})
+                session.executemany(
+                    "INSERT INTO story_segments (story_id, position, content) VALUES (:story_id, :position, :content)",
+                    ({'story_id': story_id, 'position': position, 'content': segment}
+                     for position, segment in enumerate(segments or [])))
+                session.executemany(
+                    "INSERT INTO story_images (story_id, position, prompt, prompt_hash, image_url) "
+                    "VALUES (:story_id, :position, :prompt, :prompt_hash, :image_url)",
+                    ({'story_id': story_id, 'position': image['position'], 'prompt': image['prompt'],
+                      'prompt_hash': image['prompt_hash'], 'image_url': image['image_url']} for image in images or []))
+                self._bump_version(session)
+            return story_id
+        except self.engine.errors as e:
+            logging.error(f"Error saving story: {e}")
+            return None
+
+    def get_story(self, story_id):
+        """
+        Returns:
+        - dict: The story (id, title, content, created_at, image_url), or None if there is none.
+        """
+        try:
+            with self.engine.session() as session:
+                story = session.one(f"SELECT {STORY_COLUMNS} FROM stories WHERE id = :id", {'id': story_id})
+            if story:
+                story['created_at'] = _timestamp(story['created_at'])
+            return story
+        except self.engine.errors as e:
+            logging.error(f"Error fetching story {story_id}: {e}")
+            return None
+
+    def get_all_stories(self):
+        """
+        Returns:
+        - list[dict]: Every story, in id order.
+        """
+        try:
+            with self.engine.session() as session:
+                stories = session.all(f"SELECT {STORY_COLUMNS} FROM stories ORDER BY id")
+            for story in stories:
+                story['created_at'] = _timestamp(story['created_at'])
+            return stories
+        except self.engine.errors as e:
+            logging.error(f"Error fetching stories: {e}")
+            return []
+
+    def recent_titles(self, limit):
+        """
+        Returns:
+        - list[dict]: id and title of the most recent stories, newest first.
+        """
+        try:
+            with self.engine.session() as session:
+                return session.all("SELECT id, title FROM stories ORDER BY id DESC LIMIT :limit", {'limit': limit})
+        except self.engine.errors as e:
+            logging.error(f"Error fetching story titles: {e}")
+            return []
+
+    def _by_story(self, table, column, story_ids, label):
+        query = f"SELECT story_id, {column} FROM {table}"
+        params = {}
+        if story_ids is not None:
+            story_ids = list(story_ids)
+            if not story_ids:
+                return {}
+            params = {f"id{i}": story_id for i, story_id in enumerate(story_ids)}
+            query += f" WHERE story_id IN ({', '.join(':' + name for name in params)})"
+        try:
+            grouped = {}
+            with self.engine.session() as session:
+                for row in session.all(query + " ORDER BY story_id, position", params):
+                    grouped.setdefault(row['story_id'], []).append(row[column])
+            return grouped
+        except self.engine.errors as e:
+            logging.error(f"Error fetching story {label}: {e}")
+            return {}
+
+    def get_story_images(self, story_ids=None):
+        """
+        Parameters:
+        - story_ids (list[int], optional): Stories to fetch images for; all stories when not given.
+
+        Returns:
+        - dict: story id -> list of image URLs in page order (None where an illustration failed).
+        """
+        return self._by_story('story_images', 'image_url', story_ids, 'images')
+
+    def get_story_segments(self, story_ids=None):
+        """
+        Parameters:
+        - story_ids (list[int], optional): Stories to fetch pages for; all stories when not given.
+
+        Returns:
+        - dict: story id -> list of pages in order. Stories saved without pages are missing.
+        """
+        return self._by_story('story_segments', 'content', story_ids, 'segments')
+
+    def iter_stories(self, batch_size=500):
+        """
+        Iterates over all stories in id order without loading the whole table into memory.
+        """
+        try:
+            with self.engine.session() as session:
+                for story in session.iterate(f"SELECT {STORY_COLUMNS} FROM stories ORDER BY id",
+                                             batch_size=batch_size):
+                    story['created_at'] = _timestamp(story['created_at'])
+                    yield story
+        except self.engine.errors as e:
+            logging.error(f"Error iterating stories: {e}")
+
+    def table_version(self):
+        """
+        Returns:
+        - tuple: (version, updated_at) of the stories table, bumped on every write, or (0, None).
+        """
+        try:
+            with self.engine.session() as session:
+                return _read_version(session, 'stories')
+        except self.engine.errors as e:
+            logging.error(f"Error reading table version: {e}")
+            return (0, None)
+
+    def cached_image(self, prompt_hash, max_age):
+        """
+        Returns:
+        - str: The image URL generated for this prompt hash within the last max_age seconds, or None.
+        """
+        try:
+            with self.engine.session() as session:
+                return session.scalar("SELECT image_url FROM image_cache WHERE prompt_hash = :key AND created_at >= :since",
+                                      {'key': prompt_hash, 'since': time.time() - max_age})
+        except self.engine.errors as e:
+            logging.error(f"Error reading image cache: {e}")
+            return None
+
+    def cache_image(self, prompt_hash, prompt, image_url):
+        """
+        Remembers the image generated for a prompt hash, replacing an older one.
+        """
+        try:
+            with self.engine.transaction() as session:
+                session.execute("DELETE FROM image_cache WHERE prompt_hash = :key", {'key': prompt_hash})
+                session.insert('image_cache', {'prompt_hash': prompt_hash, 'prompt': prompt, 'image_url': image_url,
+                                               'created_at': time.time()}, key='prompt_hash')
+        except self.engine.errors as e:
+            logging.error(f"Error writing image cache: {e}")
+
+    def close(self):
+        self.engine.close()
+
+
+class StoryDataRepository:
+    """
+    backend_example's stories (story_data: genre, age and choice settings, deduplicated by a hash
+    of the content) and pre-generated first pages (starter_pages), on an engine from
+    storybook.storage, so STORAGE_URL can point them at any database SQLAlchemy supports.
+
+    On a SQLite file the schema is kept by backend_example/migrations.py, which upgrades files
+    written by older versions and adds the triggers behind table_versions and story_stats; pass
+    migrated=True there. Anywhere else the tables are created here at the current schema and
+    the repository counts its own writes.
+
+    Unlike StoryRepository, database errors (engine.errors) are raised, so StoryDatabase can
+    keep a failed read out of its cache.
+    """
+
+    def __init__(self, engine, migrated=False):
+        self.engine = engine
+        self.migrated = migrated
+        if not migrated:
+            self.create_tables()
+
+    def create_tables(self):
+        """
+        Creates story_data, starter_pages and table_versions at the current schema if they do not exist.
+        """
+        id_column = ID_COLUMNS.get(self.engine.dialect, ID_COLUMNS['sqlite'])
+        with self.engine.transaction() as session:
+            session.execute(f'''
+                CREATE TABLE IF NOT EXISTS story_data (
+                    story_id {id_column},
+                    genre VARCHAR(60) NOT NULL,
+                    age INTEGER NOT NULL,
+                    choice_count INTEGER NOT NULL,
+                    segment_count VARCHAR(20) NOT NULL,
+                    content TEXT NOT NULL,
+                    title TEXT,
+                    word_count INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    archive_segment VARCHAR(64),
+                    content_hash VARCHAR(64) UNIQUE
+                )
+            ''')
+            session.execute('''
+                CREATE TABLE IF NOT EXISTS starter_pages (
+                    genre VARCHAR(60) NOT NULL,
+                    age INTEGER NOT NULL,
+                    choice_count INTEGER NOT NULL,
+                    length VARCHAR(20) NOT NULL,
+                    variant INTEGER NOT NULL DEFAULT 0,
+                    content TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (genre, age, choice_count, length, variant)
+                )
+            ''')
+            _create_version_row(session, 'story_data')
+        # Indexes are created separately: IF NOT EXISTS on indexes is not portable everywhere
+        for name, columns in (('idx_genre_age', 'genre, age, story_id'), ('idx_summary_created', 'created_at, story_id')):
+            try:
+                with self.engine.transaction() as session:
+                    session.execute(f"CREATE INDEX {name} ON story_data ({columns})")
+            except self.engine.errors:
+                pass  # already there
+
+    def _bump_version(self, session):
+        if not self.migrated:
+            _bump_version(session, 'story_data')
+
+    @staticmethod
+    def _story(row):
+        row['created_at'] = _timestamp(row['created_at'])
+        return row
+
+    def find_stories(self, story_id=None, genre=None, age=None):
+        """
+        Returns:
+        - list[dict]: Stories matching every filter given, in id order. Archived stories have
+          empty content and name their cold storage segment in archive_segment.
+        """
+        query = f"SELECT {', '.join(STORY_DATA_COLUMNS)} FROM story_data WHERE 1=1"
+        params = {}
+        for column, value in (('story_id', story_id), ('genre', genre), ('age', age)):
+            if value is not None:
+                query += f" AND {column} = :{column}"
+                params[column] = value
+        with self.engine.session() as session:
+            return [self._story(row) for row in session.all(query + " ORDER BY story_id", params)]
+
+    def list_summaries(self, order_by='created_at', descending=True, limit=None, offset=0, genre=None, age=None):
+        """
+        Story metadata without the content, for list and sort views.
+
+        Parameters:
+        - order_by (str): A key of SUMMARY_ORDERS.
+        - descending (bool): Newest/last first when True.
+        - limit (int, optional): Maximum number of stories to return.
+        - offset (int): Number of stories to skip.
+        - genre (str, optional): Genre filter.
+        - age (int, optional): Age filter.
+
+        Returns:
+        - list[dict]: The SUMMARY_COLUMNS of each story.
+        """
+        direction = 'DESC' if descending else 'ASC'
+        query = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM story_data WHERE 1=1"
+        params = {}
+        for column, value in (('genre', genre), ('age', age)):
+            if value is not None:
+                query += f" AND {column} = :{column}"
+                params[column] = value
+        query += f" ORDER BY {SUMMARY_ORDERS[order_by]} {direction}, story_id {direction}"
+        if limit is not None:
+            query += " LIMIT :limit OFFSET :offset"
+            params.update(limit=limit, offset=offset)
+        elif offset:
+            query += " LIMIT -1 OFFSET :offset" if self.engine.dialect == 'sqlite' else " OFFSET :offset"
+            params['offset'] = offset
+        with self.engine.session() as session:
+            return [self._story(row) for row in session.all(query, params)]
+
+    def iter_stories(self, batch_size=500):
+        """
+        Iterates over all stories in id order without loading the whole table into memory.
+        """
+        with self.engine.session() as session:
+            for row in session.iterate(f"SELECT {', '.join(STORY_DATA_COLUMNS)} FROM story_data ORDER BY story_id",
+                                       batch_size=batch_size):
+                yield self._story(row)
+
+    def story_id_for_hash(self, digest):
+        """
+        Returns:
+        - int: The id of the story whose content has this hash, or None.
+        """
+        with self.engine.session() as session:
+            return session.scalar("SELECT story_id FROM story_data WHERE content_hash = :digest", {'digest': digest})
+
+    def save_story(self, story):
+        """
+        Saves a story unless one with the same content_hash is already stored. Concurrent saves
+        of the same content are settled by the unique index: the loser finds the winner's row.
+
+        Parameters:
+        - story (dict): genre, age, choice_count, segment_count, content, title, word_count and content_hash.
+
+        Returns:
+        - tuple: (story id, True if it was inserted, False if the content was already stored).
+        """
+        existing = self.story_id_for_hash(story['content_hash'])
+        if existing is not None:
+            return existing, False
+        try:
+            with self.engine.transaction() as session:
+                story_id = session.insert('story_data', {**story, 'created_at': _now()}, key='story_id')
+                self._bump_version(session)
+            return story_id, True
+        except self.engine.errors:
+            existing = self.story_id_for_hash(story['content_hash'])
+            if existing is None:
+                raise
+            return existing, False
+
+    def delete_story(self, story_id):
+        """
+        Returns:
+        - int: Number of stories deleted.
+        """
+        with self.engine.transaction() as session:
+            deleted = session.execute("DELETE FROM story_data WHERE story_id = :story_id", {'story_id': story_id})
+            if deleted:
+                self._bump_version(session)
+        return deleted
+
+    def save_starter_page(self, key, variant, content, tokens):
+        """
+        Stores a first page for a (genre, age, choice_count, length) key, replacing the same variant.
+        """
+        params = dict(zip(('genre', 'age', 'choice_count', 'length'), key), variant=variant)
+        with self.engine.transaction() as session:
+            session.execute("DELETE FROM starter_pages WHERE genre = :genre AND age = :age AND "
+                            "choice_count = :choice_count AND length = :length AND variant = :variant", params)
+            session.execute("INSERT INTO starter_pages (genre, age, choice_count, length, variant, content, tokens) "
+                            "VALUES (:genre, :age, :choice_count, :length, :variant, :content, :tokens)",
+                            {**params, 'content': content, 'tokens': tokens})
+
+    def fetch_starter_page(self, key):
+        """
+        Returns:
+        - str: A random variant of the first page stored for the key, or None.
+        """
+        params = dict(zip(('genre', 'age', 'choice_count', 'length'), key))
+        with self.engine.session() as session:
+            rows = session.all("SELECT content FROM starter_pages WHERE genre = :genre AND age = :age AND "
+                               "choice_count = :choice_count AND length = :length", params)
+        return random.choice(rows)['content'] if rows else None
+
+    def starter_page_keys(self):
+        """
+        Returns:
+        - set[tuple]: (genre, age, choice_count, length, variant) for every stored page.
+        """
+        with self.engine.session() as session:
+            rows = session.all("SELECT genre, age, choice_count, length, variant FROM starter_pages")
+        return {(row['genre'], row['age'], row['choice_count'], row['length'], row['variant']) for row in rows}
+
+    def table_version(self):
+        """
+        Returns:
+        - tuple: (version, updated_at) of story_data, bumped on every write.
+        """
+        with self.engine.session() as session:
+            return _read_version(session, 'story_data')
+
+    def close(self):
+        self.engine.close()
@@ -0,0 +1,178 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from flask import Response, request
+
+# orjson and brotli are optional: without them responses fall back to json and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the framing overhead outweighs the savings
+MIN_COMPRESS_BYTES = 1024
+
+
+def dumps(payload):
+    """
+    Serializes a payload to JSON bytes, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def choose_encoding(accept_encoding):
+    """
+    Picks the best content encoding the client accepts: br if available, then gzip.
+
+    Returns:
+    - str: 'br', 'gzip' or 'identity'.
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def http_date(timestamp):
+    """
+    Converts an SQLite CURRENT_TIMESTAMP string (UTC) to an HTTP date, or None.
+    """
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.strptime(str(timestamp), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return format_datetime(parsed, usegmt=True)
+
+
+class EncodedBodyCache:
+    """
+    Small LRU of (encoded body, content encoding) pairs keyed by resource, version and accepted encoding,
+    so repeated requests for an unchanged list skip both the query and the encoding work.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if len(entry[0]) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self.entries[key] = entry
+            self.bytes += len(entry[0])
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+body_cache = EncodedBodyCache()
+
+
+def _not_modified(etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Weak comparison: W/"x" and "x" match, and any listed tag is enough
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or etag.removeprefix('W/') in tags
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def versioned_json(build, version, updated_at=None, status=200):
+    """
+    Builds a compressed, cacheable JSON response for data identified by a table version.
+
+    The ETag is derived from the version, so a conditional request for unchanged data gets
+    a 304 without calling build at all. Otherwise the encoded body is cached per URL,
+    version and encoding.
+
+    Parameters:
+    - build (callable): Returns the payload to serialize; only called on a cache miss.
+    - version (int): Version of the underlying table, bumped on every write.
+    - updated_at (str, optional): SQLite timestamp of the last write, used for Last-Modified.
+    - status (int): HTTP status of a full response.
+
+    Returns:
+    - flask.Response
+    """
+    # Weak, because the same tag is shared by every content encoding of the body
+    etag = f'W/"{version}"'
+    last_modified = http_date(updated_at)
+    headers = {
+        'ETag': etag,
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'no-cache',  # always revalidate; unchanged lists cost a 304
+    }
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    accepted = choose_encoding(request.headers.get('Accept-Encoding'))
+    key = (request.full_path, version, accepted)
+    cached = body_cache.get(key)
+    if cached is None:
+        body = dumps(build())
+        encoding = accepted if len(body) >= MIN_COMPRESS_BYTES else 'identity'
+        cached = (compress(body, encoding), encoding)
+        body_cache.put(key, cached)
+    body, encoding = cached
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, status=status, mimetype='application/json', headers=headers)
@@ -0,0 +1,267 @@
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+from storybook.tracing import bind, span
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PREFETCH = 'prefetch'
+# Dispatch order: a class only runs when no class before it has work that can start
+PRIORITIES = (INTERACTIVE, BATCH, PREFETCH)
+
+_local = threading.local()
+
+
+class SchedulerFull(Exception):
+    """Raised by submit when the user already has max_queued tasks waiting."""
+
+
+def request_user(request):
+    """
+    The key a request's generation work is queued under, and its caps counted against: the user
+    authenticated by the server or middleware in front of the app (REMOTE_USER), else the client
+    address. Headers and body fields are never used, since a client could pick a fresh one per
+    request to get around user_concurrency and max_queued. Behind a reverse proxy, wrap the app
+    in werkzeug's ProxyFix so remote_addr is the client's rather than the proxy's.
+    """
+    return str(request.environ.get('REMOTE_USER') or request.remote_addr or 'anonymous')
+
+
+class _Task:
+    def __init__(self, user, fn, priority, cost):
+        self.user = user
+        self.fn = fn
+        self.priority = priority
+        self.cost = cost
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.wait = None
+
+
+class _Lane:
+    """
+    One priority class: a queue per user, visited round-robin with a deficit counter each.
+    """
+
+    def __init__(self):
+        self.queues = defaultdict(deque)
+        self.active = deque()
+        self.deficits = defaultdict(float)
+        self.waits = deque(maxlen=1000)
+        self.dispatched = 0
+
+
+class FairScheduler:
+    """
+    Runs generation work on a fixed number of workers, shared fairly between users.
+
+    Work is queued per user in three priority classes, dispatched strictly in PRIORITIES order.
+    Within a class users are served by deficit round-robin: every round adds quantum times the
+    user's weight to their deficit, and a task runs once its cost (model calls, say) fits, so
+    a user asking for long stories gets the same share of the workers as one asking for short
+    ones rather than the same number of tasks. A task's cost should count the model calls it
+    fans out into, since each worker can be driving several at once. A user never has more than user_concurrency tasks
+    running, and reserved workers only take interactive work, so continuations do not wait
+    behind a pool full of long batch jobs.
+    """
+
+    def __init__(self, workers=4, user_concurrency=2, reserved=1, quantum=1.0, max_queued=20, weights=None):
+        """
+        Parameters:
+        - workers (int): Tasks run at once. A task can fan out into several model calls (a story's
+          pages are written PAGE_CONCURRENCY at a time, its illustrations ILLUSTRATION_CONCURRENCY
+          at a time, plus any hedged requests), so this bounds concurrent model calls only for
+          single-call tasks; give fan-out tasks a cost counting their calls.
+        - user_concurrency (int): Most tasks one user can have running.
+        - reserved (int): Workers kept for interactive work; batch and prefetch use the rest.
+        - quantum (float): Cost credited to each user per round.
+        - max_queued (int): Most tasks one user can have waiting; submit raises SchedulerFull beyond it.
+        - weights (dict, optional): user -> share relative to the default of 1.
+        """
+        self.workers = max(1, workers)
+        self.user_concurrency = max(1, user_concurrency)
+        self.reserved = min(max(0, reserved), self.workers - 1)
+        self.quantum = quantum
+        self.max_queued = max_queued
+        self.weights = weights or {}
+        self.lanes = {priority: _Lane() for priority in PRIORITIES}
+        self.running = defaultdict(int)
+        self.running_background = 0
+        self.rejected = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.threads = [threading.Thread(target=self._work, name=f'scheduler-{i}', daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a scheduler from SCHEDULER_WORKERS, SCHEDULER_USER_CONCURRENCY, SCHEDULER_RESERVED,
+        SCHEDULER_QUANTUM and SCHEDULER_MAX_QUEUED.
+        """
+        return cls(workers=int(os.getenv("SCHEDULER_WORKERS", "4")),
+                   user_concurrency=int(os.getenv("SCHEDULER_USER_CONCURRENCY", "2")),
+                   reserved=int(os.getenv("SCHEDULER_RESERVED", "1")),
+                   quantum=float(os.getenv("SCHEDULER_QUANTUM", "1")),
+                   max_queued=int(os.getenv("SCHEDULER_MAX_QUEUED", "20")))
+
+    def submit(self, user, fn, priority=INTERACTIVE, cost=1.0):
+        """
+        Queues fn() to run on a worker.
+
+        Parameters:
+        - user (str): Whose work this is; fairness and caps are per user.
+        - fn (callable): The work, taking no arguments.
+        - priority (str): INTERACTIVE, BATCH or PREFETCH.
+        - cost (float): Relative size of the work, e.g. the model calls it makes.
+
+        Returns:
+        - concurrent.futures.Future: fn's result or exception.
+        """
+        return self._enqueue(user, fn, priority, cost).future
+
+    def _enqueue(self, user, fn, priority, cost):
+        if priority not in self.lanes:
+            raise ValueError(f"Unknown priority {priority}; expected one of {PRIORITIES}")
+        task = _Task(user, fn, priority, max(cost, 0.0))
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Scheduler is shut down")
+            lane = self.lanes[priority]
+            queue = lane.queues[user]
+            if len(queue) >= self.max_queued:
+                self.rejected += 1
+                raise SchedulerFull(f"Too many queued requests for {user}")
+            if not queue:
+                lane.active.append(user)
+            queue.append(task)
+            self.ready.notify()
+        return task
+
+    def run(self, user, fn, priority=INTERACTIVE, cost=1.0):
+        """
+        Runs fn() on a worker and waits for it. Called from a task already on a worker, it runs
+        fn() right away, so nested calls cannot deadlock the pool.
+
+        Returns:
+        - Whatever fn returns; its exceptions are raised here.
+        """
+        if getattr(_local, 'worker', False):
+            return fn()
+        with span('scheduler.run', priority=priority, cost=cost) as s:
+            task = self._enqueue(user, bind(fn), priority, cost)
+            try:
+                return task.future.result()
+            finally:
+                s.set(wait_ms=round((task.wait or 0) * 1000, 3))
+
+    def _eligible(self, user):
+        return self.running.get(user, 0) < self.user_concurrency
+
+    def _take(self, lane):
+        """
+        Picks the next task of a lane by deficit round-robin, skipping users at their cap.
+        Called with the lock held; returns None if no task in the lane can start.
+        """
+        eligible = [user for user in lane.active if self._eligible(user)]
+        if not eligible:
+            return None
+        for _ in range(2):
+            for _ in range(len(lane.active)):
+                user = lane.active[0]
+                queue = lane.queues[user]
+                if self._eligible(user) and lane.deficits[user] >= queue[0].cost:
+                    task = queue.popleft()
+                    lane.deficits[user] -= task.cost
+                    if not queue:
+                        # An idle user does not bank credit
+                        lane.active.popleft()
+                        del lane.queues[user]
+                        lane.deficits.pop(user, None)
+                    elif lane.deficits[user] < queue[0].cost:
+                        lane.active.rotate(-1)
+                    return task
+                lane.active.rotate(-1)
+            # Nobody can afford their next task: play out the rounds until someone can
+            rounds = min(math.ceil((lane.queues[user][0].cost - lane.deficits[user])
+                                   / (self.quantum * self.weights.get(user, 1))) for user in eligible)
+            for user in eligible:
+                lane.deficits[user] += max(rounds, 1) * self.quantum * self.weights.get(user, 1)
+        return None
+
+    def _next(self):
+        for priority in PRIORITIES:
+            if priority != INTERACTIVE and self.running_background >= self.workers - self.reserved:
+                continue
+            task = self._take(self.lanes[priority])
+            if task is not None:
+                return task
+        return None
+
+    def _work(self):
+        _local.worker = True
+        while True:
+            with self.lock:
+                task = self._next()
+                while task is None:
+                    if self.closed:
+                        return
+                    self.ready.wait()
+                    task = self._next()
+                self.running[task.user] += 1
+                if task.priority != INTERACTIVE:
+                    self.running_background += 1
+                task.wait = time.perf_counter() - task.enqueued
+                lane = self.lanes[task.priority]
+                lane.waits.append(task.wait)
+                lane.dispatched += 1
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    task.future.set_result(task.fn())
+                except BaseException as e:
+                    task.future.set_exception(e)
+            with self.lock:
+                self.running[task.user] -= 1
+                if not self.running[task.user]:
+                    del self.running[task.user]
+                if task.priority != INTERACTIVE:
+                    self.running_background -= 1
+                # A finished task can unblock its user's next task or a background slot
+                self.ready.notify_all()
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Per priority class, tasks queued, users waiting, tasks dispatched and p50/p95 queue
+          wait in ms; plus tasks running per user and submissions rejected.
+        """
+        with self.lock:
+            classes = {}
+            for priority, lane in self.lanes.items():
+                waits = sorted(lane.waits)
+                classes[priority] = {
+                    'queued': sum(len(queue) for queue in lane.queues.values()),
+                    'users_waiting': len(lane.active),
+                    'dispatched': lane.dispatched,
+                    'wait_p50_ms': round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    'wait_p95_ms': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+                }
+            return {'workers': self.workers, 'reserved': self.reserved, 'classes': classes,
+                    'running': dict(self.running), 'rejected': self.rejected}
+
+    def shutdown(self):
+        """
+        Stops the workers once the tasks already queued have run.
+        """
+        with self.lock:
+            self.closed = True
+            self.ready.notify_all()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,152 @@
+import json
+import logging
+import re
+
+# JSON schema every structured story segment must follow
+SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "body": {"type": "string"},
+        "choices": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "text": {"type": "string"},
+                },
+                "required": ["id", "text"],
+                "additionalProperties": False,
+            },
+        },
+        "is_final": {"type": "boolean"},
+    },
+    "required": ["title", "body", "choices", "is_final"],
+    "additionalProperties": False,
+}
+
+# Appended to prompts so models without schema enforcement still know the expected shape
+SEGMENT_INSTRUCTIONS = """Respond only with a JSON object with the keys "title" (the story title),
+"body" (the text of this segment without the choices), "choices" (a list of objects with an integer
+"id" starting at 1 and the choice "text"; empty when the story is over) and "is_final" (true only
+when this segment ends the story)."""
+
+# Heuristics used when a response is not valid structured output
+TITLE_PATTERN = re.compile(r"(?:\*\*Title: (.*?)\*\*|Title: (.*?)(?=\n|$))")
+OPTION_PATTERN = re.compile(r"^\s*(?:\*\*)?(?:Option\s*)?(\d+)[.):]\s*(?:\*\*)?\s*(.+?)\s*$", re.MULTILINE)
+ENDING_MARKERS = ("The End", "end of the story")
+
+
+def response_format():
+    """
+    Returns the response_format argument that asks OpenAI for schema-validated segments.
+    Works for both chat.completions.create and beta.threads.runs.create.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "story_segment", "strict": True, "schema": SEGMENT_SCHEMA},
+    }
+
+
+def _validate(data):
+    """
+    Checks a decoded segment against SEGMENT_SCHEMA without a full schema validator.
+
+    Returns:
+    - dict: The normalized segment, or None if it does not match.
+    """
+    if not isinstance(data, dict):
+        return None
+    title, body, choices, is_final = (data.get(key) for key in ("title", "body", "choices", "is_final"))
+    if not isinstance(title, str) or not isinstance(body, str) or not isinstance(is_final, bool):
+        return None
+    if not isinstance(choices, list):
+        return None
+    normalized = []
+    for choice in choices:
+        if not isinstance(choice, dict) or not isinstance(choice.get("text"), str):
+            return None
+        choice_id = choice.get("id")
+        # Models without schema enforcement sometimes quote the number; anything else is rejected
+        if isinstance(choice_id, str) and choice_id.strip().isdigit():
+            choice_id = int(choice_id)
+        if isinstance(choice_id, bool) or not isinstance(choice_id, int):
+            return None
+        normalized.append({"id": choice_id, "text": choice["text"].strip()})
+    return {
+        "title": title.strip() or None,
+        "body": body.strip(),
+        "choices": normalized,
+        "is_final": is_final,
+        "structured": True,
+    }
+
+
+def parse_heuristic(text):
+    """
+    Parses a free-text segment with the old string heuristics.
+
+    Parameters:
+    - text (str): The raw model response.
+
+    Returns:
+    - dict: Segment with the full text as body and any numbered options as choices.
+    """
+    text = text or ""
+    match = TITLE_PATTERN.search(text)
+    title = (match.group(1) or match.group(2)).strip() if match else None
+    choices = [{"id": int(number), "text": option} for number, option in OPTION_PATTERN.findall(text)]
+    return {
+        "title": title or None,
+        "body": text.strip(),
+        "choices": choices,
+        "is_final": any(marker in text for marker in ENDING_MARKERS),
+        "structured": False,
+    }
+
+
+def parse_segment(text):
+    """
+    Parses a model response into a segment, preferring structured JSON output.
+
+    Falls back to parse_heuristic when the response is not JSON or does not match the schema.
+
+    Parameters:
+    - text (str): The raw model response.
+
+    Returns:
+    - dict: title, body, choices (list of {id, text}), is_final, and whether it was structured.
+    """
+    stripped = (text or "").strip()
+    if stripped.startswith("```"):
+        # Some models wrap JSON in a markdown code fence
+        stripped = stripped.strip("`").removeprefix("json").strip()
+    if stripped.startswith("{"):
+        try:
+            segment = _validate(json.loads(stripped))
+            if segment is not None:
+                return segment
+            logging.warning("Structured segment did not match the schema; using heuristic parsing.")
+        except ValueError:
+            logging.warning("Structured segment was not valid JSON; using heuristic parsing.")
+    return parse_heuristic(text)
+
+
+def render_segment(segment):
+    """
+    Turns a segment back into display text for clients that only show plain text.
+
+    Heuristically parsed segments are returned unchanged, since their body is the original text.
+    """
+    if not segment.get("structured"):
+        return segment["body"]
+    parts = []
+    if segment.get("title"):
+        parts.append(f"Title: {segment['title']}")
+    parts.append(segment["body"])
+    if segment["choices"]:
+        parts.append("\n".join(f"{choice['id']}. {choice['text']}" for choice in segment["choices"]))
+    if segment["is_final"] and "The End" not in segment["body"]:
+        parts.append("The End")
+    return "\n\n".join(parts)
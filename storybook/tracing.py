@@ -0,0 +1,268 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+# The span work is currently attributed to, per thread (and per request, under Flask)
+_current = contextvars.ContextVar('storybook_span', default=None)
+
+# Spans kept per trace; a runaway loop must not grow a trace without bound
+MAX_SPANS = 1000
+
+
+class _NoopSpan:
+    """
+    Stands in for a span when the current request is not traced, so instrumented code
+    costs one context variable lookup.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, tracer, trace_id):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.spans = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+
+class Span:
+    """
+    A timed operation within a trace. Use as a context manager; attributes can be added
+    while it runs with set().
+    """
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.started_at = 0.0
+        self.duration_ms = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.trace.add(self)
+        if self.parent_id is None:
+            self.trace.tracer.export(self.trace, self)
+        return False
+
+    def as_dict(self):
+        return {'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name,
+                'started_at': self.started_at, 'duration_ms': self.duration_ms,
+                'attributes': self.attributes, 'error': self.error}
+
+
+def current_span():
+    """
+    Returns the running span, or a no-op stand-in when nothing is being traced.
+    """
+    return _current.get() or NOOP
+
+
+def span(name, **attributes):
+    """
+    Starts a child of the running span; a no-op when nothing is being traced.
+
+    Example:
+    - with span('openai.chat', model=model) as s: ...; s.set(tokens=usage.total_tokens)
+    """
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def traced(name):
+    """
+    Decorator that runs a function in a span of the given name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(function):
+    """
+    Makes a function handed to another thread (e.g. a ThreadPoolExecutor) record its spans
+    under the span that is running now. Returns the function unchanged when nothing is traced.
+    """
+    parent = _current.get()
+    if parent is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+class RingBuffer:
+    """
+    Keeps the most recent finished traces in memory.
+    """
+
+    def __init__(self, capacity=200):
+        self.traces = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+
+    def export(self, record):
+        with self.lock:
+            self.traces.append(record)
+
+    def slow(self, min_ms=0.0, limit=20):
+        """
+        Returns:
+        - list[dict]: Traces that took at least min_ms, slowest first.
+        """
+        with self.lock:
+            traces = [record for record in self.traces if record['duration_ms'] >= min_ms]
+        return sorted(traces, key=lambda record: record['duration_ms'], reverse=True)[:limit]
+
+
+class JsonlExporter:
+    """
+    Appends each finished trace to a file as one JSON line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class Tracer:
+    """
+    Decides which requests are traced and hands finished traces to the exporters.
+
+    A request is traced when it sends X-Trace: 1 or is picked at sample_rate. Untraced
+    requests run the instrumented code with no-op spans.
+    """
+
+    def __init__(self, sample_rate=0.0, buffer=None, exporters=()):
+        """
+        Parameters:
+        - sample_rate (float): Fraction of requests traced, 0 to 1.
+        - buffer (RingBuffer, optional): Recent traces, for the slow traces endpoint.
+        - exporters (list, optional): More destinations, e.g. a JsonlExporter.
+        """
+        self.sample_rate = sample_rate
+        self.buffer = buffer or RingBuffer()
+        self.exporters = [self.buffer, *exporters]
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a tracer from TRACE_SAMPLE_RATE (default 0), TRACE_BUFFER (traces kept in
+        memory, default 200) and TRACE_FILE (a JSONL file to append traces to, if set).
+        """
+        path = os.getenv("TRACE_FILE")
+        return cls(sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+                   buffer=RingBuffer(int(os.getenv("TRACE_BUFFER", "200"))),
+                   exporters=[JsonlExporter(path)] if path else [])
+
+    def start(self, name, trace_id=None, force=False, **attributes):
+        """
+        Starts a new trace, e.g. for a request or a background job, if it is sampled.
+
+        Returns:
+        - The root span (a context manager), or a no-op when the trace is not sampled.
+        """
+        if not force and not (self.sample_rate and random.random() < self.sample_rate):
+            return NOOP
+        trace = Trace(self, trace_id or uuid.uuid4().hex)
+        return Span(trace, name, None, attributes)
+
+    def export(self, trace, root):
+        with trace.lock:
+            spans = [span.as_dict() for span in trace.spans]
+            dropped = trace.dropped
+        record = {'trace_id': trace.trace_id, 'name': root.name, 'started_at': root.started_at,
+                  'duration_ms': root.duration_ms, 'attributes': root.attributes, 'error': root.error,
+                  'dropped_spans': dropped, 'spans': spans}
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logging.error(f"Error exporting trace {trace.trace_id}: {e}")
+
+    def instrument(self, app):
+        """
+        Traces a Flask app's requests. A traced response carries its trace id in X-Trace-Id;
+        clients may pass their own id in the same header.
+        """
+        from flask import g, request
+
+        @app.before_request
+        def start_trace():
+            root = self.start(f"{request.method} {request.path}", trace_id=request.headers.get('X-Trace-Id'),
+                              force=request.headers.get('X-Trace') == '1')
+            if root is not NOOP:
+                g.trace_span = root.__enter__()
+
+        @app.after_request
+        def tag_response(response):
+            root = g.get('trace_span')
+            if root is not None:
+                root.set(status=response.status_code, bytes=response.calculate_content_length())
+                response.headers['X-Trace-Id'] = root.trace.trace_id
+            return response
+
+        @app.teardown_request
+        def finish_trace(exc):
+            root = g.pop('trace_span', None)
+            if root is not None:
+                root.__exit__(type(exc) if exc else None, exc, None)
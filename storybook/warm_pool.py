@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSettings:
+    """
+    How a pool key is maintained.
+
+    Parameters:
+    - depth (int): Pages to keep ready.
+    - concurrency (int): Pages of this key generated at the same time while refilling.
+    - max_age (float): Seconds a page may wait before it is discarded as stale.
+    """
+
+    def __init__(self, depth=2, concurrency=1, max_age=24 * 3600):
+        self.depth = depth
+        self.concurrency = concurrency
+        self.max_age = max_age
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads WARM_POOL_DEPTH, WARM_POOL_CONCURRENCY and WARM_POOL_MAX_AGE.
+        """
+        return cls(depth=int(os.getenv("WARM_POOL_DEPTH", "2")),
+                   concurrency=int(os.getenv("WARM_POOL_CONCURRENCY", "1")),
+                   max_age=float(os.getenv("WARM_POOL_MAX_AGE", str(24 * 3600))))
+
+
+class WarmPool:
+    """
+    Ready-to-serve first pages per story configuration, kept topped up in the background.
+
+    A request pops a page (each page is served once) and the key is refilled asynchronously,
+    so common configurations start in milliseconds. Keys are learned from requests, up to
+    max_keys, and remembered in SQLite along with their pages so the pool survives restarts
+    and is shared by every worker using the same database file.
+    """
+
+    def __init__(self, db_path, generate, settings=None, workers=2, max_keys=50, available=None):
+        """
+        Parameters:
+        - db_path (str): SQLite database holding the warm_pages table.
+        - generate (callable): Takes a key tuple and returns (page text, tokens spent).
+        - settings (PoolSettings, optional): Defaults for every key; see configure for overrides.
+        - workers (int): Refill threads shared by all keys.
+        - max_keys (int): Most configurations to keep warm.
+        - available (callable, optional): Returns False while refills should be skipped,
+          e.g. when the model circuit breaker is open.
+        """
+        self.generate = generate
+        self.settings = settings or PoolSettings()
+        self.overrides = {}
+        self.max_keys = max_keys
+        self.available = available or (lambda: True)
+        self.in_flight = {}
+        self.closed = False
+        self.counters = {'hits': 0, 'misses': 0, 'refills': 0, 'refill_failures': 0,
+                         'refill_tokens': 0, 'refill_seconds': 0.0, 'expired': 0}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm-pool')
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS warm_pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pool_key TEXT NOT NULL,
+                    page TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_warm_pages_key ON warm_pages (pool_key, id)")
+
+    @staticmethod
+    def _encode(key):
+        return json.dumps(list(key))
+
+    def configure(self, key, **settings):
+        """
+        Overrides depth, concurrency or max_age for one key and starts keeping it warm.
+        """
+        base = self.overrides.get(tuple(key), self.settings)
+        values = {'depth': base.depth, 'concurrency': base.concurrency, 'max_age': base.max_age, **settings}
+        self.overrides[tuple(key)] = PoolSettings(**values)
+        self.refill(key)
+
+    def settings_for(self, key):
+        return self.overrides.get(tuple(key), self.settings)
+
+    def pop(self, key):
+        """
+        Takes a ready page for a configuration and schedules a refill.
+
+        Returns:
+        - str: The page, or None if none is ready.
+        """
+        settings = self.settings_for(key)
+        if settings.depth <= 0:
+            return None
+        encoded = self._encode(key)
+        with self.lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM warm_pages WHERE pool_key = ? AND created_at < ?",
+                                       (encoded, time.time() - settings.max_age))
+            self.counters['expired'] += cursor.rowcount
+            row = self.conn.execute('''
+                DELETE FROM warm_pages WHERE id = (
+                    SELECT id FROM warm_pages WHERE pool_key = ? ORDER BY id LIMIT 1
+                ) RETURNING page''', (encoded,)).fetchone()
+            self.counters['hits' if row else 'misses'] += 1
+        self.refill(key)
+        return row[0] if row else None
+
+    def depth(self, key):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM warm_pages WHERE pool_key = ?",
+                                     (self._encode(key),)).fetchone()[0]
+
+    def keys(self):
+        """
+        Returns:
+        - list[tuple]: Every configuration with pages or an override.
+        """
+        with self.lock:
+            stored = [tuple(json.loads(row[0]))
+                      for row in self.conn.execute("SELECT DISTINCT pool_key FROM warm_pages")]
+        return list(dict.fromkeys(stored + list(self.overrides)))
+
+    def refill(self, key):
+        """
+        Schedules generation of the pages a key is missing, at most its concurrency at a time.
+        New keys are ignored once max_keys configurations are being kept warm.
+        """
+        key = tuple(key)
+        settings = self.settings_for(key)
+        if self.closed or settings.depth <= 0 or not self.available():
+            return
+        missing = settings.depth - self.depth(key)
+        with self.lock:
+            if missing == settings.depth and key not in self.in_flight and key not in self.overrides:
+                stored = {row[0] for row in self.conn.execute("SELECT DISTINCT pool_key FROM warm_pages")}
+                if len(stored | {self._encode(k) for k in self.in_flight}) >= self.max_keys:
+                    return
+            running = self.in_flight.get(key, 0)
+            starting = max(0, min(missing - running, settings.concurrency - running))
+            if not starting:
+                return
+            self.in_flight[key] = running + starting
+        for _ in range(starting):
+            self.pool.submit(self._refill_one, key)
+
+    def warm(self):
+        """
+        Refills every known key, e.g. at startup.
+        """
+        for key in self.keys():
+            self.refill(key)
+
+    def _refill_one(self, key):
+        start = time.monotonic()
+        try:
+            page, tokens = self.generate(key)
+            if not page:
+                raise ValueError("empty page")
+            with self.lock, self.conn:
+                self.conn.execute("INSERT INTO warm_pages (pool_key, page, tokens, created_at) VALUES (?, ?, ?, ?)",
+                                  (self._encode(key), page, tokens or 0, time.time()))
+                self.counters['refills'] += 1
+                self.counters['refill_tokens'] += tokens or 0
+                self.counters['refill_seconds'] += time.monotonic() - start
+            failed = False
+        except Exception as e:
+            logging.error(f"Warm pool refill for {key} failed: {e}")
+            with self.lock:
+                self.counters['refill_failures'] += 1
+            failed = True
+        finally:
+            with self.lock:
+                self.in_flight[key] -= 1
+                if not self.in_flight[key]:
+                    del self.in_flight[key]
+        # Keep going until the key is full; a failure waits for the next pop instead of retrying hot
+        if not failed:
+            self.refill(key)
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Hit rate, refill cost (pages, tokens and seconds, in total and per page) and depth per key.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            depths = {row[0]: row[1] for row in self.conn.execute(
+                "SELECT pool_key, COUNT(*) FROM warm_pages GROUP BY pool_key")}
+            in_flight = sum(self.in_flight.values())
+        lookups = counters['hits'] + counters['misses']
+        refills = counters['refills']
+        return {
+            **counters,
+            'refill_seconds': round(counters['refill_seconds'], 3),
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'tokens_per_refill': round(counters['refill_tokens'] / refills, 1) if refills else 0.0,
+            'seconds_per_refill': round(counters['refill_seconds'] / refills, 3) if refills else 0.0,
+            'in_flight': in_flight,
+            'depths': depths,
+        }
+
+    def shutdown(self, wait=True):
+        self.closed = True
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+        self.conn.close()
@@ -0,0 +1,72 @@
+import time
+import unittest
+from storybook.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from storybook.policy import FIRST_PAGE, CallPolicy, ExecutionPolicy, Tier
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.is_open())
+        self.assertGreater(breaker.retry_after(), 59)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success(0.1)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_allows_one_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # only one trial at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_success(0.01)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call()
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=1.0)
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()['slow_calls'], 2)
+
+    def test_policy_stops_calling_once_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        policy = ExecutionPolicy({FIRST_PAGE: CallPolicy([Tier('primary'), Tier('backup')])}, breaker=breaker)
+        attempts = []
+
+        def call(tier):
+            attempts.append(tier.model)
+            raise RuntimeError("down")
+
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                policy.run(FIRST_PAGE, call)
+        with self.assertRaises(CircuitOpenError):
+            policy.run(FIRST_PAGE, call)
+        # One breaker failure per call, after every tier was tried
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(policy.stats()['breaker']['state'], OPEN)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import httpx
+from openai import BadRequestError, OpenAI
+from storybook.cassettes import RecordingTransport, ReplayTransport
+
+BASE_URL = 'https://api.test/v1'
+
+def completion(text):
+    return {'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-test',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}]}
+
+class TestCassettes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cassette.jsonl')
+        self.polls = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def handler(self, request):
+        if request.url.path.endswith('/chat/completions'):
+            prompt = json.loads(request.content)['messages'][-1]['content']
+            return httpx.Response(200, json=completion(f"A story about {prompt}"))
+        # A run that is queued, then in progress, then completed
+        self.polls += 1
+        status = ['queued', 'in_progress', 'completed'][min(self.polls, 3) - 1]
+        return httpx.Response(200, json={'id': 'run_1', 'status': status})
+
+    def client(self, transport):
+        return OpenAI(api_key='sk-secret', base_url=BASE_URL, max_retries=0,
+                      http_client=httpx.Client(transport=transport))
+
+    def chat(self, client, prompt):
+        response = client.chat.completions.create(model='gpt-test', messages=[{'role': 'user', 'content': prompt}])
+        return response.choices[0].message.content
+
+    def record(self):
+        client = self.client(RecordingTransport(self.path, httpx.MockTransport(self.handler)))
+        stories = [self.chat(client, 'a dragon'), self.chat(client, 'a fox')]
+        polls = [client.get('/threads/t/runs/run_1', cast_to=httpx.Response).json()['status'] for _ in range(3)]
+        return stories, polls
+
+    def test_replay_returns_the_recorded_responses(self):
+        stories, polls = self.record()
+        self.assertEqual(polls, ['queued', 'in_progress', 'completed'])
+        client = self.client(ReplayTransport(self.path, speed=0))
+        # Bodies pick their own interaction whatever the order; identical requests replay in order
+        self.assertEqual(self.chat(client, 'a fox'), stories[1])
+        self.assertEqual(self.chat(client, 'a dragon'), stories[0])
+        self.assertEqual([client.get('/threads/t/runs/run_1', cast_to=httpx.Response).json()['status']
+                          for _ in range(3)], polls)
+
+    def test_unrecorded_body_falls_back_to_the_path_then_misses(self):
+        self.record()
+        transport = ReplayTransport(self.path, speed=0)
+        client = self.client(transport)
+        self.assertEqual(self.chat(client, 'a whale'), "A story about a dragon")
+        self.assertEqual(self.chat(client, 'a whale'), "A story about a fox")
+        with self.assertRaises(BadRequestError):
+            self.chat(client, 'a whale')
+        self.assertEqual(transport.misses, 1)
+        self.assertEqual(transport.remaining(), 3)
+        transport.rewind()
+        self.assertEqual((transport.misses, transport.remaining()), (0, 5))
+
+    def test_speed_scales_recorded_latency(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'method': 'POST', 'path': '/v1/chat/completions', 'body': '', 'status': 200,
+                                'headers': {'content-type': 'application/json'},
+                                'response': {'text': json.dumps(completion("Once upon a time"))},
+                                'elapsed': 0.2}) + "\n")
+        client = self.client(ReplayTransport(self.path, speed=0.5))
+        start = time.perf_counter()
+        self.assertEqual(self.chat(client, 'anything'), "Once upon a time")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+
+    def test_api_key_is_not_recorded(self):
+        self.record()
+        with open(self.path, encoding='utf-8') as f:
+            text = f.read()
+        self.assertNotIn('sk-secret', text)
+        self.assertEqual(len(text.splitlines()), 5)
+
+if __name__ == '__main__':
+    unittest.main()
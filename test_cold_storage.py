@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import story_archive
+from backend_example.cold_storage import ColdStore, Segment, write_segment
+from backend_example.database import StoryDatabase
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_random_access_and_iteration(self):
+        stories = [{'story_id': i, 'content': f"Title: Story {i}\nOnce upon a time " * 20} for i in range(50, 0, -3)]
+        name = write_segment(self.tmp.name, stories)
+        segment = Segment(os.path.join(self.tmp.name, name))
+        try:
+            self.assertEqual(segment.get(20), {'story_id': 20, 'content': stories[10]['content']})
+            self.assertIsNone(segment.get(21))
+            self.assertIsNone(segment.get(99))
+            self.assertEqual([story['story_id'] for story in segment], sorted(s['story_id'] for s in stories))
+        finally:
+            segment.close()
+        raw = sum(len(story['content']) for story in stories)
+        self.assertLess(os.path.getsize(os.path.join(self.tmp.name, name)), raw / 4)
+
+    def test_unreadable_segment(self):
+        store = ColdStore(self.tmp.name)
+        with open(os.path.join(self.tmp.name, 'bad.seg'), 'wb') as f:
+            f.write(b"not a segment" * 4)
+        self.assertIsNone(store.get('bad.seg', 1))
+        self.assertIsNone(store.get('missing.seg', 1))
+
+class TestArchiveStories(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = StoryDatabase(os.path.join(self.tmp.name, 'stories.db'))
+        for i in range(10):
+            self.db.save_story("Fantasy" if i % 2 else "Mystery", 7, 2, 3, f"Title: Tale {i}\nText {i}")
+        with self.db.engine.write() as conn:
+            conn.execute("UPDATE story_data SET created_at = datetime('now', '-100 days') WHERE story_id <= 6")
+        self.before = self.db.fetch_all_stories()
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_reads_are_transparent(self):
+        summaries = self.db.list_stories()
+        self.assertEqual(self.db.archive_stories(older_than_days=90, batch_size=4), 6)
+        self.assertEqual(self.db.archive_stats()['archived_stories'], 6)
+        self.assertEqual(self.db.archive_stats()['segments'], 2)
+        self.assertEqual(self.db.fetch_all_stories(), self.before)
+        self.assertEqual(list(self.db.iter_stories(batch_size=3)), self.before)
+        self.assertEqual(self.db.fetch_story(story_id=2), [self.before[1]])
+        self.assertEqual(self.db.fetch_story(genre="Fantasy", age=7), [s for s in self.before if s['genre'] == "Fantasy"])
+        self.assertEqual(self.db.list_stories(), summaries)
+        # Only the stub is left in the hot database
+        with self.db.engine.read() as conn:
+            self.assertEqual(conn.execute("SELECT content FROM story_data WHERE story_id = 2").fetchone()[0], '')
+
+    def test_archiving_again_and_other_connections(self):
+        self.db.archive_stories(older_than_days=90)
+        self.assertEqual(self.db.archive_stories(older_than_days=90), 0)
+        self.assertTrue(self.db.vacuum())
+        other = StoryDatabase(os.path.join(self.tmp.name, 'stories.db'))
+        try:
+            self.assertEqual(other.fetch_all_stories(), self.before)
+        finally:
+            other.close()
+
+    def test_export_includes_archived_content(self):
+        self.db.archive_stories(older_than_days=90)
+        restored = StoryDatabase(':memory:')
+        try:
+            self.assertEqual(restored.import_stories(self.db.iter_stories()), 10)
+            self.assertEqual(restored.fetch_all_stories(), self.before)
+        finally:
+            restored.close()
+
+    def test_cli_export_includes_archived_content(self):
+        self.db.archive_stories(older_than_days=90)
+        backup = os.path.join(self.tmp.name, 'backup.ndjson.gz')
+        target = os.path.join(self.tmp.name, 'restored.db')
+        with patch('sys.argv', ['story_archive.py', 'export', backup, '--db', self.db.db_path, '--gzip']):
+            story_archive.main()
+        with open(backup, 'rb') as f:
+            exported = list(story_archive.read_ndjson(f))
+        self.assertEqual(exported, self.before)
+        with patch('sys.argv', ['story_archive.py', 'import', backup, '--db', target]):
+            story_archive.main()
+        restored = StoryDatabase(target)
+        try:
+            self.assertEqual(restored.fetch_all_stories(), self.before)
+            self.assertEqual(restored.archive_stats()['archived_stories'], 0)
+        finally:
+            restored.close()
+
+    def test_compaction_purges_deleted_stories(self):
+        self.db.archive_stories(older_than_days=90, batch_size=4)
+        segments = self.db.cold.names()
+        self.assertTrue(self.db.delete_story(2))
+        with self.db.engine.read() as conn:
+            self.assertEqual(conn.execute("SELECT story_id FROM archive_tombstones").fetchall(), [(2,)])
+        # Every story in the second segment goes, so it is removed without a replacement
+        for story_id in (5, 6):
+            self.db.delete_story(story_id)
+
+        self.assertEqual(self.db.compact_archive(), {'segments': 2, 'purged': 3})
+        names = self.db.cold.names()
+        self.assertEqual(len(names), 1)
+        self.assertNotIn(names[0], segments)
+        self.assertEqual([story['story_id'] for story in self.db.cold.segment(names[0])], [1, 3, 4])
+        self.assertEqual(self.db.fetch_all_stories(), [s for s in self.before if s['story_id'] not in (2, 5, 6)])
+        with self.db.engine.read() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM archive_tombstones").fetchone()[0], 0)
+        self.assertEqual(self.db.compact_archive(), {'segments': 0, 'purged': 0})
+
+    def test_in_memory_database_has_no_cold_store(self):
+        db = StoryDatabase(':memory:')
+        try:
+            self.assertEqual(db.archive_stories(older_than_days=0), 0)
+        finally:
+            db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -44,6 +44,38 @@ class TestStoryDatabase(unittest.TestCase):
         self.assertEqual(result[4], segment_count)
         self.assertEqual(result[5], content)
 
+    def test_save_story_records_metadata(self):
+        self.db.save_story("Fantasy", 10, 3, 5, "**Title: The Moon Cat**\nOnce upon a time")
+        story = self.db.fetch_all_stories()[0]
+        self.assertEqual(story['title'], "The Moon Cat")
+        self.assertEqual(story['word_count'], 8)
+        self.assertIsNotNone(story['created_at'])
+
+    def test_backfill_metadata(self):
+        # Simulate rows written before the metadata columns existed
+        self.db.sqlconn.execute(
+            "INSERT INTO story_data (genre, age, choice_count, segment_count, content) VALUES (?, ?, ?, ?, ?)",
+            ("Mystery", 7, 2, 3, "Title: Lost Key\nWho took it?"))
+        self.db.sqlconn.execute(
+            "INSERT INTO story_data (genre, age, choice_count, segment_count, content) VALUES (?, ?, ?, ?, ?)",
+            ("Mystery", 7, 2, 3, "No title here"))
+        self.assertEqual(self.db.backfill_metadata(batch_size=1), 2)
+        titles = [story['title'] for story in self.db.fetch_all_stories()]
+        self.assertEqual(titles, ["Lost Key", "Untitled Story"])
+        self.assertEqual(self.db.backfill_metadata(), 0)
+
+    def test_list_stories_uses_covering_index(self):
+        self.db.save_story("Fantasy", 10, 3, 5, "Title: Beta\nText")
+        self.db.save_story("Fantasy", 10, 3, 5, "Title: Alpha\nText")
+        summaries = self.db.list_stories(order_by='title', descending=False)
+        self.assertEqual([story['title'] for story in summaries], ["Alpha", "Beta"])
+        self.assertNotIn('content', summaries[0])
+
+        plan = self.db.sqlconn.execute(
+            "EXPLAIN QUERY PLAN SELECT story_id, genre, age, choice_count, segment_count, title, word_count, "
+            "created_at FROM story_data ORDER BY created_at DESC, story_id DESC").fetchall()
+        self.assertIn("COVERING INDEX idx_summary_created", plan[0][3])
+
     def test_close(self):
         # Test that the close method does not raise any exceptions
         try:
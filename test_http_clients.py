@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from openai import OpenAI
+from storybook import http_clients
+from storybook.cassettes import RecordingTransport
+from storybook.http_clients import SessionSettings, make_session, openai_http_client, shared_transport
+
+class CountingServer(ThreadingHTTPServer):
+    """
+    Local keep-alive server that counts the connections it accepts.
+    """
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.reply(b'{"ok": true}')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.reply(b'{"object": "list", "data": []}')
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestHttpClients(unittest.TestCase):
+    def setUp(self):
+        self.server = CountingServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_openai_clients_share_one_pool(self):
+        with patch.dict(os.environ, {'OPENAI_CASSETTE': ''}):
+            clients = [OpenAI(api_key="test", base_url=self.url, http_client=openai_http_client()) for _ in range(3)]
+            for client in clients:
+                client.models.list()
+                client.models.list()
+            # Closing one client leaves the shared pool open for the others
+            clients[0].close()
+            clients[1].models.list()
+        self.assertEqual(self.server.connections, 1)
+        self.assertIs(shared_transport(), shared_transport())
+
+    def test_recording_goes_through_the_shared_transport(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {
+                'OPENAI_CASSETTE': os.path.join(tmp, 'cassette.jsonl'), 'OPENAI_CASSETTE_MODE': 'record'}):
+            client = openai_http_client()
+            self.assertIsInstance(client._transport, RecordingTransport)
+            self.assertIs(client._transport.transport, shared_transport())
+
+    def test_backend_session_keeps_connections_alive(self):
+        session = make_session(SessionSettings(pool_size=2, retries=1, read_timeout=5))
+        for _ in range(5):
+            self.assertEqual(session.get(f"{self.url}/api/stories").json(), {'ok': True})
+        self.assertEqual(self.server.connections, 1)
+        adapter = session.get_adapter(self.url)
+        self.assertEqual(adapter.max_retries.total, 1)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+        self.assertIs(http_clients.backend_session(), http_clients.backend_session())
+
+    def test_backend_session_applies_default_timeout(self):
+        session = make_session(SessionSettings(connect_timeout=1, read_timeout=2))
+        with patch('requests.adapters.HTTPAdapter.send', side_effect=RuntimeError) as send:
+            with self.assertRaises(RuntimeError):
+                session.get(f"{self.url}/api/stories")
+            self.assertEqual(send.call_args.kwargs['timeout'], (1, 2))
+            with self.assertRaises(RuntimeError):
+                session.get(f"{self.url}/api/stories", timeout=9)
+            self.assertEqual(send.call_args.kwargs['timeout'], 9)
+
+if __name__ == '__main__':
+    unittest.main()
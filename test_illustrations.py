@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from storybook.illustrations import ImageCache, RateLimiter, illustrate, image_prompts, prompt_hash, split_pages
+from storybook.repository import StoryRepository
+from storybook.storage import SQLiteEngine
+
+class TestIllustrations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repository = StoryRepository(SQLiteEngine(os.path.join(self.tmpdir.name, 'images.sqlite')))
+        self.cache = ImageCache(self.repository)
+        self.generated = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.repository.close()
+        self.tmpdir.cleanup()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.generated.append(prompt)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return None if "broken" in prompt else f"https://images/{prompt_hash(prompt)[:8]}"
+
+    def test_near_identical_prompts_share_a_hash(self):
+        self.assertEqual(prompt_hash("A cat on the moon."), prompt_hash("a cat on  moon"))
+        self.assertNotEqual(prompt_hash("A cat on the moon."), prompt_hash("A dog on the moon."))
+
+    def test_generates_each_distinct_prompt_once_in_order(self):
+        prompts = ["A cat on the moon.", "A dog in a boat.", "a cat on moon", "A fox in the snow."]
+        images = illustrate(prompts, self.generate, cache=self.cache, max_workers=2)
+        self.assertEqual(len(self.generated), 3)
+        self.assertEqual([image['position'] for image in images], [0, 1, 2, 3])
+        self.assertEqual(images[0]['image_url'], images[2]['image_url'])
+        self.assertEqual([image['prompt'] for image in images], prompts)
+        self.assertLessEqual(self.max_running, 2)
+
+    def test_cached_prompts_are_not_generated_again(self):
+        illustrate(["A cat on the moon."], self.generate, cache=self.cache)
+        images = illustrate(["The cat on the moon!", "A dog in a boat."], self.generate, cache=self.cache)
+        self.assertEqual(self.generated, ["A cat on the moon.", "A dog in a boat."])
+        self.assertTrue(images[0]['image_url'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_expired_urls_are_regenerated(self):
+        self.cache.max_age = 0
+        illustrate(["A cat on the moon."], self.generate, cache=self.cache)
+        time.sleep(0.01)
+        illustrate(["A cat on the moon."], self.generate, cache=self.cache)
+        self.assertEqual(len(self.generated), 2)
+
+    def test_failed_images_are_none_and_not_cached(self):
+        images = illustrate(["A broken scene.", "A cat."], self.generate, cache=self.cache)
+        self.assertIsNone(images[0]['image_url'])
+        self.assertTrue(images[1]['image_url'])
+        self.assertIsNone(self.cache.get(prompt_hash("A broken scene.")))
+
+    def test_progress_counts_generated_images(self):
+        updates = []
+        illustrate(["A cat.", "A dog.", "The cat"], self.generate, progress=lambda done, total: updates.append((done, total)))
+        self.assertEqual(updates, [(1, 2), (2, 2)])
+
+    def test_rate_limiter_spaces_out_starts(self):
+        limiter = RateLimiter(per_minute=1200)  # one start every 50 ms
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_prompts_per_page(self):
+        story = "Title: Moon Cat\n\n" + " ".join(f"Word{i}." for i in range(10))
+        self.assertEqual(len(split_pages(story, 3)), 3)
+        self.assertNotIn("Moon Cat", " ".join(split_pages(story, 3)))
+        prompts = image_prompts("a cat", story, 2)
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("Word0.", prompts[0])
+
+        outline = {"title": "Moon Cat", "characters": "Milo.", "setting": "The moon.", "pages": ["Beat 1", "Beat 2"]}
+        prompts = image_prompts("a cat", story, 2, outline)
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("Beat 2", prompts[1])
+
+if __name__ == '__main__':
+    unittest.main()
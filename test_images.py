@@ -0,0 +1,72 @@
+import io
+import tempfile
+import unittest
+from flask import Flask
+from PIL import Image, PngImagePlugin
+from storybook.images import FORMATS, ImageStore, serve_image
+
+def png_bytes(size=512):
+    image = Image.new('RGBA', (size, size))
+    image.putdata([(x % 256, y % 256, (x * y) % 256, 255) for y in range(size) for x in range(size)])
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "generated by a test")
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', pnginfo=info)
+    return buffer.getvalue()
+
+class TestImageStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.original = png_bytes()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(self.tmpdir.name)
+        self.asset_id = self.store.ingest(self.original)
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/images/<asset_id>', 'image', lambda asset_id: serve_image(self.store, asset_id))
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_ingest_stores_every_width_and_format_without_metadata(self):
+        for width in self.store.widths:
+            for fmt, _ in FORMATS:
+                path = self.store.path(self.asset_id, width, fmt)
+                with Image.open(path) as image:
+                    self.assertEqual(image.size, (width, width))
+                    self.assertNotIn("Comment", image.info)
+                    self.assertNotIn("exif", image.info)
+                self.assertLess(path.stat().st_size, len(self.original))
+        self.assertEqual(self.store.ingest(self.original), self.asset_id)
+
+    def test_invalid_ids_are_not_paths(self):
+        self.assertIsNone(self.store.path("../../etc/passwd", 128, 'jpeg'))
+        self.assertEqual(self.client.get('/images/' + 'f' * 64).status_code, 404)
+
+    def test_serves_requested_width_in_accepted_format(self):
+        response = self.client.get(f'/images/{self.asset_id}?w=200', headers={'Accept': 'image/webp,*/*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, FORMATS[0][1])
+        with Image.open(io.BytesIO(response.data)) as image:
+            self.assertEqual(image.width, 256)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('Accept', response.headers['Vary'])
+
+        response = self.client.get(f'/images/{self.asset_id}', headers={'Accept': '*/*'})
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(self.client.get(f'/images/{self.asset_id}?w=big').status_code, 400)
+
+    def test_conditional_and_range_requests(self):
+        response = self.client.get(f'/images/{self.asset_id}?w=128')
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertEqual(self.client.get(f'/images/{self.asset_id}?w=128',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        partial = self.client.get(f'/images/{self.asset_id}?w=128', headers={'Range': 'bytes=0-99'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.data, response.data[:100])
+
+if __name__ == '__main__':
+    unittest.main()
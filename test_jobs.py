@@ -0,0 +1,113 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from storybook.jobs import JobQueue, CANCELLED, FAILED, QUEUED, SUCCEEDED, check_callback_url
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'jobs.sqlite')
+        self.queue = JobQueue(self.db_path, max_workers=1)
+        self.release = threading.Event()
+
+        def blocking(params, job):
+            job.progress(0.5, "Halfway")
+            self.release.wait(5)
+            job.progress(0.9)
+            return {'echo': params['value']}
+
+        def failing(params, job):
+            raise RuntimeError("boom")
+
+        self.queue.register('blocking', blocking)
+        self.queue.register('failing', failing)
+
+    def tearDown(self):
+        self.release.set()
+        self.queue.shutdown()
+        self.tmpdir.cleanup()
+
+    def wait_for(self, job_id, statuses, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.queue.get(job_id)
+            if job['status'] in statuses:
+                return job
+            time.sleep(0.01)
+        self.fail(f"Job {job_id} stuck in {job['status']}")
+
+    def test_submit_returns_immediately_and_reports_progress(self):
+        job_id = self.queue.submit('blocking', {'value': 7})
+        deadline = time.time() + 5
+        while self.queue.get(job_id)['message'] != "Halfway" and time.time() < deadline:
+            time.sleep(0.01)
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['progress'], 0.5)
+
+        self.release.set()
+        job = self.wait_for(job_id, (SUCCEEDED,))
+        self.assertEqual(job['result'], {'echo': 7})
+        self.assertEqual(job['progress'], 1.0)
+
+    def test_failure_is_recorded(self):
+        job = self.wait_for(self.queue.submit('failing', {}), (FAILED,))
+        self.assertEqual(job['error'], "boom")
+
+    def test_cancel_running_and_queued_jobs(self):
+        running = self.queue.submit('blocking', {'value': 1})
+        self.wait_for(running, ('running',))
+        # Only one worker, so this one waits behind the first
+        queued = self.queue.submit('blocking', {'value': 2})
+        self.assertEqual(self.queue.get(queued)['status'], QUEUED)
+
+        self.assertTrue(self.queue.cancel(queued))
+        self.assertTrue(self.queue.cancel(running))
+        self.release.set()
+        self.assertEqual(self.wait_for(running, (CANCELLED,))['status'], CANCELLED)
+        self.assertEqual(self.wait_for(queued, (CANCELLED,))['status'], CANCELLED)
+        self.assertFalse(self.queue.cancel(running))
+
+    def test_recover_requeues_jobs_left_by_a_previous_process(self):
+        self.queue.conn.execute(
+            "INSERT INTO jobs (id, kind, status, params) VALUES ('old-queued', 'blocking', 'queued', '{\"value\": 3}')")
+        self.queue.conn.execute(
+            "INSERT INTO jobs (id, kind, status, params) VALUES ('old-running', 'blocking', 'running', '{}')")
+        self.queue.conn.commit()
+        self.release.set()
+        self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self.wait_for('old-queued', (SUCCEEDED,))['result'], {'echo': 3})
+        self.assertEqual(self.queue.get('old-running')['status'], FAILED)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            self.queue.submit('nope', {})
+
+    def test_callback_urls_must_be_public_http(self):
+        for url in ("ftp://example.com/hook", "http://127.0.0.1:5000/hook", "http://169.254.169.254/latest/meta-data",
+                    "http://10.0.0.8/hook", "http://[::1]/hook", "http://localhost/hook", "file:///etc/passwd"):
+            with self.assertRaises(ValueError, msg=url):
+                self.queue.submit('blocking', {'value': 1}, callback_url=url)
+        check_callback_url("https://93.184.215.14/hook")
+        with patch.dict(os.environ, {'JOB_CALLBACK_HOSTS': "hooks.internal, localhost"}):
+            check_callback_url("http://localhost:8000/hook")
+            with self.assertRaises(ValueError):
+                check_callback_url("https://93.184.215.14/hook")
+
+    def test_callback_does_not_follow_redirects(self):
+        with patch.dict(os.environ, {'JOB_CALLBACK_HOSTS': "hooks.internal"}), \
+                patch('storybook.jobs.requests.post') as post:
+            self.release.set()
+            job_id = self.queue.submit('blocking', {'value': 4}, callback_url="http://hooks.internal/done")
+            self.wait_for(job_id, (SUCCEEDED,))
+            deadline = time.time() + 5
+            while not post.called and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(post.call_args.args, ("http://hooks.internal/done",))
+        self.assertFalse(post.call_args.kwargs['allow_redirects'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sqlite3
+from backend_example.database import StoryDatabase
+from backend_example.migrations import MIGRATIONS, current_version, migrate
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db = StoryDatabase(':memory:')
+
+    def tearDown(self):
+        self.db.close()
+
+    def plan(self, query, parameters=()):
+        rows = self.db.sqlconn.execute("EXPLAIN QUERY PLAN " + query, parameters).fetchall()
+        return " | ".join(row[3] for row in rows)
+
+    def test_all_migrations_applied_once(self):
+        self.assertEqual(current_version(self.db.sqlconn), MIGRATIONS[-1][0])
+        self.assertEqual(migrate(self.db.sqlconn), [])
+        self.db.create_table()
+        count = self.db.sqlconn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+        self.assertEqual(count, len(MIGRATIONS))
+
+    def test_upgrades_original_schema(self):
+        # A database created by the first version of StoryDatabase, before any migrations
+        conn = sqlite3.connect(':memory:')
+        conn.execute('''CREATE TABLE story_data (
+            story_id INTEGER PRIMARY KEY AUTOINCREMENT, genre VARCHAR(60) NOT NULL, age INTEGER NOT NULL,
+            choice_count INTEGER NOT NULL, segment_count INTEGER NOT NULL, content TEXT NOT NULL)''')
+        conn.execute("CREATE INDEX idx_genre ON story_data (genre)")
+        conn.execute("CREATE INDEX idx_age ON story_data (age)")
+        conn.execute("INSERT INTO story_data (genre, age, choice_count, segment_count, content) "
+                     "VALUES (?, ?, ?, ?, ?)", ('Fantasy', 6, 2, 3, 'Title: Old\nText'))
+        conn.commit()
+        self.db.sqlconn.close()
+        self.db.sqlconn = conn
+        self.db.create_table()
+
+        self.assertEqual(current_version(conn), MIGRATIONS[-1][0])
+        self.assertEqual(self.db.fetch_story(genre='Fantasy', age=6)[0]['content'], 'Title: Old\nText')
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('idx_genre_age', indexes)
+        self.assertNotIn('idx_genre', indexes)
+
+    def test_failed_migration_rolls_back(self):
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            conn.execute("SELECT * FROM missing_table")
+        with self.assertRaises(sqlite3.Error):
+            migrate(self.db.sqlconn, MIGRATIONS + [(99, broken)])
+        self.assertEqual(current_version(self.db.sqlconn), MIGRATIONS[-1][0])
+        tables = {row[0] for row in self.db.sqlconn.execute("SELECT name FROM sqlite_master")}
+        self.assertNotIn('half_done', tables)
+
+    # Query-plan regression tests: these fail if a schema change stops the real query shapes using their indexes
+
+    def test_fetch_story_by_genre_and_age_uses_composite_index(self):
+        plan = self.plan("SELECT * FROM story_data WHERE 1=1 AND genre = ? AND age = ? ORDER BY story_id",
+                         ('Fantasy', 6))
+        self.assertIn("USING INDEX idx_genre_age (genre=? AND age=?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_filtered_list_is_covered(self):
+        plan = self.plan("SELECT story_id, genre, age, choice_count, segment_count, title, word_count, created_at "
+                         "FROM story_data WHERE 1=1 AND genre = ? AND age = ? "
+                         "ORDER BY created_at DESC, story_id DESC LIMIT ? OFFSET ?", ('Fantasy', 6, 20, 0))
+        self.assertIn("COVERING INDEX idx_genre_age", plan)
+
+    def test_fetch_story_by_id_uses_primary_key(self):
+        plan = self.plan("SELECT * FROM story_data WHERE 1=1 AND story_id = ? ORDER BY story_id", (1,))
+        self.assertIn("INTEGER PRIMARY KEY", plan)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import unittest
+from storybook.outline import parse_outline, write_story
+from storybook.policy import FIRST_PAGE, OUTLINE, PAGE
+
+def outline_reply(pages):
+    return json.dumps({"title": "Moon Cat", "characters": "Milo, a grey cat.", "setting": "The moon.",
+                       "pages": [{"beat": f"Beat {i}"} for i in range(1, pages + 1)]})
+
+class TestOutline(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def complete(self, text, call_type, json_format):
+        with self.lock:
+            self.calls.append(call_type)
+        if call_type == OUTLINE:
+            return outline_reply(4)
+        if call_type == FIRST_PAGE:
+            return "Revised story"
+        number = int(text.split("Write only page ")[1].split(",")[0])
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01 * (5 - number))  # later pages finish first
+        with self.lock:
+            self.running -= 1
+        return f"Page {number} text."
+
+    def test_parse_outline_requires_one_beat_per_page(self):
+        self.assertEqual(parse_outline(outline_reply(3), 3)['pages'], ["Beat 1", "Beat 2", "Beat 3"])
+        self.assertIsNone(parse_outline(outline_reply(2), 3))
+        self.assertIsNone(parse_outline("not json", 3))
+        self.assertIsNone(parse_outline(json.dumps({"pages": [{"beat": "x"}]}), 1))
+
+    def test_pages_are_written_concurrently_and_stitched_in_order(self):
+        progress = []
+        story, outline = write_story("a cat", 4, self.complete, max_workers=2,
+                                     progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(story, "Title: Moon Cat\n\nPage 1 text.\n\nPage 2 text.\n\nPage 3 text.\n\nPage 4 text.")
+        self.assertEqual(outline['title'], "Moon Cat")
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(self.calls.count(PAGE), 4)
+
+    def test_consistency_pass(self):
+        story, _ = write_story("a cat", 4, self.complete, consistency=True)
+        self.assertEqual(story, "Title: Moon Cat\n\nRevised story")
+
+    def test_failures(self):
+        self.assertEqual(write_story("a cat", 4, lambda text, call_type, json_format: None), (None, None))
+
+        def one_page_fails(text, call_type, json_format):
+            if call_type == PAGE and "Write only page 3" in text:
+                return None
+            return self.complete(text, call_type, json_format)
+
+        story, outline = write_story("a cat", 4, one_page_fails)
+        self.assertIsNone(story)
+        self.assertIsNotNone(outline)
+        self.assertEqual(self.calls.count(PAGE), 3)
+
+    def test_failed_page_is_written_again(self):
+        failures = []
+
+        def page_fails_once(text, call_type, json_format):
+            if call_type == PAGE and "Write only page 3" in text and not failures:
+                failures.append(text)
+                return None
+            return self.complete(text, call_type, json_format)
+
+        story, _ = write_story("a cat", 4, page_fails_once)
+        self.assertIn("Page 3 text.", story)
+        self.assertEqual(self.calls.count(PAGE), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+import unittest
+from storybook.policy import FIRST_PAGE, CallPolicy, ExecutionPolicy, Tier, percentile, tiers_from_env
+
+class TestExecutionPolicy(unittest.TestCase):
+    def make_policy(self, models, **options):
+        options.setdefault('min_samples', 5)
+        self.tiers = [Tier(model) for model in models]
+        return ExecutionPolicy({FIRST_PAGE: CallPolicy(self.tiers, **options)})
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile(list(range(1, 101)), 0.99), 99)
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+
+    def test_slow_call_is_hedged_and_first_answer_wins(self):
+        policy = self.make_policy(['primary'], hedge_percentile=0.9, min_hedge_delay=0.01)
+        for _ in range(5):
+            policy.run(FIRST_PAGE, lambda tier: 'warm')
+
+        calls = []
+        release = threading.Event()
+
+        def call(tier):
+            calls.append(tier.model)
+            if len(calls) == 1:
+                release.wait(2)  # the primary stalls
+                return 'slow'
+            return 'hedge'
+
+        start = time.monotonic()
+        self.assertEqual(policy.run(FIRST_PAGE, call), 'hedge')
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+        stats = policy.stats()[FIRST_PAGE]
+        self.assertEqual((stats['hedges'], stats['hedge_wins']), (1, 1))
+
+    def test_running_losers_cap_hedging(self):
+        self.tiers = [Tier('primary')]
+        policy = ExecutionPolicy({FIRST_PAGE: CallPolicy(self.tiers, hedge_percentile=0.9, min_samples=5,
+                                                         min_hedge_delay=0.01)}, max_losers=1)
+        for _ in range(5):
+            policy.run(FIRST_PAGE, lambda tier: 'warm')
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def stall_first(tier):
+            calls.append(tier)
+            if len(calls) == 1:
+                release.wait(2)
+                return 'slow'
+            return 'hedge'
+        self.assertEqual(policy.run(FIRST_PAGE, stall_first), 'hedge')
+        self.assertEqual(policy.stats()['abandoned_calls'], 1)
+
+        # The abandoned primary is still running, so the next slow call is not hedged
+        self.assertEqual(policy.run(FIRST_PAGE, lambda tier: (time.sleep(0.1), 'waited')[1]), 'waited')
+        stats = policy.stats()[FIRST_PAGE]
+        self.assertEqual((stats['hedges'], stats['hedges_skipped']), (1, 1))
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(policy.stats()['abandoned_calls'], 0)
+
+    def test_no_hedging_when_disabled(self):
+        policy = self.make_policy(['primary'], hedge_percentile=None)
+        for _ in range(10):
+            policy.run(FIRST_PAGE, lambda tier: 'ok')
+        self.assertIsNone(policy.policies[FIRST_PAGE].hedge_delay())
+        self.assertEqual(policy.stats()[FIRST_PAGE]['hedges'], 0)
+
+    def test_falls_back_and_skips_degraded_tier(self):
+        policy = self.make_policy(['primary', 'backup'], degrade_after=2, cooldown=60)
+        attempts = []
+
+        def call(tier):
+            attempts.append(tier.model)
+            if tier.model == 'primary':
+                raise RuntimeError("primary down")
+            return tier.model
+
+        for _ in range(3):
+            self.assertEqual(policy.run(FIRST_PAGE, call), 'backup')
+        # After two failures the primary is skipped entirely
+        self.assertEqual(attempts, ['primary', 'backup', 'primary', 'backup', 'backup'])
+        stats = policy.stats()[FIRST_PAGE]
+        self.assertEqual(stats['fallbacks'], 2)
+        self.assertEqual([tier['healthy'] for tier in stats['tiers']], [False, True])
+
+    def test_raises_when_every_tier_fails(self):
+        policy = self.make_policy(['primary', 'backup'])
+
+        def call(tier):
+            raise RuntimeError(f"{tier.model} down")
+
+        with self.assertRaisesRegex(RuntimeError, "backup down"):
+            policy.run(FIRST_PAGE, call)
+        self.assertEqual(policy.stats()[FIRST_PAGE]['failures'], 1)
+
+    def test_tiers_from_env(self):
+        os.environ['STORY_MODELS_FIRST_PAGE'] = "model-a, model-b@http://backup/v1"
+        try:
+            tiers = tiers_from_env(FIRST_PAGE, 'default', 'client', make_client=lambda url: f"client:{url}")
+        finally:
+            del os.environ['STORY_MODELS_FIRST_PAGE']
+        self.assertEqual([(t.model, t.client) for t in tiers],
+                         [('model-a', 'client'), ('model-b', 'client:http://backup/v1')])
+        self.assertEqual([t.model for t in tiers_from_env(FIRST_PAGE, 'default', None)], ['default'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend_example.database import StoryDatabase
+from backend_example.pregenerate import ChatPageWriter, build_matrix, run_batch
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like the OpenAI API, echoing the prompt back as the page."""
+    calls = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).calls += 1
+        prompt = body['messages'][-1]['content']
+        payload = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body['model'],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"Title: Test\n{prompt[:60]}"}}],
+            "usage": {"prompt_tokens": 90, "completion_tokens": 10, "total_tokens": 100},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPregenerate(unittest.TestCase):
+    def setUp(self):
+        FakeChatHandler.calls = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeChatHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.writer = ChatPageWriter(base_url=base_url, api_key="test-key")
+        self.db = StoryDatabase(':memory:')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmpdir.name, 'checkpoint.json')
+        self.matrix = build_matrix(["Fantasy", "Mystery"], range(5, 8), range(2, 4), [3])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_generates_whole_matrix(self):
+        report = run_batch(self.db, self.matrix, self.writer, workers=4, checkpoint_path=self.checkpoint)
+        self.assertEqual(report['generated'], len(self.matrix))
+        self.assertEqual(report['tokens'], 100 * len(self.matrix))
+        self.assertGreater(report['stories_per_minute'], 0)
+        self.assertIn("Fantasy", self.db.fetch_starter_page("Fantasy", "6", "3", 3))
+
+    def test_spend_cap_and_resume(self):
+        first = run_batch(self.db, self.matrix, self.writer, workers=2,
+                          max_tokens=500, checkpoint_path=self.checkpoint)
+        self.assertTrue(first['capped'])
+        self.assertLess(first['generated'], len(self.matrix))
+
+        second = run_batch(self.db, self.matrix, self.writer, workers=2, checkpoint_path=self.checkpoint)
+        self.assertEqual(second['skipped'], first['generated'])
+        self.assertEqual(first['generated'] + second['generated'], len(self.matrix))
+        self.assertEqual(FakeChatHandler.calls, len(self.matrix))
+
+if __name__ == '__main__':
+    unittest.main()
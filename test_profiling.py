@@ -0,0 +1,75 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+from flask import Flask
+from storybook.profiling import Profiler
+
+def slow_view():
+    time.sleep(0.02)
+    return {'ok': True}
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def client(self, profiler):
+        app = Flask(__name__)
+        profiler.instrument(app)
+        app.add_url_rule('/api/slow/<int:n>', 'slow', lambda n: slow_view(), methods=['GET', 'POST'])
+        return app.test_client()
+
+    def test_disabled_profiler_adds_no_hooks(self):
+        app = Flask(__name__)
+        Profiler().instrument(app)
+        self.assertFalse(any(app.before_request_funcs.values()))
+        self.assertFalse(any(app.teardown_request_funcs.values()))
+        self.assertEqual(Profiler().list_dumps(), [])
+
+    def test_header_triggers_a_tagged_cprofile_dump(self):
+        profiler = Profiler(self.tmpdir.name)
+        client = self.client(profiler)
+        client.get('/api/slow/1')
+        self.assertEqual(profiler.list_dumps(), [])
+
+        client.post('/api/slow/1', json={'session_id': 'abc-123'}, headers={'X-Profile': '1'})
+        [dump] = profiler.list_dumps()
+        self.assertEqual(dump['route'], 'POST_api_slow_int_n')
+        self.assertEqual(dump['session'], 'abc_123')
+        self.assertEqual(dump['format'], 'pstats')
+        self.assertGreaterEqual(dump['latency_ms'], 20)
+        stats = pstats.Stats(str(profiler.dump_path(dump['name'])))
+        self.assertTrue(any(func[2] == 'slow_view' for func in stats.stats))
+
+    def test_sampler_sees_every_thread(self):
+        profiler = Profiler(self.tmpdir.name, mode='sample', sample_rate=1.0)
+        self.client(profiler).get('/api/slow/1')
+        [dump] = profiler.list_dumps()
+        self.assertEqual(dump['format'], 'folded')
+        with open(profiler.dump_path(dump['name'])) as f:
+            self.assertIn('slow_view', f.read())
+
+    def test_fast_requests_are_discarded_and_old_dumps_rotated(self):
+        profiler = Profiler(self.tmpdir.name, sample_rate=1.0, min_ms=10_000)
+        self.client(profiler).get('/api/slow/1')
+        self.assertEqual(profiler.list_dumps(), [])
+
+        profiler = Profiler(self.tmpdir.name, sample_rate=1.0, max_dumps=2)
+        client = self.client(profiler)
+        for n in range(4):
+            client.get(f'/api/slow/{n}', headers={'X-Session-Id': f's{n}'})
+            time.sleep(0.002)
+        self.assertEqual([dump['session'] for dump in profiler.list_dumps()], ['s3', 's2'])
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+
+    def test_dump_path_rejects_other_files(self):
+        profiler = Profiler(self.tmpdir.name)
+        self.assertIsNone(profiler.dump_path('../secrets.pstats'))
+        self.assertIsNone(profiler.dump_path('1-GET_x-5ms-none.pstats'))
+
+if __name__ == '__main__':
+    unittest.main()
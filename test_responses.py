@@ -0,0 +1,51 @@
+import gzip
+import json
+import unittest
+from flask import Flask
+from storybook.responses import body_cache, choose_encoding, versioned_json
+
+class TestVersionedJson(unittest.TestCase):
+    def setUp(self):
+        body_cache.clear()
+        self.app = Flask(__name__)
+        self.builds = 0
+        self.version = 1
+
+        @self.app.route('/items')
+        def items():
+            def build():
+                self.builds += 1
+                return [{"id": i, "content": "Once upon a time " * 20} for i in range(10)]
+            return versioned_json(build, self.version, '2024-05-01 10:00:00')
+
+        self.client = self.app.test_client()
+
+    def test_compresses_and_sets_validators(self):
+        response = self.client.get('/items', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['ETag'], 'W/"1"')
+        self.assertEqual(response.headers['Last-Modified'], 'Wed, 01 May 2024 10:00:00 GMT')
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))), 10)
+
+    def test_unchanged_version_returns_304_without_building(self):
+        etag = self.client.get('/items').headers['ETag']
+        response = self.client.get('/items', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.builds, 1)
+
+        self.version = 2
+        self.assertEqual(self.client.get('/items', headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.builds, 2)
+
+    def test_encoded_body_is_reused(self):
+        self.client.get('/items', headers={'Accept-Encoding': 'gzip'})
+        self.client.get('/items', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(self.builds, 1)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0'), 'identity')
+        self.assertEqual(choose_encoding(None), 'identity')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+from flask import Flask, request
+from storybook.scheduler import BATCH, INTERACTIVE, PREFETCH, FairScheduler, SchedulerFull, request_user
+
+class TestFairScheduler(unittest.TestCase):
+    def setUp(self):
+        self.order = []
+        self.gate = threading.Event()
+
+    def make(self, **options):
+        self.scheduler = FairScheduler(**options)
+        self.addCleanup(self.scheduler.shutdown)
+        self.addCleanup(self.gate.set)
+        return self.scheduler
+
+    def block(self, user='blocker', priority=INTERACTIVE):
+        # Occupies a worker until the gate opens, so the tasks queued meanwhile are ordered by the scheduler
+        started = threading.Event()
+        future = self.scheduler.submit(user, lambda: (started.set(), self.gate.wait()), priority)
+        started.wait(1)
+        return future
+
+    def record(self, label):
+        return lambda: self.order.append(label)
+
+    def drain(self, futures):
+        self.gate.set()
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_interactive_work_goes_first(self):
+        scheduler = self.make(workers=1, reserved=0)
+        self.block()
+        futures = [scheduler.submit('a', self.record('prefetch'), PREFETCH),
+                   scheduler.submit('b', self.record('batch'), BATCH),
+                   scheduler.submit('c', self.record('interactive'), INTERACTIVE)]
+        self.drain(futures)
+        self.assertEqual(self.order, ['interactive', 'batch', 'prefetch'])
+
+    def test_users_share_by_cost(self):
+        scheduler = self.make(workers=1, reserved=0)
+        self.block()
+        futures = [scheduler.submit('heavy', self.record('heavy'), BATCH, cost=3) for _ in range(2)]
+        futures += [scheduler.submit('light', self.record('light'), BATCH, cost=1) for _ in range(6)]
+        self.drain(futures)
+        # Three light tasks cost as much as one heavy one
+        self.assertEqual(self.order[:4].count('light'), 3)
+        self.assertEqual(self.order[4:].count('light'), 3)
+
+    def test_weights(self):
+        scheduler = self.make(workers=1, reserved=0, weights={'paid': 2})
+        self.block()
+        futures = [scheduler.submit(user, self.record(user)) for _ in range(4) for user in ('free', 'paid')]
+        self.drain(futures)
+        self.assertEqual(self.order[:3].count('paid'), 2)
+
+    def test_user_concurrency_cap(self):
+        scheduler = self.make(workers=3, user_concurrency=1, reserved=0)
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def task():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        futures = [scheduler.submit('greedy', task) for _ in range(4)]
+        other = scheduler.submit('other', self.record('other'))
+        other.result(timeout=1)
+        self.assertEqual(self.order, ['other'])
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(peak[0], 1)
+
+    def test_reserved_workers_only_take_interactive_work(self):
+        scheduler = self.make(workers=2, reserved=1)
+        self.block('a', BATCH)
+        batch = scheduler.submit('b', self.record('batch'), BATCH)
+        interactive = scheduler.submit('c', self.record('interactive'))
+        interactive.result(timeout=1)
+        self.assertFalse(batch.done())
+        self.drain([batch])
+        self.assertEqual(self.order, ['interactive', 'batch'])
+
+    def test_queue_limit_and_errors(self):
+        scheduler = self.make(workers=1, reserved=0, max_queued=2)
+        self.block()
+        futures = [scheduler.submit('a', self.record('a')) for _ in range(2)]
+        with self.assertRaises(SchedulerFull):
+            scheduler.submit('a', self.record('a'))
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+        self.drain(futures)
+        with self.assertRaises(ZeroDivisionError):
+            scheduler.run('a', lambda: 1 / 0)
+
+    def test_nested_run_does_not_deadlock(self):
+        scheduler = self.make(workers=1, reserved=0)
+        self.assertEqual(scheduler.run('a', lambda: scheduler.run('a', lambda: 42)), 42)
+
+    def test_request_user_ignores_client_chosen_ids(self):
+        app = Flask(__name__)
+        with app.test_request_context('/', method='POST', json={'session_id': 'spoofed'},
+                                      headers={'X-User-Id': 'spoofed', 'X-Session-Id': 'spoofed'},
+                                      environ_base={'REMOTE_ADDR': '203.0.113.7'}):
+            self.assertEqual(request_user(request), '203.0.113.7')
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '203.0.113.7', 'REMOTE_USER': 'alice'}):
+            self.assertEqual(request_user(request), 'alice')
+
+if __name__ == '__main__':
+    unittest.main()
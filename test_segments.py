@@ -0,0 +1,57 @@
+import json
+import unittest
+from storybook.segments import parse_segment, render_segment, response_format
+
+class TestSegments(unittest.TestCase):
+    def test_parse_structured_segment(self):
+        raw = json.dumps({
+            "title": "The Moon Cat",
+            "body": "Milo found a glowing door.",
+            "choices": [{"id": 1, "text": "Open it"}, {"id": 2, "text": "Run home"}],
+            "is_final": False,
+        })
+        segment = parse_segment(raw)
+        self.assertTrue(segment['structured'])
+        self.assertEqual(segment['title'], "The Moon Cat")
+        self.assertEqual([choice['id'] for choice in segment['choices']], [1, 2])
+        self.assertFalse(segment['is_final'])
+
+    def test_code_fenced_json_is_accepted(self):
+        raw = '```json\n{"title": "T", "body": "B", "choices": [], "is_final": true}\n```'
+        self.assertTrue(parse_segment(raw)['structured'])
+
+    def test_schema_failure_falls_back_to_heuristics(self):
+        raw = '{"title": "T", "body": "B", "choices": "none", "is_final": false}'
+        segment = parse_segment(raw)
+        self.assertFalse(segment['structured'])
+        self.assertEqual(segment['body'], raw)
+
+    def test_choice_ids_must_be_integers(self):
+        quoted = {"title": "T", "body": "B", "choices": [{"id": "2", "text": "Go"}], "is_final": False}
+        self.assertEqual(parse_segment(json.dumps(quoted))['choices'], [{"id": 2, "text": "Go"}])
+        named = dict(quoted, choices=[{"id": "left", "text": "Go"}])
+        self.assertFalse(parse_segment(json.dumps(named))['structured'])
+
+    def test_heuristic_parsing(self):
+        text = "**Title: Lost Key**\nWho took it?\n1. Ask the dog\n2) Check the garden"
+        segment = parse_segment(text)
+        self.assertFalse(segment['structured'])
+        self.assertEqual(segment['title'], "Lost Key")
+        self.assertEqual(segment['choices'], [{"id": 1, "text": "Ask the dog"}, {"id": 2, "text": "Check the garden"}])
+        self.assertFalse(segment['is_final'])
+        self.assertTrue(parse_segment("And they went home. The End")['is_final'])
+
+    def test_render_round_trips_through_heuristics(self):
+        segment = parse_segment(json.dumps({
+            "title": "T", "body": "Body text.", "choices": [{"id": 1, "text": "Go"}], "is_final": False}))
+        reparsed = parse_segment(render_segment(segment))
+        self.assertEqual(reparsed['title'], "T")
+        self.assertEqual(reparsed['choices'], segment['choices'])
+
+    def test_response_format_is_strict_json_schema(self):
+        fmt = response_format()
+        self.assertEqual(fmt['type'], "json_schema")
+        self.assertTrue(fmt['json_schema']['strict'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from backend_example.database import StoryDatabase
+from storybook.illustrations import ImageCache
+from storybook.repository import StoryRepository
+from storybook.storage import SQLAlchemyEngine, SQLiteEngine, create_engine
+
+IMAGES = [{'position': 0, 'prompt': "a dragon", 'prompt_hash': "h0", 'image_url': "/images/a"},
+          {'position': 1, 'prompt': "a cave", 'prompt_hash': "h1", 'image_url': None}]
+
+class TestSQLiteEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = SQLiteEngine(os.path.join(self.tmp.name, 'test.db'), pool_size=2)
+        with self.engine.write() as conn:
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+
+    def tearDown(self):
+        self.engine.close()
+        self.tmp.cleanup()
+
+    def test_tuned_and_pooled(self):
+        self.assertEqual(self.engine.writer.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        for _ in range(5):
+            with self.engine.read() as conn:
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 0)
+                with self.assertRaises(sqlite3.OperationalError):
+                    conn.execute("INSERT INTO items (name) VALUES ('x')")
+        self.assertEqual(self.engine.stats()['readers_open'], 1)
+
+    def test_failed_transaction_rolls_back(self):
+        with self.assertRaises(ValueError):
+            with self.engine.transaction() as session:
+                session.insert('items', {'name': "kept?"})
+                raise ValueError()
+        with self.engine.session() as session:
+            self.assertEqual(session.scalar("SELECT COUNT(*) FROM items"), 0)
+
+    def test_concurrent_writes_do_not_interleave(self):
+        errors = []
+
+        def write(n):
+            for i in range(25):
+                try:
+                    with self.engine.transaction() as session:
+                        session.insert('items', {'name': f"{n}-{i}"})
+                except sqlite3.Error as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with self.engine.session() as session:
+            self.assertEqual(session.scalar("SELECT COUNT(*) FROM items"), 200)
+
+    def test_story_database_saves_concurrently(self):
+        db = StoryDatabase(os.path.join(self.tmp.name, 'stories.db'), cache_entries=0)
+        results = []
+        threads = [threading.Thread(target=lambda n=n: results.extend(
+            db.save_story("Fantasy", 7, 2, 3, f"Title: Together\nText {n}-{i}") for i in range(20))) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(results))
+        self.assertEqual(len(db.fetch_all_stories()), 160)
+        db.close()
+
+class RepositoryTests:
+    def make_engine(self, path):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repository = StoryRepository(self.make_engine(os.path.join(self.tmp.name, 'stories.db')))
+
+    def tearDown(self):
+        self.repository.close()
+        self.tmp.cleanup()
+
+    def test_story_with_pages_and_images(self):
+        version = self.repository.table_version()[0]
+        story_id = self.repository.save_story("A dragon", "Title: Ember\nOnce...", "/images/a", IMAGES,
+                                              segments=["Once", "upon"])
+        self.assertIsNotNone(story_id)
+        self.assertGreater(self.repository.table_version()[0], version)
+        self.assertEqual(self.repository.get_story(story_id)['title'], "A dragon")
+        self.assertEqual(self.repository.get_story_images([story_id]), {story_id: ["/images/a", None]})
+        self.assertEqual(self.repository.get_story_segments(), {story_id: ["Once", "upon"]})
+        self.assertEqual(self.repository.get_story_images([]), {})
+        self.assertEqual([story['id'] for story in self.repository.iter_stories(batch_size=1)], [story_id])
+
+    def test_failed_save_keeps_nothing(self):
+        broken = [dict(IMAGES[0], prompt=None)]
+        self.assertIsNone(self.repository.save_story("A fox", "Text", images=broken))
+        self.assertEqual(self.repository.get_all_stories(), [])
+
+    def test_image_cache(self):
+        cache = ImageCache(self.repository)
+        self.assertIsNone(cache.get("h0"))
+        cache.put("h0", "a dragon", "/images/a")
+        cache.put("h0", "a dragon", "/images/b")
+        self.assertEqual(cache.get("h0"), "/images/b")
+        self.assertEqual(self.repository.cached_image("h0", max_age=-1), None)
+
+class TestSQLiteRepository(RepositoryTests, unittest.TestCase):
+    def make_engine(self, path):
+        return create_engine(path)
+
+class TestSQLAlchemyRepository(RepositoryTests, unittest.TestCase):
+    def make_engine(self, path):
+        engine = create_engine(f"sqlite:///{path}", pool_size=2)
+        self.assertIsInstance(engine, SQLAlchemyEngine)
+        return engine
+
+class StoryDatabaseTests:
+    def make_path(self, path):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = StoryDatabase(self.make_path(os.path.join(self.tmp.name, 'stories.db')))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_stories_and_starter_pages(self):
+        version = self.db.table_version()[0]
+        first = self.db.save_story("Fantasy", 8, 2, 3, "Title: Beta\nText")
+        second = self.db.save_story("Mystery", 9, 2, 3, "Title: Alpha\nText")
+        self.assertEqual(self.db.save_story("Fantasy", 8, 2, 3, "Title: Beta\nText"), first)
+        self.assertGreater(self.db.table_version()[0], version)
+        self.assertEqual([story['title'] for story in self.db.fetch_story(genre="Mystery")], ["Alpha"])
+        self.assertEqual(self.db.fetch_story(story_id=first)[0]['content'], "Title: Beta\nText")
+        self.assertNotIn('archive_segment', self.db.fetch_all_stories()[0])
+        summaries = self.db.list_stories(order_by='title', descending=False, limit=1, offset=1)
+        self.assertEqual([story['story_id'] for story in summaries], [first])
+        self.assertEqual([story['story_id'] for story in self.db.iter_stories(batch_size=1)], [first, second])
+        self.assertTrue(self.db.delete_story(first))
+        self.assertEqual(self.db.fetch_story(story_id=first), [])
+
+        self.assertTrue(self.db.save_starter_page("Fantasy", "8", 2, "Short", "Once", variant=0))
+        self.assertTrue(self.db.save_starter_page("Fantasy", 8, 2, "Short", "Again", variant=0))
+        self.assertEqual(self.db.fetch_starter_page("Fantasy", 8, 2, "Short"), "Again")
+        self.assertEqual(self.db.starter_page_keys(), {("Fantasy", 8, 2, "Short", 0)})
+
+class TestStoryDatabaseOnSQLite(StoryDatabaseTests, unittest.TestCase):
+    def make_path(self, path):
+        return path
+
+class TestStoryDatabaseOnSQLAlchemy(StoryDatabaseTests, unittest.TestCase):
+    def make_path(self, path):
+        return f"sqlite:///{path}"
+
+    def test_sqlite_jobs_are_refused(self):
+        self.assertIsInstance(self.db.engine, SQLAlchemyEngine)
+        self.assertEqual(self.db.story_stats(), [])
+        self.assertFalse(self.db.vacuum())
+
+    def test_writes_from_another_process_clear_the_cache(self):
+        other = StoryDatabase(self.db.db_path)
+        try:
+            self.assertEqual(self.db.fetch_all_stories(), [])
+            other.save_story("Fantasy", 8, 2, 3, "Title: Elsewhere\nText")
+            self.assertEqual(len(self.db.fetch_all_stories()), 1)
+        finally:
+            other.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+import unittest
+import sqlite3
+from backend_example.database import StoryDatabase
+from backend_example.story_archive import iter_ndjson, read_ndjson, bulk_insert
+from story_archive import PartialImport
+
+class TestStoryArchive(unittest.TestCase):
+    def setUp(self):
+        # Use an in-memory SQLite database for testing purposes
+        self.db = StoryDatabase(':memory:')
+        for i in range(25):
+            self.db.save_story("Fantasy" if i % 2 else "Mystery", 5 + i % 8, 3, 2, f"Story number {i}")
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_iter_stories_matches_fetch_all(self):
+        self.assertEqual(list(self.db.iter_stories(batch_size=4)), self.db.fetch_all_stories())
+
+    def test_round_trip_plain_and_gzip(self):
+        for compress in (False, True):
+            buffer = io.BytesIO(b"".join(iter_ndjson(self.db.iter_stories(), compress=compress)))
+            restored = StoryDatabase(':memory:')
+            try:
+                imported = restored.import_stories(read_ndjson(buffer), batch_size=7)
+                self.assertEqual(imported, 25)
+                self.assertEqual(restored.fetch_all_stories(), self.db.fetch_all_stories())
+            finally:
+                restored.close()
+
+    def test_import_skips_existing_ids_and_restores_indexes(self):
+        stories = list(self.db.iter_stories())
+        self.assertEqual(self.db.import_stories(stories), 0)
+        # Identical content is skipped even under new ids
+        self.assertEqual(self.db.import_stories(stories, keep_ids=False), 0)
+        copies = [dict(story, content=story['content'] + " (copy)") for story in stories]
+        self.assertEqual(self.db.import_stories(copies, keep_ids=False), 25)
+        self.assertEqual(len(self.db.fetch_all_stories()), 50)
+
+        cursor = self.db.sqlconn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'story_data'")
+        indexes = {row[0] for row in cursor.fetchall()}
+        self.assertTrue({'idx_genre_age', 'idx_age'} <= indexes)
+
+    def test_live_import_keeps_indexes_and_counts_partial_loads(self):
+        stories = [dict(story, story_id=None, content=story['content'] + " (copy)") for story in self.db.iter_stories()]
+        body = b"".join(iter_ndjson(stories[:10])) + b"not json\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stories.db')
+            live = StoryDatabase(path)
+            observer = sqlite3.connect(path)
+            seen = []
+
+            def rows():
+                for row in read_ndjson(io.BytesIO(body)):
+                    seen.append(observer.execute("SELECT count(*) FROM sqlite_master WHERE name = 'idx_genre_age'").fetchone()[0])
+                    yield row
+            try:
+                with self.assertRaises(PartialImport) as caught:
+                    live.import_stories(rows(), batch_size=4, keep_ids=False)
+                self.assertEqual(caught.exception.inserted, 8)
+                self.assertEqual(len(live.fetch_all_stories()), 8)
+                self.assertEqual(set(seen), {1})
+            finally:
+                observer.close()
+                live.close()
+
+    def test_bulk_insert_rejects_unknown_table(self):
+        with self.assertRaises(ValueError):
+            bulk_insert(sqlite3.connect(':memory:'), 'sqlite_master', [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from backend_example.database import StoryDatabase
+from backend_example.story_cache import StoryCache
+
+class TestStoryCache(unittest.TestCase):
+    def test_evicts_least_recently_used_by_count(self):
+        cache = StoryCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_bytes(self):
+        cache = StoryCache(max_entries=100, max_bytes=3000)
+        for i in range(5):
+            cache.put(i, "x" * 1000)
+        self.assertLessEqual(cache.stats()['bytes'], 3000)
+        self.assertLess(cache.stats()['entries'], 5)
+        cache.put('huge', "x" * 5000)
+        self.assertEqual(cache.get('huge'), (False, None))
+
+
+class TestStoryDatabaseCache(unittest.TestCase):
+    def setUp(self):
+        self.db = StoryDatabase(':memory:')
+        self.db.save_story("Fantasy", 8, 2, 3, "Title: One\nText")
+        self.story_id = self.db.fetch_all_stories()[0]['story_id']
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_repeated_lookup_skips_database(self):
+        first = self.db.fetch_story(story_id=self.story_id)
+        with patch.object(self.db, '_query_stories', side_effect=AssertionError("database was queried")):
+            self.assertEqual(self.db.fetch_story(story_id=self.story_id), first)
+            self.assertEqual(self.db.fetch_story(story_id=self.story_id, genre="Mystery"), [])
+        self.assertGreaterEqual(self.db.cache_stats()['hits'], 2)
+
+    def test_writes_invalidate_lists_and_deleted_stories(self):
+        self.assertEqual(len(self.db.fetch_all_stories()), 1)
+        self.assertEqual(len(self.db.list_stories()), 1)
+        self.db.save_story("Fantasy", 8, 2, 3, "Title: Two\nText")
+        self.assertEqual(len(self.db.fetch_all_stories()), 2)
+        self.assertEqual(len(self.db.list_stories()), 2)
+
+        self.assertEqual(len(self.db.fetch_story(story_id=self.story_id)), 1)
+        self.db.delete_story(self.story_id)
+        self.assertEqual(self.db.fetch_story(story_id=self.story_id), [])
+        self.assertEqual(len(self.db.fetch_story(genre="Fantasy", age=8)), 1)
+
+    def test_save_replaces_a_cached_miss(self):
+        next_id = self.story_id + 1
+        self.assertEqual(self.db.fetch_story(story_id=next_id), [])
+        self.assertEqual(self.db.save_story("Fantasy", 8, 2, 3, "Title: Two\nText"), next_id)
+        self.assertEqual([story['title'] for story in self.db.fetch_story(story_id=next_id)], ["Two"])
+
+    def test_writes_from_another_connection_clear_the_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'stories.db')
+            reader, writer = StoryDatabase(path), StoryDatabase(path)
+            try:
+                self.assertEqual(reader.fetch_all_stories(), [])
+                writer.save_story("Mystery", 9, 2, 3, "Title: Elsewhere\nText")
+                self.assertEqual(len(reader.fetch_all_stories()), 1)
+            finally:
+                reader.close()
+                writer.close()
+
+if __name__ == '__main__':
+    unittest.main()
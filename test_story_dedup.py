@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import unittest
+from backend_example.database import StoryDatabase
+
+class TestStoryDedup(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = StoryDatabase(os.path.join(self.tmp.name, 'stories.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def legacy(self, content, days_old=0):
+        # A row saved before content hashes existed
+        with self.db.engine.write() as conn:
+            conn.execute("INSERT INTO story_data (genre, age, choice_count, segment_count, content, word_count, created_at) "
+                         "VALUES ('Fantasy', 7, 2, 3, ?, 1, datetime('now', ?))", (content, f"-{days_old} days"))
+
+    def test_duplicate_save_returns_existing_id(self):
+        first = self.db.save_story("Fantasy", 7, 2, 3, "Title: Twin\nSame page")
+        version = self.db.table_version()[0]
+        self.assertEqual(self.db.save_story("Mystery", 9, 3, "Short", "Title: Twin\nSame page"), first)
+        self.assertEqual(self.db.table_version()[0], version)
+        self.assertNotEqual(self.db.save_story("Fantasy", 7, 2, 3, "Title: Twin\nOther page"), first)
+        self.assertEqual(len(self.db.fetch_all_stories()), 2)
+        self.assertFalse(self.db.save_story("Fantasy", 7, 2, 3, None))
+
+    def test_concurrent_duplicates_share_one_row(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.extend(
+            self.db.save_story("Fantasy", 7, 2, 3, "Title: Race\nText") for _ in range(10))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(self.db.fetch_all_stories()), 1)
+
+    def test_deduplicate_keeps_the_oldest_copy(self):
+        self.legacy("Title: A\nOne", days_old=200)
+        self.legacy("Title: B\nTwo")
+        self.legacy("Title: A\nOne")
+        hashed = self.db.save_story("Fantasy", 7, 2, 3, "Title: B\nTwo")
+        self.assertEqual(hashed, 4)
+        # The oldest copy of A is archived; its content comes back from the cold store
+        self.assertEqual(self.db.archive_stories(older_than_days=100), 1)
+        self.legacy("Title: C\nThree")
+
+        self.assertEqual(self.db.deduplicate(batch_size=2), {'hashed': 3, 'removed': 2})
+        stories = self.db.fetch_all_stories()
+        self.assertEqual([(story['story_id'], story['content']) for story in stories],
+                         [(1, "Title: A\nOne"), (2, "Title: B\nTwo"), (5, "Title: C\nThree")])
+        self.assertEqual(self.db.save_story("Fantasy", 7, 2, 3, "Title: A\nOne"), 1)
+        self.assertEqual(self.db.deduplicate(), {'hashed': 0, 'removed': 0})
+        self.assertEqual(self.db.rebuild_stats(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import unittest
+import httpx
+from openai import OpenAI
+from storybook.breaker import CircuitBreaker, CircuitOpenError
+from storybook.policy import FIRST_PAGE
+from story_engines import ASSISTANTS, CHAT, AssistantsEngine, ChatEngine, make_engine
+
+class FakeAPI:
+    """
+    Just enough of the chat completions and Assistants endpoints to hold a conversation,
+    counting the requests each turn takes.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.thread = []
+        self.fail = False
+        self.fail_messages = False
+
+    def reply(self, text):
+        return f"Segment {len(self.requests)} after {text[:20]}"
+
+    def __call__(self, request):
+        self.requests.append(request)
+        path = request.url.path
+        body = json.loads(request.content) if request.content else {}
+        if path.endswith('/chat/completions'):
+            if self.fail:
+                return httpx.Response(500, json={'error': {'message': "down"}})
+            return httpx.Response(200, json={
+                'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': self.reply(body['messages'][-1]['content'])}}]})
+        if path.endswith('/assistants'):
+            return httpx.Response(200, json={'id': 'asst_1', 'object': 'assistant'})
+        if path.endswith('/threads'):
+            return httpx.Response(200, json={'id': 'thread_1', 'object': 'thread'})
+        if path.endswith('/messages') and request.method == 'POST':
+            if self.fail_messages:
+                return httpx.Response(500, json={'error': {'message': "down"}})
+            self.thread.append({'id': f"msg_{len(self.thread)}", 'role': body['role'], 'content': body['content']})
+            return httpx.Response(200, json=self.thread[-1])
+        if path.endswith('/messages'):
+            after = request.url.params.get('after')
+            index = next(i for i, m in enumerate(self.thread) if m['id'] == after) + 1
+            return httpx.Response(200, json={'object': 'list', 'data': [
+                {'id': m['id'], 'role': m['role'], 'content': [{'type': 'text', 'text': {
+                    'value': m['content'], 'annotations': []}}]} for m in self.thread[index:]]})
+        if path.endswith('/runs') and request.method == 'POST':
+            self.thread.append({'id': f"msg_{len(self.thread)}", 'role': 'assistant',
+                                'content': self.reply(self.thread[-1]['content'])})
+            return httpx.Response(200, json={'id': 'run_1', 'status': 'queued'})
+        return httpx.Response(200, json={'id': 'run_1', 'status': 'completed'})
+
+class TestStoryEngines(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeAPI()
+        self.client = OpenAI(api_key='sk-test', base_url='https://api.test/v1', max_retries=0,
+                             http_client=httpx.Client(transport=httpx.MockTransport(self.api)))
+
+    def sent(self, request):
+        return json.loads(request.content)['messages']
+
+    def test_chat_turn_is_one_request_with_history(self):
+        engine = ChatEngine(self.client, 'gpt-test', "Write stories", structured=False)
+        self.assertTrue(engine.seed("Start a story", "Page one"))
+        self.assertEqual(self.api.requests, [])
+        reply = engine.turn("Choice 1")
+        self.assertEqual(len(self.api.requests), 1)
+        self.assertEqual([(m['role'], m['content']) for m in self.sent(self.api.requests[0])],
+                         [('system', "Write stories"), ('user', "Start a story"), ('assistant', "Page one"),
+                          ('user', "Choice 1")])
+        engine.turn("Choice 2")
+        self.assertEqual(len(self.api.requests), 2)
+        self.assertEqual(self.sent(self.api.requests[1])[-2:], [{'role': 'assistant', 'content': reply},
+                                                                {'role': 'user', 'content': "Choice 2"}])
+        engine.new_story()
+        engine.turn("Another story")
+        self.assertEqual(len(self.sent(self.api.requests[2])), 2)
+
+    def test_chat_history_keeps_the_opening(self):
+        engine = ChatEngine(self.client, 'gpt-test', "Write stories", structured=False, history_messages=2)
+        engine.seed("Start a story", "Page one")
+        for i in range(3):
+            engine.turn(f"Choice {i}")
+        contents = [m['content'] for m in self.sent(self.api.requests[-1])]
+        self.assertEqual(contents[:3], ["Write stories", "Start a story", "Page one"])
+        self.assertEqual(len(contents), 6)
+        self.assertEqual(contents[-1], "Choice 2")
+
+    def test_failed_chat_turn_is_not_remembered(self):
+        engine = ChatEngine(self.client, 'gpt-test', "Write stories", structured=False)
+        self.api.fail = True
+        with self.assertRaises(Exception):
+            engine.turn("Lost choice")
+        self.assertEqual(engine.history, [])
+
+    def test_assistants_turn_takes_several_requests(self):
+        engine = AssistantsEngine(self.client, 'gpt-test', "Write stories", structured=False)
+        setup = len(self.api.requests)
+        engine.seed("Start a story", "Page one")
+        reply = engine.turn("Choice 1")
+        self.assertEqual(reply, self.api.thread[-1]['content'])
+        # Two seeded messages, then a message, a run, a poll and the listing
+        self.assertEqual(len(self.api.requests) - setup, 6)
+
+    def test_assistants_failures_open_the_breaker(self):
+        engine = AssistantsEngine(self.client, 'gpt-test', "Write stories", structured=False)
+        engine.policy.breaker = CircuitBreaker(failure_threshold=2)
+        self.api.fail_messages = True
+        with self.assertRaises(Exception):
+            engine.seed("Start a story", "Page one")
+        with self.assertRaises(Exception):
+            engine.turn("Choice 1")
+        self.assertTrue(engine.policy.breaker.is_open())
+        sent = len(self.api.requests)
+        with self.assertRaises(CircuitOpenError):
+            engine.turn("Choice 2")
+        self.assertEqual(len(self.api.requests), sent)
+
+    def test_pages_written_ahead_stay_out_of_the_conversation(self):
+        for engine in (ChatEngine(self.client, 'gpt-test', "Write stories", structured=True),
+                       AssistantsEngine(self.client, 'gpt-test', "Write stories", structured=True)):
+            thread = list(self.api.thread)
+            sent = len(self.api.requests)
+            reply, _ = engine.complete("A first page")
+            self.assertTrue(reply.startswith("Segment"))
+            self.assertEqual(len(self.api.requests), sent + 1)
+            body = json.loads(self.api.requests[-1].content)
+            self.assertEqual(body['response_format']['type'], 'json_schema')
+            self.assertEqual([m['content'] for m in body['messages']], ["Write stories", "A first page"])
+            self.assertEqual(getattr(engine, 'history', []), [])
+            self.assertEqual(self.api.thread, thread)
+            self.assertEqual(engine.policy.stats()[FIRST_PAGE]['calls'], 1)
+
+    def test_make_engine(self):
+        self.assertIsInstance(make_engine(CHAT, self.client, 'gpt-test', "", False), ChatEngine)
+        self.assertIsInstance(make_engine(ASSISTANTS, self.client, 'gpt-test', "", False), AssistantsEngine)
+        with self.assertRaises(ValueError):
+            make_engine('completions', self.client, 'gpt-test', "", False)
+
+if __name__ == '__main__':
+    unittest.main()
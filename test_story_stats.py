@@ -0,0 +1,73 @@
+import random
+import sqlite3
+import unittest
+from backend_example.database import StoryDatabase
+from backend_example.migrations import MIGRATIONS, migrate
+
+class TestStoryStats(unittest.TestCase):
+    def setUp(self):
+        self.db = StoryDatabase(':memory:')
+
+    def tearDown(self):
+        self.db.close()
+
+    def scan(self):
+        # What the aggregates replace: a full scan of story_data
+        totals = {}
+        for story in self.db.fetch_all_stories():
+            key = (story['genre'], story['age'])
+            stories, words = totals.get(key, (0, 0))
+            totals[key] = (stories + 1, words + story['word_count'])
+        return totals
+
+    def test_kept_up_to_date_on_save_and_delete(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            if rng.random() < 0.7 or not self.db.fetch_all_stories():
+                self.db.save_story(rng.choice(["Fantasy", "Mystery"]), rng.randint(5, 7), 2,
+                                   rng.choice([2, 3, "Short"]), " ".join(["word"] * rng.randint(1, 50)))
+            else:
+                self.db.delete_story(rng.choice(self.db.fetch_all_stories())['story_id'])
+        stats = self.db.story_stats(group_by=('genre', 'age'))
+        self.assertEqual({(s['genre'], s['age']): (s['stories'], s['words']) for s in stats}, self.scan())
+        self.assertEqual(self.db.rebuild_stats(), 0)
+
+    def test_filters_and_averages(self):
+        self.db.save_story("Fantasy", 7, 2, 3, "one two")
+        self.db.save_story("Fantasy", 7, 2, 5, "three")
+        self.db.save_story("Fantasy", 8, 2, "Short", "four five six")
+        self.db.save_story("Mystery", 7, 2, 2, "seven")
+        self.assertEqual(self.db.story_stats(group_by=(), genre="Fantasy"),
+                         [{'stories': 3, 'words': 6, 'avg_segments': 4.0}])
+        by_age = self.db.story_stats(group_by=('age',), genre="Fantasy")
+        self.assertEqual([(s['age'], s['avg_segments']) for s in by_age], [(7, 4.0), (8, None)])
+        self.assertEqual(self.db.story_stats(since='2000-01-01', until='2000-12-31'), [])
+        self.assertEqual(len(self.db.story_stats()), 3)
+        with self.db.engine.write() as conn:
+            conn.execute("UPDATE story_data SET genre = 'Mystery' WHERE genre = 'Fantasy' AND age = 8")
+        self.assertEqual(self.db.story_stats(group_by=('genre',))[1]['stories'], 2)
+
+    def test_rebuild_repairs_drift(self):
+        self.db.save_story("Fantasy", 7, 2, 3, "one two")
+        with self.db.engine.write() as conn:
+            conn.execute("UPDATE story_stats SET words = 99")
+            conn.execute("INSERT INTO story_stats VALUES ('Ghost', 1, '2000-01-01', 1, 1, 1, 1)")
+        self.assertEqual(self.db.rebuild_stats(), 2)
+        self.assertEqual(self.db.story_stats(group_by=('genre',)), [
+            {'genre': "Fantasy", 'stories': 1, 'words': 2, 'avg_segments': 3.0}])
+
+    def test_migration_counts_existing_stories(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('''CREATE TABLE story_data (story_id INTEGER PRIMARY KEY AUTOINCREMENT, genre VARCHAR(60) NOT NULL,
+        age INTEGER NOT NULL, choice_count INTEGER NOT NULL, segment_count INTEGER NOT NULL, content TEXT NOT NULL)''')
+        migrate(conn, MIGRATIONS[:-1])
+        conn.executemany("INSERT INTO story_data (genre, age, choice_count, segment_count, content) VALUES (?, ?, 2, 3, 'x')",
+                         [("Fantasy", 7), ("Fantasy", 7)])
+        conn.commit()
+        migrate(conn)
+        self.assertEqual(conn.execute("SELECT genre, age, day, stories FROM story_stats").fetchall(),
+                         [("Fantasy", 7, 'unknown', 2)])
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
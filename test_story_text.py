@@ -1,57 +1,86 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from backend_example.story_text import Author
-from backend_example.database import StoryDatabase
+from story_engines import ASSISTANTS, CHAT
+from story_text import Author
 
-class TestAuthor(unittest.TestCase):
-    @patch("story_text.OpenAI")
-    @patch("story_text.StoryDatabase")
-    def setUp(self, MockDatabase, MockOpenAI):
+class AuthorTestCase(unittest.TestCase):
+    engine = CHAT
+
+    def setUp(self):
         # Mock the OpenAI and Database instances to avoid real connections
-        self.mock_db = MockDatabase.return_value
-        self.mock_client = MockOpenAI.return_value
-        self.mock_assistant = MagicMock()
-        self.mock_client.beta.assistants.create.return_value = self.mock_assistant
-        self.mock_thread = MagicMock()
-        self.mock_assistant.threads.create.return_value = self.mock_thread
-        
-        # Initialize the Author instance with mocked dependencies
-        self.author = Author()
+        with patch("story_text.OpenAI") as MockOpenAI, patch("story_text.StoryDatabase") as MockDatabase:
+            self.mock_db = MockDatabase.return_value
+            self.mock_db.fetch_starter_page.return_value = None
+            self.mock_client = MockOpenAI.return_value
+            self.mock_assistant = MagicMock()
+            self.mock_client.beta.assistants.create.return_value = self.mock_assistant
+            self.mock_thread = MagicMock()
+            self.mock_client.beta.threads.create.return_value = self.mock_thread
+
+            # Initialize the Author instance with mocked dependencies
+            self.author = Author(structured=False, engine=self.engine)
+
+    def mock_reply(self, text):
+        raise NotImplementedError
 
     def test_initialization(self):
         # Verify that OpenAI client and Database were initialized
-        self.assertIsNotNone(self.author.client, "OpenAI client should be initialized")
-        self.assertIsNotNone(self.author.db, "Database should be initialized")
+        self.assertIs(self.author.client, self.mock_client, "OpenAI client should be initialized")
+        self.assertIs(self.author.db, self.mock_db, "Database should be initialized")
+        self.assertEqual(self.author.engine.name, self.engine)
 
-    @patch("story_text.sleep", return_value=None)  # Mock sleep to speed up test
-    def test_execute(self, mock_sleep):
-        # Mock the create_message method and the response from API
-        message_mock = MagicMock()
-        self.mock_thread.messages.create.return_value = message_mock
-        run_mock = MagicMock()
-        run_mock.status = "completed"
-        self.mock_thread.runs.create.return_value = run_mock
-        self.mock_thread.runs.retrieve.return_value = run_mock
-        message_list_mock = MagicMock()
-        message_list_mock.content[0].text.value = "Mocked story content"
-        self.mock_thread.messages.list.return_value = [message_list_mock]
-
-        # Run execute and verify the output
+    def test_execute(self):
+        self.mock_reply("Mocked story content")
         response = self.author.execute("Sample input")
         self.assertEqual(response, "Mocked story content", "The response should match the mocked story content")
 
     def test_first_page(self):
-        # Mock execute to return a sample response
-        with patch.object(self.author, 'execute', return_value="Mocked story page content"):
-            # Call first_page and verify it attempts to save to the database
-            response = self.author.first_page("Fantasy", 10, 3, 5)
-            self.assertEqual(response, "Mocked story page content", "The response should match the mocked content")
-            self.mock_db.save_story.assert_called_once_with("Fantasy", 10, 3, 5, "Mocked story page content")
+        self.mock_reply("Title: The Mock\nMocked story page content")
+        response = self.author.first_page("Fantasy", 10, 3, 5)
+        self.assertIn("Mocked story page content", response)
+        self.mock_db.save_story.assert_called_once_with("Fantasy", 10, 3, 5, response, title="The Mock")
+
+    def test_first_page_error_is_not_saved(self):
+        self.mock_reply(None)
+        self.mock_db.list_stories.return_value = []
+        response = self.author.first_page("Fantasy", 10, 3, 5)
+        self.assertEqual(response, "Error generating story content. Please try again.")
+        self.mock_db.save_story.assert_not_called()
 
     def test_db_close(self):
         # Test that db_close calls the close method on the database
         self.author.db_close()
         self.mock_db.close.assert_called_once()
 
+class TestChatAuthor(AuthorTestCase):
+    engine = CHAT
+
+    def mock_reply(self, text):
+        response = MagicMock()
+        response.choices[0].message.content = text
+        response.usage.total_tokens = 10
+        self.mock_client.chat.completions.create.return_value = response
+
+class TestAssistantsAuthor(AuthorTestCase):
+    engine = ASSISTANTS
+
+    def setUp(self):
+        super().setUp()
+        # Mock sleep to speed up polling
+        sleep_patch = patch("story_engines.sleep", return_value=None)
+        sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def mock_reply(self, text):
+        run_mock = MagicMock()
+        run_mock.status = "completed"
+        self.mock_client.beta.threads.runs.create.return_value = run_mock
+        self.mock_client.beta.threads.runs.retrieve.return_value = run_mock
+        message_mock = MagicMock()
+        message_mock.content[0].text.value = text
+        self.mock_client.beta.threads.messages.list.return_value = [message_mock] if text else []
+
+del AuthorTestCase
+
 if __name__ == '__main__':
     unittest.main()
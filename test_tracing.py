@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from storybook.tracing import NOOP, JsonlExporter, Tracer, bind, current_span, span, traced
+
+@traced('db.save')
+def save(content):
+    current_span().set(chars=len(content))
+    return True
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tracer = Tracer()
+
+    def test_untraced_code_gets_noop_spans(self):
+        self.assertIs(self.tracer.start('request'), NOOP)
+        self.assertIs(span('openai.chat'), NOOP)
+        with span('openai.chat') as s:
+            s.set(model='x')
+        self.assertTrue(save("story"))
+        self.assertEqual(self.tracer.buffer.slow(), [])
+
+    def test_nested_spans_and_threads_share_the_trace(self):
+        with self.tracer.start('request', force=True) as root:
+            with span('policy.run', call_type='first_page') as outer:
+                with ThreadPoolExecutor(2) as pool:
+                    pool.submit(bind(save), "abc").result()
+            with span('openai.chat') as s:
+                s.set(model='gpt')
+        trace = self.tracer.buffer.slow()[0]
+        spans = {s['name']: s for s in trace['spans']}
+        self.assertEqual(trace['trace_id'], root.trace.trace_id)
+        self.assertEqual(spans['db.save']['parent_id'], outer.span_id)
+        self.assertEqual(spans['db.save']['attributes'], {'chars': 3})
+        self.assertEqual(spans['openai.chat']['parent_id'], root.span_id)
+        self.assertEqual(spans['openai.chat']['attributes'], {'model': 'gpt'})
+        self.assertIsNone(spans['request']['parent_id'])
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.start('request', force=True):
+                with span('db.save'):
+                    raise ValueError("disk full")
+        trace = self.tracer.buffer.slow()[0]
+        self.assertEqual(trace['error'], "ValueError: disk full")
+        self.assertEqual(trace['spans'][0]['error'], "ValueError: disk full")
+
+    def test_slow_traces_are_sorted_and_filtered(self):
+        for delay in (0.0, 0.03, 0.01):
+            with self.tracer.start(f"request {delay}", force=True):
+                time.sleep(delay)
+        slow = self.tracer.buffer.slow(min_ms=5)
+        self.assertEqual([trace['name'] for trace in slow], ["request 0.03", "request 0.01"])
+        self.assertEqual(len(self.tracer.buffer.slow(limit=1)), 1)
+
+    def test_sample_rate(self):
+        self.tracer.sample_rate = 1.0
+        self.assertIsNot(self.tracer.start('request'), NOOP)
+
+    def test_jsonl_export(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'traces.jsonl')
+            tracer = Tracer(exporters=[JsonlExporter(path)])
+            for _ in range(2):
+                with tracer.start('request', force=True):
+                    save("x")
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertEqual([s['name'] for s in records[0]['spans']], ['db.save', 'request'])
+
+    def test_flask_requests(self):
+        app = Flask(__name__)
+        self.tracer.instrument(app)
+        app.add_url_rule('/save', 'save', lambda: {'saved': save("story")})
+        client = app.test_client()
+
+        self.assertNotIn('X-Trace-Id', client.get('/save').headers)
+        response = client.get('/save', headers={'X-Trace': '1', 'X-Trace-Id': 'abc123'})
+        self.assertEqual(response.headers['X-Trace-Id'], 'abc123')
+        trace = self.tracer.buffer.slow()[0]
+        self.assertEqual(trace['name'], 'GET /save')
+        self.assertEqual(trace['attributes']['status'], 200)
+        self.assertEqual([s['name'] for s in trace['spans']], ['db.save', 'GET /save'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from storybook.warm_pool import PoolSettings, WarmPool
+
+KEY = ('Fantasy', '6', '2', 'Short')
+
+class TestWarmPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'pool.sqlite')
+        self.generated = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.available = True
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.tmpdir.cleanup()
+
+    def generate(self, key):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+            self.generated.append(key)
+            return f"page {len(self.generated)} for {key[0]}", 100
+
+    def make_pool(self, **settings):
+        self.pool = WarmPool(self.db_path, self.generate, settings=PoolSettings(**settings),
+                             workers=4, max_keys=2, available=lambda: self.available)
+        return self.pool
+
+    def wait_for_depth(self, key, depth, timeout=5):
+        deadline = time.time() + timeout
+        while self.pool.depth(key) < depth and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)  # let any extra refill finish, so over-filling would show
+        return self.pool.depth(key)
+
+    def test_miss_then_refill_then_hit(self):
+        pool = self.make_pool(depth=3, concurrency=2)
+        self.assertIsNone(pool.pop(KEY))
+        self.assertEqual(self.wait_for_depth(KEY, 3), 3)
+        self.assertLessEqual(self.max_running, 2)
+
+        self.assertEqual(pool.pop(KEY), "page 1 for Fantasy")
+        self.assertEqual(self.wait_for_depth(KEY, 3), 3)
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+        self.assertEqual(stats['refills'], 4)
+        self.assertEqual(stats['tokens_per_refill'], 100)
+
+    def test_stale_pages_are_discarded(self):
+        pool = self.make_pool(depth=1, max_age=0.05)
+        pool.refill(KEY)
+        self.wait_for_depth(KEY, 1)
+        time.sleep(0.1)
+        self.assertIsNone(pool.pop(KEY))
+        self.assertEqual(pool.stats()['expired'], 1)
+
+    def test_per_key_settings_and_key_limit(self):
+        pool = self.make_pool(depth=1)
+        pool.configure(KEY, depth=2)
+        self.assertEqual(self.wait_for_depth(KEY, 2), 2)
+        pool.refill(('Mystery', '7', '3', 'Long'))
+        self.wait_for_depth(('Mystery', '7', '3', 'Long'), 1)
+        # max_keys is 2, so a third configuration is not kept warm
+        pool.refill(('Sci-Fi', '8', '2', 'Short'))
+        self.assertEqual(self.wait_for_depth(('Sci-Fi', '8', '2', 'Short'), 1, timeout=0.2), 0)
+        self.assertEqual(set(pool.keys()), {KEY, ('Mystery', '7', '3', 'Long')})
+
+    def test_no_refills_while_unavailable(self):
+        pool = self.make_pool(depth=2)
+        self.available = False
+        self.assertIsNone(pool.pop(KEY))
+        time.sleep(0.05)
+        self.assertEqual(self.generated, [])
+
+    def test_pages_survive_a_restart(self):
+        pool = self.make_pool(depth=1)
+        pool.refill(KEY)
+        self.wait_for_depth(KEY, 1)
+        pool.shutdown()
+        restarted = self.make_pool(depth=1)
+        self.assertEqual(restarted.keys(), [KEY])
+        self.assertEqual(restarted.pop(KEY), "page 1 for Fantasy")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import streamlit as st
-import requests
+import os
 import re
 
+from storybook.http_clients import backend_session
+
+BACKEND_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:5000")
+
 def main():
     st.title("Adventure Mode")
     st.subheader("Start a Choose-Your-Own-Adventure Story")
@@ -22,7 +26,7 @@ def main():
 
     # Start story and display initial content with options
     if st.button("Start Story"):
-        response = requests.post("http://127.0.0.1:5000/start_story", json={
+        response = backend_session().post(f"{BACKEND_URL}/start_story", json={
             "genre": genre,
             "age": age,
             "page_count": segment_count,
@@ -34,7 +38,7 @@ def main():
             data = response.json()
             st.session_state["session_id"] = data.get("session_id")
             st.session_state["story"] = data.get("story", "")
-            st.session_state["options"] = list(range(1, choice_count + 1))  # Options 1 to choice_count
+            st.session_state["options"] = choices_from_response(data, choice_count)
             st.write("Story started successfully!")
             st.write(st.session_state["story"])
         else:
@@ -45,19 +49,23 @@ def main():
         st.write(st.session_state["story"])
 
         # Display each option as a button
-        for i, option in enumerate(st.session_state["options"], 1):
-            if st.button(f"Option {i}"):
+        for option in st.session_state["options"]:
+            if st.button(f"Option {option['id']}: {option['text']}" if option["text"] else f"Option {option['id']}",
+                         key=f"option-{option['id']}"):
                 # Send selected option to backend with session_id
-                response = requests.post("http://127.0.0.1:5000/continue_story", json={
-                    "user_input": str(i),
-                    "session_id": st.session_state["session_id"]
+                response = backend_session().post(f"{BACKEND_URL}/continue_story", json={
+                    "user_input": str(option["id"]),
+                    "session_id": st.session_state["session_id"],
+                    "choice_count": choice_count,
+                    "page_count": segment_count,
                 })
 
                 if response.status_code == 200:
                     # Update story and options with new content and choices
-                    next_segment = response.json().get("story", "")
+                    data = response.json()
+                    next_segment = data.get("story", "")
                     st.session_state["story"] = next_segment
-                    st.session_state["options"] = list(range(1, choice_count + 1))  # Reset options
+                    st.session_state["options"] = choices_from_response(data, choice_count)
                     st.write("Story continued successfully!")
                     st.write(next_segment)
                 else:
@@ -66,13 +74,25 @@ def main():
 
     # Exit button to end the session
     if st.button("Exit Story"):
-        response = requests.post("http://127.0.0.1:5000/exit_story")
+        response = backend_session().post(f"{BACKEND_URL}/exit_story")
         if response.status_code == 200:
             st.success("Adventure Mode session ended.")
             st.session_state.clear()  # Clear session state on exit
         else:
             st.error("Failed to end the session.")
 
+def choices_from_response(data, choice_count):
+    """
+    Returns the choices the backend parsed for this segment, or numbered placeholders if it sent none.
+    An empty list means the story is over.
+    """
+    if data.get("is_final"):
+        return []
+    choices = data.get("choices") or []
+    if choices:
+        return choices
+    return [{"id": i, "text": ""} for i in range(1, choice_count + 1)]
+
 def extract_options(story_text):
     """Extracts numbered options from the story text."""
     # Regex pattern to find options like "1. Option text"
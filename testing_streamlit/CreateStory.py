@@ -1,6 +1,60 @@
+import time
+
 import streamlit as st
 import requests
 
+from storybook.http_clients import SessionSettings, backend_session
+
+BACKEND_URL = "http://127.0.0.1:5000"
+
+# Illustrations are shown at this width, so only this size is downloaded
+IMAGE_WIDTH = 512
+
+
+def image_src(url, width=IMAGE_WIDTH):
+    """
+    Resolves an illustration stored by the backend (/images/<id>) to a URL for the displayed width;
+    other URLs are returned unchanged.
+    """
+    if url.startswith("/"):
+        return f"{BACKEND_URL}{url}?w={width}"
+    return url
+
+
+def wait_for_job(job_id, progress_bar, poll_seconds=1.0, timeout=None):
+    """
+    Polls a generation job until it finishes, updating the progress bar as it goes.
+
+    Parameters:
+    - job_id (str): The job returned by /create_story.
+    - progress_bar: Streamlit progress bar to update.
+    - poll_seconds (float): Seconds between polls.
+    - timeout (float, optional): Seconds to wait for the job in total. Defaults to
+      SessionSettings.from_env().read_timeout (BACKEND_READ_TIMEOUT).
+
+    Returns:
+    - dict: The finished job, or a failed one with an error when the job cannot be read
+      (e.g. it no longer exists) or does not finish in time.
+    """
+    if timeout is None:
+        timeout = SessionSettings.from_env().read_timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        response = backend_session().get(f"{BACKEND_URL}/jobs/{job_id}")
+        if response.status_code != 200:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = response.text
+            return {"status": "failed", "error": f"{response.status_code} - {error}"}
+        job = response.json()
+        progress_bar.progress(job.get("progress") or 0.0, text=job.get("message") or "Queued")
+        if job.get("status") in ("succeeded", "failed", "cancelled"):
+            return job
+        if time.monotonic() >= deadline:
+            return {"status": "failed", "error": f"The story was not ready after {timeout:g} seconds"}
+        time.sleep(poll_seconds)
+
 
 def main():
     """
@@ -26,27 +80,35 @@ def main():
         
         # API call to backend
         try:
-            st.info("Generating your story. Please wait...")
-            backend_url = "http://127.0.0.1:5000/create_story"  # Backend API endpoint
-            response = requests.post(backend_url, json={"pages": pages, "prompt": prompt})
-            
-            # Process API response
-            if response.status_code == 200:
-                response_data = response.json()
-                story = response_data.get("story", "No story generated.")
-                image_url = response_data.get("image_url", "")
+            response = backend_session().post(f"{BACKEND_URL}/create_story", json={"pages": pages, "prompt": prompt})
+            if response.status_code != 202:
+                st.error(f"Failed to generate story: {response.status_code} - {response.text}")
+                return
+
+            # The backend generates in the background; poll the job for progress and the result
+            job = wait_for_job(response.json()["job_id"], st.progress(0.0, text="Queued"))
+            if job["status"] == "succeeded":
+                story = job["result"].get("story", "No story generated.")
+                image_url = job["result"].get("image_url", "")
+                images = [url for url in job["result"].get("images") or [] if url]
 
                 # Display the generated story
-                st.success("Story generated successfully!")
+                if job["result"].get("degraded"):
+                    st.info("Story generation is unavailable right now, so here is a saved story close to your idea.")
+                else:
+                    st.success("Story generated successfully!")
                 st.write(story)
 
-                # Display the generated image if available
-                if image_url:
-                    st.image(image_url, caption="Generated Illustration", use_column_width=True)
+                # Display the page illustrations in order, or the single cover image of older results
+                if images:
+                    for page, url in enumerate(images, start=1):
+                        st.image(image_src(url), caption=f"Page {page}", width=IMAGE_WIDTH)
+                elif image_url:
+                    st.image(image_src(image_url), caption="Generated Illustration", width=IMAGE_WIDTH)
                 else:
                     st.warning("No image was generated for this story.")
             else:
-                st.error(f"Failed to generate story: {response.status_code} - {response.text}")
+                st.error(f"Failed to generate story: {job.get('error') or job['status']}")
 
         except requests.exceptions.ConnectionError:
             st.error("Could not connect to the backend server. Please ensure the Flask backend is running.")
@@ -1,17 +1,41 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from openai import OpenAI, OpenAIError
 from dotenv import load_dotenv
-from database import init_db, save_story, get_all_stories
+from database import (DB_NAME, init_db, save_story, get_all_stories, get_story_images, get_table_version,
+                      find_similar_story, get_repository)
+from pathlib import Path
 import os
 import uuid
 import logging
 
+from storybook.breaker import CircuitBreaker
+from storybook.illustrations import ImageCache, RateLimiter, illustrate, image_prompts, split_pages
+from storybook.http_clients import openai_http_client
+from storybook.images import ImageStore, serve_image
+from storybook.jobs import JobQueue
+from storybook.outline import story_prompt, write_story
+from storybook.policy import (CONTINUATION, FIRST_PAGE, IMAGE, OUTLINE, PAGE, CallPolicy, ExecutionPolicy,
+                              hedge_percentile_from_env, tiers_from_env)
+from storybook.profiling import Profiler
+from storybook.responses import versioned_json
+from storybook.scheduler import BATCH, PREFETCH, FairScheduler, SchedulerFull, request_user
+from storybook.segments import SEGMENT_INSTRUCTIONS, parse_segment, render_segment, response_format
+from storybook.tracing import Tracer, span
+from storybook.warm_pool import PoolSettings, WarmPool
+
 # Set api key
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
+# Requests sending X-Trace: 1, or picked at TRACE_SAMPLE_RATE, are traced; see /slow_traces
+tracer = Tracer.from_env()
+tracer.instrument(app)
+# Off unless PROFILE_DIR is set; then requests sending X-Profile: 1, or picked at PROFILE_SAMPLE_RATE,
+# are profiled into it. See /profiles
+profiler = Profiler.from_env()
+profiler.instrument(app)
 init_db()
 
 # Global dictionary to hold story context per session
@@ -30,35 +54,92 @@ is still interesting to read. Your job is to create stories. Along with the
 story, write an extensive description of each character's detailed description, and any other significant characteristics. Write an extensive description of 
 what settings in the story look like as well.
 """
-        # Set OpenAI API key
-        self.client = OpenAI(api_key=os.getenv("GPT_API_KEY"))
-        self.model = 'gpt-4o-mini-2024-07-18'  
+        # Set OpenAI API key. OPENAI_CASSETTE records or replays every call (see storybook.cassettes).
+        # The execution policy hedges and falls back, so the client itself does not retry
+        self.client = OpenAI(api_key=os.getenv("GPT_API_KEY"), timeout=float(os.getenv("OPENAI_TIMEOUT", "60")),
+                             max_retries=0, http_client=openai_http_client())
+        self.model = os.getenv("STORY_MODEL", 'gpt-4o-mini-2024-07-18')
+        # Per call type: models to fall back through (STORY_MODELS_<TYPE>) and when to hedge (HEDGE_<TYPE>).
+        # Images are expensive, so they are only hedged past the 99th percentile. The breaker
+        # fails calls fast while the API is down.
+        self.policy = ExecutionPolicy({
+            FIRST_PAGE: CallPolicy(tiers_from_env(FIRST_PAGE, self.model, self.client, self.client_for),
+                                   hedge_percentile=hedge_percentile_from_env(FIRST_PAGE, 0.95)),
+            CONTINUATION: CallPolicy(tiers_from_env(CONTINUATION, self.model, self.client, self.client_for),
+                                     hedge_percentile=hedge_percentile_from_env(CONTINUATION, 0.95)),
+            OUTLINE: CallPolicy(tiers_from_env(OUTLINE, self.model, self.client, self.client_for),
+                                hedge_percentile=hedge_percentile_from_env(OUTLINE, 0.95)),
+            PAGE: CallPolicy(tiers_from_env(PAGE, self.model, self.client, self.client_for),
+                             hedge_percentile=hedge_percentile_from_env(PAGE, 0.95)),
+            IMAGE: CallPolicy(tiers_from_env(IMAGE, 'dall-e-2', self.client, self.client_for),
+                              hedge_percentile=hedge_percentile_from_env(IMAGE, 0.99)),
+        }, breaker=CircuitBreaker.from_env())
+        # Adventure segments come back as schema-validated JSON unless STRUCTURED_SEGMENTS=0
+        self.structured = os.getenv("STRUCTURED_SEGMENTS", "1") != "0"
+        # Multi-page stories are outlined, then written a page per call, PAGE_CONCURRENCY pages at a time,
+        # unless PARALLEL_PAGES=0. CONSISTENCY_PASS=1 adds a final revision call.
+        self.parallel_pages = os.getenv("PARALLEL_PAGES", "1") != "0"
+        self.page_concurrency = int(os.getenv("PAGE_CONCURRENCY", "5"))
+        self.consistency_pass = os.getenv("CONSISTENCY_PASS", "0") == "1"
+        # One illustration per page, ILLUSTRATION_CONCURRENCY at a time and at most ILLUSTRATION_RATE
+        # a minute (0 is unlimited); identical or near-identical prompts reuse a cached image.
+        self.illustration_concurrency = int(os.getenv("ILLUSTRATION_CONCURRENCY", "3"))
+        self.illustration_limiter = RateLimiter(int(os.getenv("ILLUSTRATION_RATE", "0")))
+        self.image_cache = ImageCache(get_repository())
+        # Generated images are kept as resized WebP/JPEG files under IMAGE_DIR and served from /images
+        self.image_store = ImageStore(os.getenv("IMAGE_DIR", str(Path(__file__).resolve().parent / "images")))
     
-    def execute(self, text_input):
+    def client_for(self, base_url):
+        """
+        Builds a client for a fallback endpoint.
+        """
+        return OpenAI(api_key=os.getenv("FALLBACK_API_KEY") or os.getenv("GPT_API_KEY"), base_url=base_url,
+                      max_retries=0, http_client=openai_http_client())
+
+    def execute(self, text_input, structured=False, call_type=CONTINUATION, json_format=None):
         """
         Executes a prompt using OpenAI's GPT model.
 
         Parameters:
         - text_input (str): The prompt to send.
+        - structured (bool): Request a JSON story segment matching storybook.segments.SEGMENT_SCHEMA.
+        - call_type (str): Selects the hedging and fallback policy (see storybook.policy).
+        - json_format (dict, optional): Any other response_format, e.g. storybook.outline.outline_format().
 
         Returns:
-        - str: The generated response or an error message.
+        - str: The generated response, or None if it failed. Failures are logged rather than
+          returned as text so they can never be mistaken for, and saved as, a story.
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an accomplished children's story writer."},
-                    {"role": "user", "content": text_input}
-                ]
-            )
-            return response.choices[0].message.content
+            extra = {}
+            if structured:
+                text_input = f"{text_input}\n\n{SEGMENT_INSTRUCTIONS}"
+                extra['response_format'] = response_format()
+            elif json_format:
+                extra['response_format'] = json_format
+            messages = [
+                {"role": "system", "content": "You are an accomplished children's story writer."},
+                {"role": "user", "content": text_input}
+            ]
+
+            def call(tier):
+                with span('openai.chat.completions', model=tier.model, call_type=call_type,
+                          prompt_chars=len(text_input)) as call_span:
+                    response = tier.client.chat.completions.create(model=tier.model, messages=messages, **extra)
+                    content = response.choices[0].message.content
+                    usage = getattr(response, 'usage', None)
+                    call_span.set(chars=len(content or ''),
+                                  prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                                  completion_tokens=getattr(usage, 'completion_tokens', None))
+                return content
+
+            return self.policy.run(call_type, call)
         except OpenAIError as e:
             logging.error(f"OpenAI API error: {e}")
-            return f"Error: {str(e)}"
+            return None
         except Exception as e:
             logging.error(f"Unexpected error: {e}")
-            return f"Error: {str(e)}"
+            return None
     
     def generate_image(self, description):
         """
@@ -68,45 +149,147 @@ what settings in the story look like as well.
         - description (str): The description for the image.
 
         Returns:
-        - str: The image URL or an error message.
+        - str: The image URL, or None if generation failed.
         """
         try:
-            response = self.client.images.generate(
-                prompt=description,
-                n=1,
-                size="512x512"
-            )
-            return response.data[0].url
+            def call(tier):
+                with span('openai.images.generate', model=tier.model, prompt_chars=len(description)):
+                    response = tier.client.images.generate(
+                        model=tier.model,
+                        prompt=description,
+                        n=1,
+                        size="512x512"
+                    )
+                return response.data[0].url
+
+            return self.policy.run(IMAGE, call)
         except OpenAIError as e:
             logging.error(f"Image generation error: {e}")
-            return f"Error generating image: {str(e)}"
+            return None
         except Exception as e:
             logging.error(f"Unexpected error during image generation: {e}")
-            return f"Error generating image: {str(e)}"
+            return None
+
+    def draw(self, description):
+        """
+        Generates an image and stores it locally (see storybook.images.ImageStore).
 
-    def first_page(self, prompt, pages):
+        Returns:
+        - str: The image's path on this server, e.g. /images/<id>; the generated URL if it could
+          not be stored, or None if generation failed.
+        """
+        image_url = self.generate_image(description)
+        if image_url is None:
+            return None
+        asset_id = self.image_store.fetch(image_url)
+        return f"/images/{asset_id}" if asset_id else image_url
+
+    def first_page(self, prompt, pages, progress=None):
+        """
+        Generates the first page of a story; see write.
+
+        Returns:
+        - str: The generated story content, or None if generation failed.
         """
-        Generates the first page of a story.
+        story, _ = self.write(prompt, pages, progress)
+        return story
+
+    def write(self, prompt, pages, progress=None):
+        """
+        Writes a story.
+
+        Stories longer than a page are outlined and then written a page per call, concurrently
+        (see storybook.outline.write_story), so they take about as long as a single page. A story
+        that cannot be outlined, or whose pages cannot all be written, is written in one call instead.
 
         Parameters:
         - prompt (str): The story idea.
         - pages (int): Number of pages for the story.
+        - progress (callable, optional): Called with (pages done, pages) as pages are written.
 
         Returns:
-        - str: The generated story content.
+        - tuple: (story content or None if generation failed, outline or None if the story was not outlined).
         """
-        command = f"Write a story about {prompt}. Make sure it is exactly {pages} page(s) long, one page is around 300 words and please no page number in the contents"
-        response = self.execute(command)
-        return response
+        pages = int(pages)
+        if self.parallel_pages and pages > 1:
+            story, outline = write_story(
+                prompt, pages,
+                lambda text, call_type, json_format: self.execute(text, call_type=call_type, json_format=json_format),
+                max_workers=self.page_concurrency, consistency=self.consistency_pass, progress=progress)
+            if story:
+                return story, outline
+        command = story_prompt(prompt, pages)
+        response = self.execute(command, call_type=FIRST_PAGE)
+        return response, None
+
+    def write_calls(self, pages):
+        """
+        Model calls write makes for a story of this many pages, before retries and hedges:
+        the outline, a call per page and the consistency pass, or a single call.
+        """
+        pages = int(pages)
+        calls = pages + 1 if self.parallel_pages and pages > 1 else 1
+        return calls + (1 if self.consistency_pass and calls > 1 else 0)
 
-    def start_adventure_story(self, genre, age, choice_count, segment_count):
+    def illustrate(self, prompt, story, pages, outline=None, progress=None):
         """
-        Generates the first segment of an adventure story.
+        Illustrates every page of a story concurrently (see storybook.illustrations.illustrate).
+
+        Parameters:
+        - prompt (str): The story idea.
+        - story (str): The story text.
+        - pages (int): Number of pages.
+        - outline (dict, optional): The story's outline, whose beats make better scene prompts.
+        - progress (callable, optional): Called with (images done, images to generate).
+
+        Returns:
+        - list[dict]: position, prompt, prompt_hash and image_url per page, in page order.
+        """
+        return illustrate(image_prompts(prompt, story, int(pages), outline), self.draw,
+                          cache=self.image_cache, max_workers=self.illustration_concurrency,
+                          limiter=self.illustration_limiter, progress=progress)
+
+    def segment(self, text_input, call_type=CONTINUATION):
+        """
+        Executes a prompt and parses the reply into a story segment.
+
+        Returns:
+        - dict: title, body, choices (list of {id, text}) and is_final, parsed from JSON when
+          structured output is on and from the text heuristics otherwise. None if generation failed.
+        """
+        response = self.execute(text_input, structured=self.structured, call_type=call_type)
+        return parse_segment(response) if response else None
+
+    def retry_after(self):
+        """
+        Returns:
+        - float: Seconds until the circuit breaker lets model calls through again, 0 if it does now.
+        """
+        return self.policy.breaker.retry_after()
+
+    def start_command(self, genre, age, choice_count, segment_count):
         """
-        command = f"""Write the first page of an interactive {genre} story for a {age}-year-old child.
+        Builds the prompt for the first segment of an adventure story.
+        """
+        return f"""Write the first page of an interactive {genre} story for a {age}-year-old child.
                       Provide {choice_count} choices per story segment. Only create one segment at a time 
                       and move to the next only after the reader chooses. Limit the story to {segment_count} segments overall."""
-        return self.execute(command)
+
+    def start_adventure_story(self, genre, age, choice_count, segment_count):
+        """
+        Generates the first segment of an adventure story.
+        """
+        return self.segment(self.start_command(genre, age, choice_count, segment_count), call_type=FIRST_PAGE)
+
+    def write_warm_page(self, key):
+        """
+        Warm pool generator: writes a first segment for a (genre, age, choice_count, segment_count) key.
+
+        Returns:
+        - tuple: (raw reply, tokens spent). Token usage is not tracked here, so it is reported as 0.
+        """
+        page = self.execute(self.start_command(*key), structured=self.structured, call_type=FIRST_PAGE)
+        return page, 0
 
     def continue_adventure_story(self, previous_context, user_input, choice_count, segment_count):
         """
@@ -118,58 +301,216 @@ what settings in the story look like as well.
         command = f"""{previous_context} The user chose option {user_input}. Continue the story from here.
                     The reader asked for the story to be {segment_count} segments and you are currently on 
                     segment {segment}. Provide {choice_count} choices per story segment."""
+        return self.segment(command)
 
 
 agent = Author()
+# Every model call goes through here: per-user queues, adventures ahead of story jobs ahead of prefetching
+scheduler = FairScheduler.from_env()
+
+# First segments kept ready per configuration; refills pause while the model circuit breaker is open
+warm_pool = WarmPool(DB_NAME, lambda key: scheduler.run('warm-pool', lambda: agent.write_warm_page(key), PREFETCH),
+                     settings=PoolSettings.from_env(),
+                     workers=int(os.getenv("WARM_POOL_WORKERS", "2")), available=lambda: not agent.retry_after())
+warm_pool.warm()
+
+
+def generation_failed(message):
+    """
+    Error response for a failed generation: 503 with Retry-After while the circuit breaker
+    is open, since retrying sooner is pointless, 502 otherwise.
+    """
+    retry_after = agent.retry_after()
+    if retry_after:
+        return jsonify({"error": f"{message}: story generation is temporarily unavailable",
+                        "retry_after": round(retry_after)}), 503, {'Retry-After': str(max(1, round(retry_after)))}
+    return jsonify({"error": message}), 502
+
+
+def too_busy(error):
+    """
+    Error response for a client that already has the most generation requests allowed waiting.
+    """
+    return jsonify({"error": str(error)}), 429, {'Retry-After': '5'}
+
+
+def run_create_story(params, job):
+    """
+    Job handler for /create_story: writes the story, illustrates each page and saves both.
+    Progress is reported between the slow steps, which is also where cancellation takes effect.
+
+    If the story cannot be written, the saved story closest to the prompt is returned instead
+    with degraded set, and nothing is saved.
+    """
+    # Jobs run off the request thread, so each is its own trace (sampled at TRACE_SAMPLE_RATE)
+    with tracer.start('job create_story', job_id=job.job_id, pages=params['pages']):
+        prompt = params['prompt']
+        pages = int(params['pages'])
+        # Jobs queued before users were recorded run under a shared name
+        user = params.get('user', 'jobs')
+        # Writing and drawing are queued separately, so other users' work can run in between.
+        # Each step fans out into concurrent model calls, so its cost is the calls it makes,
+        # and long stories do not take more than their share
+        job.progress(0.05, "Writing story")
+        story, outline = scheduler.run(user, lambda: agent.write(
+            prompt, pages, progress=lambda done, total: job.progress(
+                0.05 + 0.55 * done / total, f"Wrote page {done} of {total}")), BATCH, agent.write_calls(pages))
+        if story is None:
+            stored = find_similar_story(prompt)
+            if stored is None:
+                raise RuntimeError("Story generation failed and no saved story matches the prompt")
+            images = get_story_images([stored['id']]).get(stored['id'], [])
+            return {'story': stored['content'], 'image_url': stored['image_url'], 'images': images,
+                    'degraded': True}
+
+        job.progress(0.6, "Drawing illustrations")
+        images = scheduler.run(user, lambda: agent.illustrate(
+            prompt, story, pages, outline, progress=lambda done, total: job.progress(
+                0.6 + 0.35 * done / total, f"Drew illustration {done} of {total}")), BATCH, pages)
+        # The first page's illustration doubles as the cover shown by clients that only know image_url
+        image_url = images[0]['image_url'] if images else None
+
+        job.progress(0.95, "Saving story")
+        save_story(prompt, story, image_url, images, segments=split_pages(story, pages))
+        return {'story': story, 'image_url': image_url, 'images': [image['image_url'] for image in images],
+                'degraded': False}
+
+
+# Generations run here rather than on request threads; JOB_WORKERS caps how many run at once
+jobs = JobQueue(DB_NAME, max_workers=int(os.getenv("JOB_WORKERS", "4")))
+jobs.register('create_story', run_create_story)
+jobs.recover()
 
 # Define the /create_story route
 @app.route('/create_story', methods=['POST'])
 def create_story():
     """
-    Endpoint to create a new story.
+    Endpoint to create a new story. Queues the generation and returns 202 with a job id;
+    poll /jobs/<job_id> for progress and the result, or pass callback_url to be notified.
     """
     try:
-        # Get user input from request
-        print("Request received at backend")
         data = request.json
-        print("Request data:", data)
         prompt = data.get('prompt')
         pages = data.get('pages')
-        print("Prompt:", prompt, "Pages:", pages)
 
         # Validate input
         if not pages or not prompt:
             return jsonify({"error": "Missing 'prompt' or 'pages'"}), 400
+        # Checked before queueing: a bad value would only fail once every page had been paid for
+        if isinstance(pages, bool) or not str(pages).strip().isdigit() or int(pages) < 1:
+            return jsonify({"error": "'pages' must be a positive integer"}), 400
+        pages = int(pages)
 
-        # Generate the first page of the story
-        print("Generating story...")
-        story = agent.first_page(pages, prompt)
-        print("Generated story:", story)
-
-        # Generate an image related to the story
-        image_description = f"A vivid illustration of the story: {prompt}"
-        image_url = agent.generate_image(image_description)
-
-        save_story(prompt, story, image_url)
-        return jsonify({'story': story, 'image_url': image_url})
+        try:
+            job_id = jobs.submit('create_story', {'prompt': prompt, 'pages': pages, 'user': request_user(request)},
+                                 callback_url=data.get('callback_url'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        status_url = f"/jobs/{job_id}"
+        return jsonify({'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
 
     except Exception as e:
         logging.error(f"Error in /create_story: {e}")
         return jsonify({"error": f"Unexpected server error: {str(e)}"}), 500
 
+@app.route('/warm_pool_stats', methods=['GET'])
+def warm_pool_stats():
+    """
+    Warm pool hit rate, refill cost and depth per configuration.
+    """
+    return jsonify(warm_pool.stats())
+
+@app.route('/policy_stats', methods=['GET'])
+def policy_stats():
+    """
+    Hedge rate, fallbacks, latency percentiles and model health per call type.
+    """
+    return jsonify(agent.policy.stats())
+
+@app.route('/scheduler_stats', methods=['GET'])
+def scheduler_stats():
+    """
+    Queued tasks, waiting users and queue wait percentiles per priority class, and tasks running per user.
+    """
+    return jsonify(scheduler.stats())
+
+@app.route('/slow_traces', methods=['GET'])
+def slow_traces():
+    """
+    Recent traced requests and jobs, slowest first; ?min_ms= and ?limit= filter them.
+    """
+    try:
+        min_ms = float(request.args.get('min_ms', 0))
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "min_ms and limit must be numbers"}), 400
+    return jsonify(tracer.buffer.slow(min_ms, limit))
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """
+    Recent request profiles, newest first: name, route, latency_ms, session, format and size.
+    """
+    if not profiler.enabled:
+        return jsonify({"error": "Profiling is off; set PROFILE_DIR to enable it"}), 404
+    return jsonify(profiler.list_dumps())
+
+@app.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """
+    Downloads a request profile (.pstats for python -m pstats, .folded for flame graph tools).
+    """
+    path = profiler.dump_path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Returns a job's status (queued, running, succeeded, failed or cancelled), progress and result.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    Cancels a queued or running job.
+    """
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not jobs.cancel(job_id):
+        return jsonify({"error": "Job already finished"}), 409
+    return jsonify(jobs.get(job_id)), 202
+
+@app.route('/images/<asset_id>', methods=['GET'])
+def get_image(asset_id):
+    """
+    Serves a stored illustration; ?w= picks the width, Accept the format (WebP or JPEG).
+    """
+    return serve_image(agent.image_store, asset_id)
+
 @app.route('/get_stories', methods=['GET'])
 def get_stories():
-    stories = get_all_stories()
-    stories_list = [
-        {
-        'id': story['id'], 
-        'title': story['title'], 
-        'content': story['content'],
-        'image_url': story['image_url']
-        } 
-        for story in stories
-    ]
-    return jsonify(stories_list)
+    def build():
+        stories = get_all_stories()
+        images = get_story_images()
+        return [
+            {
+            'id': story['id'], 
+            'title': story['title'], 
+            'content': story['content'],
+            'image_url': story['image_url'],
+            'images': images.get(story['id'], [])
+            } 
+            for story in stories
+        ]
+    # Compressed, with ETag/Last-Modified from the table version so unchanged lists return 304
+    version, updated_at = get_table_version()
+    return versioned_json(build, version, updated_at)
 
 # Define the /start_story route for Adventure Mode
 @app.route('/start_story', methods=['POST'])
@@ -183,14 +524,23 @@ def start_story():
     if not (genre and age and page_count and choice_count):
         return jsonify({"error": "Missing required adventure story parameters"}), 400
 
-    # Generate the first page of the adventure story
-    story = agent.start_adventure_story(genre, age, choice_count, page_count)
+    # Serve a ready first page when there is one, otherwise generate it
+    page = warm_pool.pop((str(genre), str(age), str(choice_count), str(page_count)))
+    try:
+        segment = parse_segment(page) if page else scheduler.run(
+            request_user(request), lambda: agent.start_adventure_story(genre, age, choice_count, page_count))
+    except SchedulerFull as e:
+        return too_busy(e)
+    if segment is None:
+        return generation_failed("Failed to start the story")
+    story = segment['body']
 
     # Create a unique session ID and store the story context
     session_id = str(uuid.uuid4())
-    story_contexts[session_id] = story  # Store initial story in context
+    story_contexts[session_id] = render_segment(segment)  # Store initial story and its choices in context
 
-    return jsonify({'session_id': session_id, 'story': story})
+    return jsonify({'session_id': session_id, 'story': story, 'title': segment['title'],
+                    'choices': segment['choices'], 'is_final': segment['is_final']})
 
 # Define the /continue_story route for continuing Adventure Mode
 @app.route('/continue_story', methods=['POST'])
@@ -210,12 +560,20 @@ def continue_story():
         return jsonify({"error": "Invalid session_id"}), 400
 
     # Continue the story based on the user's choice
-    story = agent.continue_adventure_story(previous_context, user_input, choice_count, page_count)
+    try:
+        segment = scheduler.run(request_user(request), lambda: agent.continue_adventure_story(
+            previous_context, user_input, choice_count, page_count))
+    except SchedulerFull as e:
+        return too_busy(e)
+    if segment is None:
+        return generation_failed("Failed to continue the story")
+    story = segment['body']
 
     # Update the story context with the new part of the story
-    story_contexts[session_id] = previous_context + f" User chose option {user_input}. " + story
+    story_contexts[session_id] = previous_context + f" User chose option {user_input}. " + render_segment(segment)
 
-    return jsonify({'story': story})
+    return jsonify({'story': story, 'title': segment['title'],
+                    'choices': segment['choices'], 'is_final': segment['is_final']})
 
 # Define the /exit_story route for Adventure Mode
 @app.route('/exit_story', methods=['POST'])
@@ -4,22 +4,28 @@ from dotenv import load_dotenv
 import os
 import re
 
+from storybook.http_clients import backend_session
+
 # Load environment variables
 load_dotenv()
 
 # Backend API base URL
 API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:5000")
 
+# Illustrations are shown as thumbnails of this width, so only this size is downloaded
+THUMBNAIL_WIDTH = 256
+
 def fetch_stories():
     """
-    Fetches the list of stories from the backend.
+    Fetches the list of stories, with their illustrations, from CreateStoryBackend: the
+    backend that generates them and serves the /images/<id> paths they refer to.
 
     Returns:
     - list[dict]: A list of story dictionaries if successful.
     - None: If an error occurs or the request fails.
     """
     try:
-        response = requests.get(f"{API_BASE_URL}/api/stories")
+        response = backend_session().get(f"{API_BASE_URL}/get_stories")
         if response.status_code == 200:
             return response.json()
         else:
@@ -29,6 +35,22 @@ def fetch_stories():
         st.error(f"Failed to connect to the backend: {e}")
         return None
 
+def image_src(url, width=THUMBNAIL_WIDTH):
+    """
+    Resolves an illustration stored by the backend (/images/<id>) to a URL for the displayed width;
+    other URLs are returned unchanged.
+
+    Parameters:
+    - url (str): The image URL or backend path.
+    - width (int): The width the image is displayed at.
+
+    Returns:
+    - str: The URL to load.
+    """
+    if url.startswith("/"):
+        return f"{API_BASE_URL}{url}?w={width}"
+    return url
+
 def extract_title(content):
     """
     Extracts the title from the content if present, otherwise returns 'Untitled Story'.
@@ -57,12 +79,17 @@ def display_story(story):
     content = story.get("content", "No content available.")
     title = story.get("title", None) or extract_title(content)  # Extract title if not provided
     image_url = story.get("image_url")
+    images = [url for url in story.get("images") or [] if url]
 
     with st.expander(f"📖 {title}"):
-        st.write(f"**Genre:** {story.get('genre', 'Unknown')} | **Age Group:** {story.get('age', 'Unknown')}")
+        if story.get('genre') or story.get('age'):
+            st.write(f"**Genre:** {story.get('genre') or 'Unknown'} | **Age Group:** {story.get('age') or 'Unknown'}")
         st.write(content)
-        if image_url and image_url.startswith("http"):
-            st.image(image_url, caption=f"Illustration for {title}", use_column_width=True)
+        if images:
+            for page, url in enumerate(images, start=1):
+                st.image(image_src(url), caption=f"{title}, page {page}", width=THUMBNAIL_WIDTH)
+        elif image_url and image_url.startswith(("http", "/")):
+            st.image(image_src(image_url), caption=f"Illustration for {title}", width=THUMBNAIL_WIDTH)
         elif image_url:
             st.warning(f"Image generation failed: {image_url}")
         else:
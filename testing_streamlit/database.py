@@ -1,49 +1,58 @@
-import sqlite3
+import os
+import re
 import logging
-from pathlib import Path
+import threading
+
+from storybook.repository import StoryRepository
+from storybook.storage import engine_from_env
+from storybook.tracing import traced
 
 DB_NAME = 'story_db.sqlite'
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def get_db_connection():
+# Opened by init_db (or the first call that needs it) and shared by every request
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
     """
-    Establish a connection to the SQLite database.
-    
+    The story repository, on STORAGE_URL (a SQLAlchemy database URL or SQLite path) when it
+    is set and on the DB_NAME SQLite file otherwise.
+
     Returns:
-    - sqlite3.Connection: A database connection object.
+    - StoryRepository
     """
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        logging.error(f"Database connection error: {e}")
-        raise
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = StoryRepository(engine_from_env(DB_NAME))
+        return _repository
+
 
 def init_db():
     """
-    Initialize the database with required tables.
-    Creates a 'stories' table if it does not already exist.
+    Initialize the database with required tables: 'stories', 'story_segments' with each story's
+    pages, 'story_images' with its illustrations in page order, plus a 'table_versions' row that
+    is bumped on every write (used for ETag/Last-Modified on /get_stories).
+    Reopens the repository, so a changed DB_NAME or STORAGE_URL takes effect.
     """
+    global _repository
+    with _repository_lock:
+        if _repository is not None:
+            _repository.close()
+            _repository = None
     try:
-        with get_db_connection as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS stories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    image_url TEXT
-                )
-            ''')
-            logging.info("Database initialized successfully.")
-    except sqlite3.Error as e:
+        get_repository()
+        logging.info(f"Database initialized successfully ({os.getenv('STORAGE_URL') or DB_NAME}).")
+    except Exception as e:
         logging.error(f"Error initializing database: {e}")
         raise
 
-def save_story(title, content, image_url=None):
+@traced('db.save_story')
+def save_story(title, content, image_url=None, images=None, segments=None):
     """
     Save a generated story to the database.
     
@@ -51,27 +60,36 @@ def save_story(title, content, image_url=None):
     - title (str): Title of the story.
     - content (str): Content of the story.
     - image_url (str, optional): URL of an associated image for the story.
+    - images (list[dict], optional): Illustrations in page order, each with position, prompt,
+      prompt_hash and image_url (see storybook.illustrations.illustrate).
+    - segments (list[str], optional): The story's pages in order.
+    Images and pages are saved in the same transaction as the story, so readers never see
+    a story without them.
     
     Returns:
-    - bool: True if the story was saved successfully, False otherwise.
+    - int: The new story's id if it was saved successfully, None otherwise.
     """
     if not title or not content:
         logging.warning("Title and content are required to save a story.")
-        return False
-    
-    try:
-        with get_db_connection() as conn:
-            conn.execute(
-                "INSERT INTO stories (title, content, image_url) VALUES (?, ?, ?)",
-                (title, content, image_url),
-            )
-            logging.info(f"Story saved successfully: {title}")
-            return True
-    except sqlite3.Error as e:
-        logging.error(f"Error saving story: {e}")
-        return False
+        return None
+
+    story_id = get_repository().save_story(title, content, image_url, images, segments)
+    if story_id is not None:
+        logging.info(f"Story saved successfully: {title}")
+    return story_id
+
+
+def get_table_version():
+    """
+    Retrieve the write counter of the stories table.
+
+    Returns:
+    - tuple: (version, updated_at), or (0, None) if it cannot be read.
+    """
+    return get_repository().table_version()
 
 
+@traced('db.get_all_stories')
 def get_all_stories():
     """
     Retrieve all stories from the database.
@@ -79,10 +97,74 @@ def get_all_stories():
     Returns:
     - list[dict]: A list of stories, each represented as a dictionary.
     """
-    try:
-        with get_db_connection() as conn:
-            stories = conn.execute("SELECT * FROM stories").fetchall()
-            return [dict(story) for story in stories]
-    except sqlite3.Error as e:
-        logging.error(f"Error fetching stories: {e}")
-        return []
+    return get_repository().get_all_stories()
+
+
+@traced('db.get_story_images')
+def get_story_images(story_ids=None):
+    """
+    Retrieve the illustrations of stories, in page order.
+
+    Parameters:
+    - story_ids (list[int], optional): Stories to fetch images for; all stories when not given.
+
+    Returns:
+    - dict: story id -> list of image URLs (None where an illustration failed).
+    """
+    return get_repository().get_story_images(story_ids)
+
+
+@traced('db.get_story_segments')
+def get_story_segments(story_ids=None):
+    """
+    Retrieve the pages of stories, in order.
+
+    Parameters:
+    - story_ids (list[int], optional): Stories to fetch pages for; all stories when not given.
+
+    Returns:
+    - dict: story id -> list of pages. Stories saved without pages are missing.
+    """
+    return get_repository().get_story_segments(story_ids)
+
+
+def _keywords(text):
+    # Words of three letters or more, with plurals folded so "cats" matches "cat"
+    return {word[:-1] if len(word) > 3 and word.endswith('s') else word
+            for word in re.findall(r"[a-z]{3,}", text.lower())}
+
+
+@traced('db.find_similar_story')
+def find_similar_story(prompt, candidates=1000):
+    """
+    Find the saved story whose title (the prompt it was written for) shares the most words
+    with a prompt. Used to serve something relevant when new stories cannot be generated.
+
+    Parameters:
+    - prompt (str): The story idea.
+    - candidates (int): How many of the most recent stories to consider.
+
+    Returns:
+    - dict: The closest story, or None if no title shares a word with the prompt.
+    """
+    words = _keywords(prompt)
+    if not words:
+        return None
+    rows = get_repository().recent_titles(candidates)
+    score, story_id = max(((len(words & _keywords(row['title'])), row['id']) for row in rows), default=(0, None))
+    if not score:
+        return None
+    return get_repository().get_story(story_id)
+
+
+def iter_all_stories(batch_size=500):
+    """
+    Iterate over all stories without loading the whole table into memory.
+
+    Parameters:
+    - batch_size (int): Number of rows pulled from the cursor at a time.
+
+    Yields:
+    - dict: One story at a time, ordered by id.
+    """
+    return get_repository().iter_stories(batch_size)